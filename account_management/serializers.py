@@ -1,5 +1,6 @@
 from rest_framework_tracking.models import APIRequestLog
 
+from restaurant.libs.review_rating import rating_summary
 from restaurant.models import Restaurant, Subscription, PaymentType, CashLog
 
 from django.http import request
@@ -171,14 +172,8 @@ class RestaurantSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_review(self, obj):
-        review_qs = None
-        if obj.food_orders:
-
-            reviews_list = list(
-                filter(None, obj.food_orders.values_list('reviews__rating', flat=True)))
-            if reviews_list:
-                return {'value': sum(reviews_list) / reviews_list.__len__(), 'total_reviewers': reviews_list.__len__()}
-        return {'value': None, 'total_reviewers': 0}
+        # aggregates maintained by restaurant.libs.review_rating
+        return rating_summary(obj.rating_sum, obj.rating_count)
     def get_cash_log(self,obj):
         cash_log_qs = CashLog.objects.filter(restaurant_id = obj.id).last()
         if cash_log_qs:
@@ -26,6 +26,8 @@ env.read_env(env_file=os.path.join(BASE_DIR, '.env'))
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = env.str('SECRET_KEY')
 TURN_OFF_SIGNAL = env.bool('TURN_OFF_SIGNAL', False)
+# seconds order_done_signal events of a restaurant are collected into one board broadcast, 0 disables
+BOARD_EVENT_WINDOW = env.float('BOARD_EVENT_WINDOW', 0.15)
 SSL_SMS_API_TOKEN = env.str('SSL_SMS_API_TOKEN')
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -313,6 +315,14 @@ Q_CLUSTER = {
     }
 }
 
+# board versions, locks and replay buffers shared by the web and worker processes,
+# kept in redis for its atomic INCR / SET NX, the file based cache has none
+STATE_REDIS = {
+    'host': env.str('STATE_REDIS_HOST', '127.0.0.1'),
+    'port': env.int('STATE_REDIS_PORT', 6379),
+    'db': env.int('STATE_REDIS_DB', 0),
+}
+
 CHANNEL_LAYERS = {
     # "default": {
     #     "BACKEND": "channels.layers.InMemoryChannelLayer"
@@ -321,6 +331,8 @@ CHANNEL_LAYERS = {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
             "hosts": [('127.0.0.1', 6379)],
+            # consumers renew their groups every restaurant.libs.presence.PRESENCE_REFRESH_INTERVAL
+            "group_expiry": 300,
         },
     },
 }
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class RestaurantConfig(AppConfig):
@@ -9,6 +10,99 @@ class RestaurantConfig(AppConfig):
         registry.register(self.get_model('FoodOrder'),
                           self.get_model('Table'),
                           self.get_model('Restaurant'))
+
+        from .libs.discount_index import invalidate_discount_index_on_change
+        post_save.connect(invalidate_discount_index_on_change, sender=self.get_model('Discount'),
+                          dispatch_uid='discount_index_post_save')
+        post_delete.connect(invalidate_discount_index_on_change, sender=self.get_model('Discount'),
+                            dispatch_uid='discount_index_post_delete')
+
+        from .libs.price_list import (invalidate_price_list_on_food_change,
+                                      invalidate_price_list_on_food_option_change,
+                                      invalidate_price_list_on_option_type_change)
+        for model_name in ['Food', 'Discount']:
+            post_save.connect(invalidate_price_list_on_food_change, sender=self.get_model(model_name),
+                              dispatch_uid='price_list_post_save_%s' % model_name)
+            post_delete.connect(invalidate_price_list_on_food_change, sender=self.get_model(model_name),
+                                dispatch_uid='price_list_post_delete_%s' % model_name)
+        post_save.connect(invalidate_price_list_on_food_option_change, sender=self.get_model('FoodOption'),
+                          dispatch_uid='price_list_post_save_food_option')
+        post_delete.connect(invalidate_price_list_on_food_option_change, sender=self.get_model('FoodOption'),
+                            dispatch_uid='price_list_post_delete_food_option')
+        post_save.connect(invalidate_price_list_on_option_type_change, sender=self.get_model('FoodOptionType'),
+                          dispatch_uid='price_list_post_save_option_type')
+
+        from .libs.board_state import (invalidate_board_state_on_change,
+                                       invalidate_board_state_on_food_option_change,
+                                       invalidate_board_state_on_restaurant_change,
+                                       invalidate_board_state_on_table_save,
+                                       mark_board_dirty_on_order_change,
+                                       mark_board_dirty_on_ordered_item_change)
+        post_save.connect(invalidate_board_state_on_restaurant_change, sender=self.get_model('Restaurant'),
+                          dispatch_uid='board_state_post_save_restaurant')
+        for model_name in ['Food', 'Discount']:
+            post_save.connect(invalidate_board_state_on_change, sender=self.get_model(model_name),
+                              dispatch_uid='board_state_post_save_%s' % model_name)
+            post_delete.connect(invalidate_board_state_on_change, sender=self.get_model(model_name),
+                                dispatch_uid='board_state_post_delete_%s' % model_name)
+        post_save.connect(invalidate_board_state_on_food_option_change, sender=self.get_model('FoodOption'),
+                          dispatch_uid='board_state_post_save_food_option')
+        post_save.connect(invalidate_board_state_on_table_save, sender=self.get_model('Table'),
+                          dispatch_uid='board_state_post_save_table')
+        post_delete.connect(invalidate_board_state_on_change, sender=self.get_model('Table'),
+                            dispatch_uid='board_state_post_delete_table')
+        # order writes which never reach order_done_signal send the board reads to the database
+        for model_name, receiver in [('FoodOrder', mark_board_dirty_on_order_change),
+                                     ('OrderedItem', mark_board_dirty_on_ordered_item_change)]:
+            post_save.connect(receiver, sender=self.get_model(model_name),
+                              dispatch_uid='board_dirty_post_save_%s' % model_name)
+            post_delete.connect(receiver, sender=self.get_model(model_name),
+                                dispatch_uid='board_dirty_post_delete_%s' % model_name)
+
+        from .libs.option_summary import (refresh_option_summary_on_food_option_change,
+                                          refresh_option_summary_on_food_save,
+                                          remember_food_option_food)
+        post_save.connect(refresh_option_summary_on_food_save, sender=self.get_model('Food'),
+                          dispatch_uid='option_summary_post_save_food')
+        # connected before the menu version receivers, so a rebuilt menu reads the new summary
+        pre_save.connect(remember_food_option_food, sender=self.get_model('FoodOption'),
+                         dispatch_uid='option_summary_pre_save_food_option')
+        post_save.connect(refresh_option_summary_on_food_option_change, sender=self.get_model('FoodOption'),
+                          dispatch_uid='option_summary_post_save_food_option')
+        post_delete.connect(refresh_option_summary_on_food_option_change, sender=self.get_model('FoodOption'),
+                            dispatch_uid='option_summary_post_delete_food_option')
+
+        from .libs.review_rating import (add_review_rating, remember_deleted_order_rating,
+                                         remember_review_rating, remove_deleted_order_rating,
+                                         remove_review_rating)
+        pre_save.connect(remember_review_rating, sender=self.get_model('Review'),
+                         dispatch_uid='review_rating_pre_save')
+        post_save.connect(add_review_rating, sender=self.get_model('Review'),
+                          dispatch_uid='review_rating_post_save')
+        post_delete.connect(remove_review_rating, sender=self.get_model('Review'),
+                            dispatch_uid='review_rating_post_delete')
+        pre_save.connect(remember_deleted_order_rating, sender=self.get_model('FoodOrder'),
+                         dispatch_uid='review_rating_pre_save_food_order')
+        post_save.connect(remove_deleted_order_rating, sender=self.get_model('FoodOrder'),
+                          dispatch_uid='review_rating_post_save_food_order')
+
+        from .libs.menu_snapshot import (next_menu_version_on_category_change, next_menu_version_on_change,
+                                         next_menu_version_on_extra_type_change,
+                                         next_menu_version_on_food_item_change,
+                                         next_menu_version_on_option_type_change)
+        for model_name, receiver in [('Food', next_menu_version_on_change),
+                                     ('Discount', next_menu_version_on_change),
+                                     ('FoodOption', next_menu_version_on_food_item_change),
+                                     ('FoodExtra', next_menu_version_on_food_item_change),
+                                     ('FoodCategory', next_menu_version_on_category_change)]:
+            post_save.connect(receiver, sender=self.get_model(model_name),
+                              dispatch_uid='menu_version_post_save_%s' % model_name)
+            post_delete.connect(receiver, sender=self.get_model(model_name),
+                                dispatch_uid='menu_version_post_delete_%s' % model_name)
+        post_save.connect(next_menu_version_on_option_type_change, sender=self.get_model('FoodOptionType'),
+                          dispatch_uid='menu_version_post_save_option_type')
+        post_save.connect(next_menu_version_on_extra_type_change, sender=self.get_model('FoodExtraType'),
+                          dispatch_uid='menu_version_post_save_extra_type')
         # registry.register(self.get_model(''))
 
 # a = action.send(FoodOrder.objects.first(), verb='staff', action_object=order_qs.first(),request_body={'msg':'success'})
\ No newline at end of file
@@ -1,14 +1,128 @@
 from account_management.models import HotelStaffInformation
+import asyncio
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from .models import Table, FoodOrder
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .serializers import FoodOrderByTableSerializer, TableStaffSerializer
+from .serializers import TableStaffSerializer
+from .libs.board_state import board_records, customer_order_records, get_board_state
 from channels.db import database_sync_to_async
+from knox.auth import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from utils.fast_json import dumps
+from .libs.presence import PRESENCE_REFRESH_INTERVAL, register_presence, unregister_presence
+from .libs.replay import get_stream_seq, missed_frames, publish_frame
+from .libs.wire_format import DEFAULT_WIRE_ENCODING, encode_frame, hello_frame, parse_wire_encoding
 
 
-class DashboardConsumer(AsyncWebsocketConsumer):
+class GroupPresenceMixin:
+    """
+    joins self.group_name and keeps the connection in the presence registry,
+    so publishers can skip groups nobody listens to
+    """
+
+    async def join_group(self):
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+        await sync_to_async(register_presence)(self.group_name, self.channel_name)
+        self.presence_task = asyncio.ensure_future(self.keep_presence())
+
+    async def keep_presence(self):
+        while True:
+            await asyncio.sleep(PRESENCE_REFRESH_INTERVAL)
+            # group_add also renews the channel layer group expiry
+            await self.channel_layer.group_add(
+                self.group_name,
+                self.channel_name
+            )
+            await sync_to_async(register_presence)(self.group_name, self.channel_name)
+
+    async def leave_group(self):
+        presence_task = getattr(self, 'presence_task', None)
+        if presence_task:
+            presence_task.cancel()
+        if not hasattr(self, 'group_name'):
+            return
+        await self.channel_layer.group_discard(
+            self.group_name,
+            self.channel_name
+        )
+        await sync_to_async(unregister_presence)(self.group_name, self.channel_name)
+
+
+def parse_seq(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def message_last_seq(text_data):
+    try:
+        message = json.loads(text_data)
+    except ValueError:
+        return None
+    if isinstance(message, dict):
+        return parse_seq(message.get('last_seq'))
+    return None
+
+
+class WireFormatMixin:
+    """
+    clients pick the frame encoding with ?encoding=<json|json-deflate|msgpack|msgpack-deflate>,
+    compact encodings get a plain JSON hello frame first, with the field dictionary for
+    msgpack, and binary frames after, JSON text frames stay the default. -deflate frames
+    are zlib compressed by the server, independent of the permessage-deflate extension
+    """
+
+    def connect_encoding(self):
+        query_dict = parse_qs(self.scope.get(
+            'query_string', b'').decode('utf-8'))
+        self.encoding = parse_wire_encoding(
+            (query_dict.get('encoding') or [None])[0])
+        return self.encoding
+
+    async def send_hello(self):
+        if self.encoding != DEFAULT_WIRE_ENCODING:
+            await self.send(text_data=hello_frame(self.encoding))
+
+    async def send_frame(self, text):
+        encoding = getattr(self, 'encoding', DEFAULT_WIRE_ENCODING)
+        if encoding == DEFAULT_WIRE_ENCODING:
+            await self.send(text_data=text)
+            return
+        await self.send(bytes_data=encode_frame(text, encoding))
+
+
+class StreamReplayMixin:
+    """
+    clients resume with ?last_seq=<seq> on connect or {"last_seq": <seq>} as a message,
+    the frames missed since are replayed and larger gaps get send_current()
+    """
+
+    def connect_last_seq(self):
+        query_dict = parse_qs(self.scope.get(
+            'query_string', b'').decode('utf-8'))
+        return parse_seq((query_dict.get('last_seq') or [None])[0])
+
+    async def current_seq(self):
+        return await sync_to_async(get_stream_seq)(self.group_name)
+
+    async def resume(self, last_seq):
+        if last_seq is not None:
+            frame_list = await sync_to_async(missed_frames)(self.group_name, last_seq)
+            if frame_list is not None:
+                for text in frame_list:
+                    await self.send_frame(text)
+                return
+        await self.send_current()
+
+
+class DashboardConsumer(GroupPresenceMixin, StreamReplayMixin, WireFormatMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # print('-----------------connect----------------')
         self.restaurant_id = int(self.scope.get(
@@ -21,11 +135,11 @@ class DashboardConsumer(AsyncWebsocketConsumer):
         #     self.channel_name
         # )
 
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
+        self.connect_encoding()
+        await self.join_group()
         await self.accept()
+        await self.send_hello()
+        await self.resume(self.connect_last_seq())
 
     async def disconnect(self, close_code):
         # async_to_sync(self.channel_layer.group_discard)(
@@ -33,13 +147,24 @@ class DashboardConsumer(AsyncWebsocketConsumer):
         #     self.channel_name
         # )
 
-        await self.channel_layer.group_discart(
-            self.group_name,
-            self.channel_name
-        )
+        await self.leave_group()
+
+    async def send_current(self):
+        seq = await self.current_seq()
+        board_state = await self.board_state(restaurant_id=self.restaurant_id)
+        await self.send_frame(dumps({
+            'type': 'snapshot',
+            'seq': seq,
+            'version': board_state['version'],
+            'data': board_records(board_state)
+        }))
 
     async def receive(self, text_data):
         """
+        {"last_seq": <seq>} replays the missed frames, any other message asks for a resync,
+        both answered to this socket only, the group receives deltas from
+        restaurant.tasks.broadcast_board_change
+
         # text_data_json = json.loads(text_data)
         # message = text_data_json['message']
 
@@ -58,40 +183,11 @@ class DashboardConsumer(AsyncWebsocketConsumer):
         #     }
         # )
         """
-        if text_data:
-            data = await self.order_item_list(restaurant_id=int(text_data))
-        else:
-            data = {'error': ['restaurant id invalid']}
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                'type': 'response_to_listener',
-                'data': data
-            }
-        )
+        await self.resume(message_last_seq(text_data))
 
     @database_sync_to_async
-    def order_item_list(self, restaurant_id=1):
-
-        qs = FoodOrder.objects.filter(table__restaurant=restaurant_id).exclude(
-            status__in=['5_PAID', '6_CANCELLED']).order_by('table_id')
-        ordered_table_set = set(qs.values_list('table_id', flat=True))
-        table_qs = Table.objects.filter(
-            restaurant=restaurant_id).exclude(pk__in=ordered_table_set).order_by('id')
-        empty_table_data = []
-        for empty_table in table_qs:
-            empty_table_data.append(
-                {
-                    'table': empty_table.pk,
-                    'table_no': empty_table.table_no,
-                    'table_name': empty_table.name,
-                    'status': '',
-                    'price': {},
-                    'ordered_items': []
-                }
-            )
-        serializer = FoodOrderByTableSerializer(instance=qs, many=True)
-        return serializer.data+empty_table_data
+    def board_state(self, restaurant_id=1):
+        return get_board_state(restaurant_id)
 
     # async def chat_message(self, event):
     #     message = event['message']
@@ -102,17 +198,21 @@ class DashboardConsumer(AsyncWebsocketConsumer):
     #     }))
 
     async def response_to_listener(self, event):
-        data = event['data']
         # print('---------------response to listener--------------')
 
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'data': data
+        # Send message to WebSocket, already encoded by the publisher
+        if 'text' in event:
+            await self.send_frame(event['text'])
+            return
+        await self.send_frame(json.dumps({
+            'type': event.get('message_type', 'snapshot'),
+            'version': event.get('version'),
+            'data': event['data']
             # 'test': 'test success',
         }))
 
 
-class AppsConsumer(AsyncWebsocketConsumer):
+class AppsConsumer(GroupPresenceMixin, StreamReplayMixin, WireFormatMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # print('-----------------connect----------------')
         self.waiter_id = int(self.scope.get(
@@ -128,11 +228,18 @@ class AppsConsumer(AsyncWebsocketConsumer):
         #     self.channel_name
         # )
 
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
+        self.connect_encoding()
+        await self.join_group()
         await self.accept()
+        await self.send_hello()
+        last_seq = self.connect_last_seq()
+        if last_seq is not None:
+            await self.resume(last_seq)
+
+    async def send_current(self):
+        seq = await self.current_seq()
+        data = await self.order_item_list(waiter_id=self.waiter_id)
+        await self.send_frame(dumps({'seq': seq, 'data': data}))
 
     @database_sync_to_async
     def set_table_ids(self):
@@ -150,10 +257,7 @@ class AppsConsumer(AsyncWebsocketConsumer):
         #     self.channel_name
         # )
 
-        await self.channel_layer.group_discart(
-            self.group_name,
-            self.channel_name
-        )
+        await self.leave_group()
 
     async def receive(self, text_data):
         """
@@ -175,6 +279,10 @@ class AppsConsumer(AsyncWebsocketConsumer):
         #     }
         # )
         """
+        last_seq = message_last_seq(text_data)
+        if last_seq is not None:
+            await self.resume(last_seq)
+            return
         if text_data:
             data = await self.order_item_list(waiter_id=int(text_data))
         else:
@@ -183,7 +291,7 @@ class AppsConsumer(AsyncWebsocketConsumer):
             self.group_name,
             {
                 'type': 'response_to_listener',
-                'data': data
+                'text': await sync_to_async(publish_frame)(self.group_name, {'data': data})
             }
         )
 
@@ -225,11 +333,90 @@ class AppsConsumer(AsyncWebsocketConsumer):
     #     }))
 
     async def response_to_listener(self, event):
-        data = event['data']
         # print('---------------response to listener--------------')
 
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'data': data
+        # Send message to WebSocket, already encoded by the publisher
+        if 'text' in event:
+            await self.send_frame(event['text'])
+            return
+        await self.send_frame(json.dumps({
+            'data': event['data']
             # 'test': 'test success',
         }))
+
+
+class CustomerOrderConsumer(GroupPresenceMixin, StreamReplayMixin, WireFormatMixin, AsyncWebsocketConsumer):
+    """
+    live status, items and price of one order for the customer app,
+    published to order_<id> by restaurant.tasks.broadcast_board_change,
+    open to the customer of the order and the staff of its restaurant, signed in
+    with the session or the knox token of the REST api as ?token=<token>
+    """
+
+    async def connect(self):
+        self.order_id = int(self.scope.get(
+            'url_route', {}).get('kwargs', {}).get('order_id'))
+        if not await self.can_follow_order(self.order_id):
+            # closed before the handshake, the client gets a 403
+            await self.close()
+            return
+        self.group_name = 'order_%s' % self.order_id
+
+        self.connect_encoding()
+        await self.join_group()
+        await self.accept()
+        await self.send_hello()
+        await self.resume(self.connect_last_seq())
+
+    async def disconnect(self, close_code):
+        await self.leave_group()
+
+    def connect_user(self):
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            return user
+        query_dict = parse_qs(self.scope.get(
+            'query_string', b'').decode('utf-8'))
+        token = (query_dict.get('token') or [None])[0]
+        if not token:
+            return None
+        try:
+            user, auth_token = TokenAuthentication().authenticate_credentials(token.encode('utf-8'))
+        except AuthenticationFailed:
+            return None
+        return user
+
+    @database_sync_to_async
+    def can_follow_order(self, order_id):
+        user = self.connect_user()
+        if user is None:
+            return False
+        if user.is_superuser:
+            return True
+        food_order_qs = FoodOrder.objects.filter(pk=order_id).values(
+            'customer__user_id', 'restaurant_id').first()
+        if not food_order_qs:
+            return False
+        if food_order_qs['customer__user_id'] == user.pk:
+            return True
+        return HotelStaffInformation.objects.filter(
+            user=user, restaurant_id=food_order_qs['restaurant_id']).exists()
+
+    async def send_current(self):
+        seq = await self.current_seq()
+        order_record = await self.order_record(order_id=self.order_id)
+        if order_record is None:
+            await self.send_frame(dumps({'error': ['invalid order']}))
+            return
+        await self.send_frame(dumps({'type': 'order', 'seq': seq, 'data': order_record}))
+
+    async def receive(self, text_data):
+        # {"last_seq": <seq>} replays the missed frames, any other message asks for the current order
+        await self.resume(message_last_seq(text_data))
+
+    @database_sync_to_async
+    def order_record(self, order_id):
+        return customer_order_records([order_id]).get(order_id)
+
+    async def response_to_listener(self, event):
+        await self.send_frame(event['text'])
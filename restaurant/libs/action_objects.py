@@ -0,0 +1,43 @@
+from django.contrib.contenttypes.models import ContentType
+
+# generic foreign keys of actstream Action resolved by resolve_action_objects
+ACTION_OBJECT_FIELD_LIST = ['actor', 'action_object']
+
+
+def resolve_action_objects(action_list, select_related_dict=None):
+    """
+    load the actor and action_object of every action with one query per content type
+    instead of one per row, select_related_dict {model: [fields]} joins relations along,
+    e.g. {FoodOrder: ['table']}, missing objects resolve to None like the row access does
+    """
+    if not action_list:
+        return action_list
+    select_related_dict = select_related_dict or {}
+    for field_name in ACTION_OBJECT_FIELD_LIST:
+        field = action_list[0]._meta.get_field(field_name)
+        object_id_dict = {}
+        for action in action_list:
+            content_type_id = getattr(action, field.ct_field + '_id')
+            object_id = getattr(action, field.fk_field)
+            if content_type_id and object_id is not None:
+                object_id_dict.setdefault(content_type_id, set()).add(object_id)
+
+        object_dict = {}
+        for content_type_id, object_id_set in object_id_dict.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            if model is None:
+                continue
+            # the base manager, as the row access, soft deleted objects included
+            qs = model._base_manager.filter(pk__in=list(object_id_set))
+            if select_related_dict.get(model):
+                qs = qs.select_related(*select_related_dict[model])
+            for obj in qs:
+                object_dict[(content_type_id, str(obj.pk))] = obj
+
+        for action in action_list:
+            content_type_id = getattr(action, field.ct_field + '_id')
+            object_id = getattr(action, field.fk_field)
+            if content_type_id and object_id is not None:
+                field.set_cached_value(action, object_dict.get(
+                    (content_type_id, str(object_id))))
+    return action_list
@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .board_state import cache_lock
+
+BOARD_EVENTS_CACHE_KEY = 'board_events_{restaurant_id}'
+BOARD_EVENTS_LOCK_CACHE_KEY = 'board_events_lock_{restaurant_id}'
+BOARD_EVENTS_TIMEOUT = 60
+# a flush not taken by then is assumed lost and scheduled again
+BOARD_EVENTS_STALE_AFTER = 10
+
+
+def queue_board_event(restaurant_id, order_id=None, table_id_list=None):
+    """
+    collect an order change into the pending events of the restaurant
+    returns True when a flush has to be scheduled, False when one is already
+    scheduled and None when the event could not be queued
+    """
+    cache_key = BOARD_EVENTS_CACHE_KEY.format(restaurant_id=restaurant_id)
+    with cache_lock(BOARD_EVENTS_LOCK_CACHE_KEY.format(restaurant_id=restaurant_id)) as acquired:
+        if not acquired:
+            return None
+        now = time.time()
+        board_events = cache.get(cache_key)
+        schedule_flush = board_events is None or now - \
+            board_events['scheduled_at'] > BOARD_EVENTS_STALE_AFTER
+        if board_events is None:
+            board_events = {
+                'order_ids': [],
+                'table_ids': [],
+                # an event without order or table needs a full snapshot
+                'snapshot': False,
+                'event_count': 0,
+                'first_event_at': now,
+            }
+        if schedule_flush:
+            board_events['scheduled_at'] = now
+
+        if order_id and order_id not in board_events['order_ids']:
+            board_events['order_ids'].append(order_id)
+        for table_id in table_id_list or []:
+            if table_id not in board_events['table_ids']:
+                board_events['table_ids'].append(table_id)
+        if not order_id and not table_id_list:
+            board_events['snapshot'] = True
+        board_events['event_count'] += 1
+        cache.set(cache_key, board_events, BOARD_EVENTS_TIMEOUT)
+    return schedule_flush
+
+
+def take_board_events(restaurant_id):
+    """
+    the pending events of the restaurant once its collecting window is over,
+    None when there are none and False when the flush has to be retried
+    (the window is still open or the lock could not be acquired)
+    """
+    cache_key = BOARD_EVENTS_CACHE_KEY.format(restaurant_id=restaurant_id)
+    board_events = cache.get(cache_key)
+    if board_events is None:
+        return None
+    if board_events['first_event_at'] + settings.BOARD_EVENT_WINDOW > time.time():
+        return False
+
+    with cache_lock(BOARD_EVENTS_LOCK_CACHE_KEY.format(restaurant_id=restaurant_id)) as acquired:
+        if not acquired:
+            # events queued meanwhile must not be deleted unseen
+            return False
+        board_events = cache.get(cache_key)
+        cache.delete(cache_key)
+    return board_events
@@ -0,0 +1,368 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from redis import RedisError
+from redis.exceptions import LockError
+
+from utils.redis_client import get_redis
+
+from ..models import Food, FoodOrder, Table
+from .discount_index import get_discount_index
+from .order_prefetch import prefetch_order_details
+
+CLOSED_ORDER_STATUS_LIST = ['5_PAID', '6_CANCELLED']
+
+BOARD_STATE_CACHE_KEY = 'board_state_{restaurant_id}'
+BOARD_VERSION_CACHE_KEY = 'board_version_{restaurant_id}'
+BOARD_LOCK_CACHE_KEY = 'board_lock_{restaurant_id}'
+# orders saved since their tables were last loaded into the materialized board
+BOARD_DIRTY_ORDERS_KEY = 'board_dirty_orders_{restaurant_id}'
+# safety net for order changes which do not go through order_done_signal
+BOARD_STATE_TIMEOUT = 60 * 10
+BOARD_LOCK_TIMEOUT = 10
+BOARD_LOCK_WAIT = 2
+
+# {food_order_id: restaurant_id or None} of the items saved in the current transaction
+_pending_item_orders = threading.local()
+
+
+def empty_table_record(table):
+    return {
+        'table': table.pk,
+        'table_no': table.table_no,
+        'table_name': table.name,
+        'status': '',
+        'price': {},
+        'ordered_items': []
+    }
+
+
+def is_empty_table(record_list):
+    return len(record_list) == 1 and 'id' not in record_list[0]
+
+
+def load_board_tables(restaurant_id, table_id_list=None):
+    """
+    {table_id: [open order records, or the empty table record]} from the database
+    """
+    from ..serializers import FoodOrderByTableSerializer
+
+    table_qs = Table.objects.filter(restaurant=restaurant_id)
+    if table_id_list is not None:
+        table_qs = table_qs.filter(pk__in=table_id_list)
+    table_dict = table_qs.in_bulk()
+    qs = prefetch_order_details(FoodOrder.objects.filter(table__restaurant=restaurant_id, table_id__in=list(table_dict.keys())).exclude(
+        status__in=CLOSED_ORDER_STATUS_LIST).order_by('table_id'))
+
+    board_tables = {}
+    for record in FoodOrderByTableSerializer(instance=qs, many=True).data:
+        board_tables.setdefault(record['table'], []).append(record)
+    for table_id, table in table_dict.items():
+        if table_id not in board_tables:
+            board_tables[table_id] = [empty_table_record(table)]
+    return board_tables
+
+
+@contextmanager
+def cache_lock(lock_key):
+    # SET NX in redis, add() of the file based cache is a check then a write
+    lock = get_redis().lock(lock_key, timeout=BOARD_LOCK_TIMEOUT,
+                            sleep=0.02, blocking_timeout=BOARD_LOCK_WAIT)
+    acquired = lock.acquire()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except LockError:
+                # expired, another worker may hold it by now
+                pass
+
+
+def board_lock(restaurant_id):
+    return cache_lock(BOARD_LOCK_CACHE_KEY.format(restaurant_id=restaurant_id))
+
+
+def board_state_timeout(restaurant_id):
+    # item prices change when a scheduled discount starts or ends
+    expires_at = get_discount_index(restaurant_id)['expires_at']
+    return max(min(int(expires_at - timezone.now().timestamp()), BOARD_STATE_TIMEOUT), 1)
+
+
+def get_board_version(restaurant_id):
+    return int(get_redis().get(BOARD_VERSION_CACHE_KEY.format(restaurant_id=restaurant_id)) or 0)
+
+
+def next_board_version(restaurant_id):
+    return get_redis().incr(BOARD_VERSION_CACHE_KEY.format(restaurant_id=restaurant_id))
+
+
+def mark_board_order_written(restaurant_id, order_id):
+    if not restaurant_id:
+        return
+    dirty_key = BOARD_DIRTY_ORDERS_KEY.format(restaurant_id=restaurant_id)
+    try:
+        pipeline = get_redis().pipeline()
+        pipeline.sadd(dirty_key, order_id)
+        # outlives any materialized board it applies to
+        pipeline.expire(dirty_key, BOARD_STATE_TIMEOUT)
+        pipeline.execute()
+    except RedisError:
+        invalidate_board_state(restaurant_id)
+
+
+def clear_board_orders_written(restaurant_id, table_id_list):
+    """
+    forget the saved orders whose tables are about to be reloaded, orders off
+    the board included, called before loading so a later save marks them again
+    """
+    dirty_key = BOARD_DIRTY_ORDERS_KEY.format(restaurant_id=restaurant_id)
+    order_id_list = [int(order_id) for order_id in get_redis().smembers(dirty_key)]
+    if not order_id_list:
+        return
+    loaded_order_id_list = list(FoodOrder.objects.filter(
+        Q(table_id__in=table_id_list) | Q(table=None), pk__in=order_id_list
+    ).values_list('pk', flat=True))
+    if loaded_order_id_list:
+        get_redis().srem(dirty_key, *loaded_order_id_list)
+
+
+def get_board_state(restaurant_id):
+    """
+    materialized board of a restaurant:
+        version: bumped on every change broadcast to the dashboards
+        tables: {table_id: [open order records, or the empty table record]}
+    built from the database on a cache miss and kept up to date by update_board_state,
+    read from the database while orders saved without order_done_signal are not in it
+    """
+    if settings.TURN_OFF_SIGNAL:
+        # nothing updates the materialized board
+        return {
+            'version': get_board_version(restaurant_id),
+            'tables': load_board_tables(restaurant_id),
+        }
+    cache_key = BOARD_STATE_CACHE_KEY.format(restaurant_id=restaurant_id)
+    dirty_key = BOARD_DIRTY_ORDERS_KEY.format(restaurant_id=restaurant_id)
+    board_state = cache.get(cache_key)
+    if board_state is not None and get_redis().exists(dirty_key):
+        cache.delete(cache_key)
+        board_state = None
+    if board_state is None:
+        # saves from here on are not in the load, they mark the board again
+        get_redis().delete(dirty_key)
+        board_state = {
+            'version': get_board_version(restaurant_id),
+            'tables': load_board_tables(restaurant_id),
+        }
+        # an update stored while this was loading is newer
+        cache.add(cache_key, board_state, board_state_timeout(restaurant_id))
+    return board_state
+
+
+def update_board_state(restaurant_id, table_id_list=None):
+    """
+    reload the given tables, or every table when table_id_list is None, into the
+    materialized board and return the new version with the board_delta changes
+    """
+    cache_key = BOARD_STATE_CACHE_KEY.format(restaurant_id=restaurant_id)
+    with board_lock(restaurant_id) as acquired:
+        # bumped without the lock too, the dashboards need a newer version either way
+        version = next_board_version(restaurant_id)
+        change_list = None
+        if table_id_list is None:
+            if acquired:
+                get_redis().delete(BOARD_DIRTY_ORDERS_KEY.format(restaurant_id=restaurant_id))
+            board_state = {'tables': load_board_tables(restaurant_id)} if acquired else None
+        else:
+            if acquired:
+                clear_board_orders_written(restaurant_id, table_id_list)
+            # loaded under the lock so a slower worker can not store older records
+            change_list = board_delta(restaurant_id, table_id_list)
+            board_state = cache.get(cache_key) if acquired else None
+            if board_state is None and acquired:
+                # nothing materialized yet, the next read loads the whole board
+                return version, change_list
+
+        if board_state is None:
+            cache.delete(cache_key)
+            return version, change_list
+
+        for change in change_list or []:
+            if change['op'] == 'remove':
+                board_state['tables'].pop(change['table'], None)
+            else:
+                board_state['tables'][change['table']] = change['records']
+        board_state['version'] = version
+        cache.set(cache_key, board_state, board_state_timeout(restaurant_id))
+        if get_board_version(restaurant_id) != version:
+            # bumped meanwhile by a worker without the lock, its change is not in here
+            invalidate_board_state(restaurant_id)
+    return version, change_list
+
+
+def invalidate_board_state(restaurant_id):
+    if restaurant_id:
+        cache.delete(BOARD_STATE_CACHE_KEY.format(restaurant_id=restaurant_id))
+
+
+def board_records(board_state, excluded_item_status_list=None):
+    open_order_data = []
+    empty_table_data = []
+    for table_id in sorted(board_state['tables']):
+        record_list = board_state['tables'][table_id]
+        if is_empty_table(record_list):
+            empty_table_data += record_list
+            continue
+        if excluded_item_status_list:
+            record_list = [
+                dict(record, ordered_items=[
+                    ordered_item for ordered_item in record['ordered_items']
+                    if ordered_item['status'] not in excluded_item_status_list
+                ])
+                for record in record_list
+            ]
+        open_order_data += record_list
+    return open_order_data + empty_table_data
+
+
+def board_snapshot(restaurant_id, excluded_item_status_list=None):
+    """
+    every open order of the restaurant followed by every empty table
+    """
+    return board_records(get_board_state(restaurant_id), excluded_item_status_list)
+
+
+def affected_table_ids(restaurant_id, order_id_list=None, table_id_list=None):
+    table_id_set = set(table_id_list or [])
+    order_id_list = [order_id for order_id in order_id_list or [] if order_id]
+    if order_id_list:
+        table_id_set.update(FoodOrder.objects.filter(
+            pk__in=order_id_list, restaurant_id=restaurant_id).exclude(table=None).values_list('table_id', flat=True))
+    return sorted(table_id_set)
+
+
+def board_delta(restaurant_id, table_id_list):
+    """
+    board records of the given tables, one change per table:
+        {'op': 'upsert', 'table': table_id, 'records': [open orders or the empty table record]}
+        {'op': 'remove', 'table': table_id} when the table is no longer on the board
+    each change carries the current state of its table, so applying changes
+    more than once or out of order still converges to the snapshot
+    """
+    board_tables = load_board_tables(restaurant_id, table_id_list)
+    change_list = []
+    for table_id in table_id_list:
+        if table_id not in board_tables:
+            change_list.append({'op': 'remove', 'table': table_id})
+            continue
+        change_list.append({
+            'op': 'upsert',
+            'table': table_id,
+            'records': board_tables[table_id],
+        })
+    return change_list
+
+
+def waiter_boards(restaurant_id, staff_id_list):
+    """
+    {staff_id: serialized tables assigned to the staff} built in one pass,
+    every table is serialized once however many waiters share it
+    """
+    from ..serializers import TableStaffSerializer
+
+    table_staff_list = Table.staff_assigned.through.objects.filter(
+        table__restaurant_id=restaurant_id, hotelstaffinformation_id__in=staff_id_list
+    ).values_list('table_id', 'hotelstaffinformation_id')
+    table_staff_dict = {}
+    for table_id, staff_id in table_staff_list:
+        table_staff_dict.setdefault(table_id, set()).add(staff_id)
+
+    table_qs = Table.objects.filter(
+        restaurant_id=restaurant_id, pk__in=list(table_staff_dict.keys())).order_by('table_no')
+    waiter_board_dict = {staff_id: [] for staff_id in staff_id_list}
+    for table_data in TableStaffSerializer(instance=table_qs, many=True).data:
+        for staff_id in table_staff_dict[table_data['id']]:
+            waiter_board_dict[staff_id].append(table_data)
+    return waiter_board_dict
+
+
+def customer_order_records(order_id_list):
+    """
+    {order_id: order record as the customer app shows it}, closed orders included
+    """
+    from ..serializers import FoodOrderByTableSerializer
+
+    qs = prefetch_order_details(
+        FoodOrder.objects.filter(pk__in=order_id_list).order_by('pk'))
+    serializer = FoodOrderByTableSerializer(
+        instance=qs, many=True, context={'is_apps': True})
+    return {record['id']: record for record in serializer.data}
+
+
+def mark_board_dirty_on_order_change(sender, instance, **kwargs):
+    restaurant_id, order_id = instance.restaurant_id, instance.pk
+    transaction.on_commit(
+        lambda: mark_board_order_written(restaurant_id, order_id))
+
+
+def mark_board_dirty_on_ordered_item_change(sender, instance, **kwargs):
+    if not instance.food_order_id:
+        return
+    # the order is only read when the item came with it, not loaded once per saved item
+    food_order = instance._state.fields_cache.get('food_order')
+    order_restaurant_dict = _pending_item_orders.__dict__.setdefault('order_restaurant_dict', {})
+    if food_order is not None:
+        order_restaurant_dict[instance.food_order_id] = food_order.restaurant_id
+    else:
+        order_restaurant_dict.setdefault(instance.food_order_id, None)
+    transaction.on_commit(mark_pending_item_orders_written)
+
+
+def mark_pending_item_orders_written():
+    """
+    mark the orders of the items saved in the committed transaction, the first
+    callback takes them all and looks up the missing restaurants in one query
+    """
+    order_restaurant_dict = _pending_item_orders.__dict__.pop('order_restaurant_dict', None)
+    if not order_restaurant_dict:
+        return
+    order_id_list = [
+        order_id for order_id, restaurant_id in order_restaurant_dict.items() if restaurant_id is None
+    ]
+    if order_id_list:
+        order_restaurant_dict.update(FoodOrder.raw_objects.filter(
+            pk__in=order_id_list).values_list('pk', 'restaurant_id'))
+    for order_id, restaurant_id in order_restaurant_dict.items():
+        mark_board_order_written(restaurant_id, order_id)
+
+
+def invalidate_board_state_on_restaurant_change(sender, instance, **kwargs):
+    invalidate_board_state(instance.pk)
+
+
+def invalidate_board_state_on_change(sender, instance, **kwargs):
+    invalidate_board_state(instance.restaurant_id)
+
+
+def invalidate_board_state_on_food_option_change(sender, instance, **kwargs):
+    invalidate_board_state(
+        Food.raw_objects.filter(pk=instance.food_id).values_list('restaurant_id', flat=True).first())
+
+
+def invalidate_board_state_on_table_save(sender, instance, created=False, **kwargs):
+    # occupancy changes reach the board through order_done_signal, only the table itself matters here
+    board_state = cache.get(BOARD_STATE_CACHE_KEY.format(
+        restaurant_id=instance.restaurant_id))
+    if board_state is None:
+        return
+    record_list = board_state['tables'].get(instance.pk)
+    if created or instance.deleted_at or not record_list or any(
+            record['table_name'] != instance.name or record['table_no'] != instance.table_no
+            for record in record_list):
+        invalidate_board_state(instance.restaurant_id)
@@ -0,0 +1,101 @@
+import math
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Discount
+
+DISCOUNT_INDEX_CACHE_KEY = 'discount_index_{restaurant_id}'
+
+
+def active_discount_q(today=None, current_time=None):
+    """
+    discounts which apply to food prices right now,
+    Date_wise by start/end date and Time_wise by daily time slot
+    """
+    if today is None:
+        today = timezone.datetime.now().date()
+    if current_time is None:
+        current_time = timezone.now()
+    start_date = today + timedelta(days=1)
+    return Q(start_date__lte=start_date, end_date__gte=today, discount_schedule_type='Date_wise') | \
+        Q(discount_slot_closing_time__gte=current_time, discount_slot_start_time__lte=current_time,
+          discount_schedule_type='Time_wise')
+
+
+def seconds_until_next_boundary(now, slot_time_list):
+    # date windows only change at midnight, time slots at their start/closing time
+    boundary = datetime.combine(
+        now.date() + timedelta(days=1), time.min, tzinfo=now.tzinfo)
+    for slot_time in slot_time_list:
+        if slot_time is None:
+            continue
+        candidate = datetime.combine(
+            now.date(), slot_time.replace(tzinfo=None), tzinfo=now.tzinfo)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        if candidate < boundary:
+            boundary = candidate
+    return max(int(math.ceil((boundary - now).total_seconds())), 1)
+
+
+def build_discount_index(restaurant_id):
+    now = timezone.now()
+    today = timezone.datetime.now().date()
+    discount_qs = Discount.objects.filter(restaurant_id=restaurant_id)
+
+    price_discounts = dict(
+        discount_qs.filter(active_discount_q(today, now)).exclude(
+            food=None, image=None).values_list('pk', 'amount')
+    )
+    popup_discounts = list(
+        discount_qs.filter(is_popup=True, start_date__lte=today, end_date__gte=today).exclude(
+            food=None, image=None).order_by('pk').values_list('pk', flat=True)
+    )
+    slider_discounts = list(
+        discount_qs.filter(is_slider=True, start_date__lte=today - timedelta(days=1), end_date__gte=today).exclude(
+            food=None, image=None).order_by('pk').values_list('pk', flat=True)
+    )
+
+    slot_time_list = []
+    for slot_start_time, slot_closing_time in discount_qs.filter(
+            discount_schedule_type='Time_wise').values_list('discount_slot_start_time', 'discount_slot_closing_time'):
+        slot_time_list.append(slot_start_time)
+        slot_time_list.append(slot_closing_time)
+
+    timeout = seconds_until_next_boundary(now, slot_time_list)
+    discount_index = {
+        'price_discounts': price_discounts,
+        'popup_discounts': popup_discounts,
+        'slider_discounts': slider_discounts,
+        'expires_at': now.timestamp() + timeout,
+    }
+    return discount_index, timeout
+
+
+def get_discount_index(restaurant_id):
+    """
+    active discounts of a restaurant:
+        price_discounts: {discount_id: amount} applied on food prices
+        popup_discounts / slider_discounts: discount ids shown in the apps
+        expires_at: timestamp of the next schedule boundary
+    cached until the next schedule boundary or until a discount changes
+    """
+    cache_key = DISCOUNT_INDEX_CACHE_KEY.format(restaurant_id=restaurant_id)
+    discount_index = cache.get(cache_key)
+    if discount_index is None:
+        discount_index, timeout = build_discount_index(restaurant_id)
+        cache.set(cache_key, discount_index, timeout)
+    return discount_index
+
+
+def invalidate_discount_index(restaurant_id):
+    if restaurant_id:
+        cache.delete(DISCOUNT_INDEX_CACHE_KEY.format(
+            restaurant_id=restaurant_id))
+
+
+def invalidate_discount_index_on_change(sender, instance, **kwargs):
+    invalidate_discount_index(instance.restaurant_id)
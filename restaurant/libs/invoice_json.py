@@ -0,0 +1,56 @@
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from rest_framework.fields import DateTimeField
+from rest_framework.utils.encoders import JSONEncoder
+
+from utils.fast_json import RawJSON, dumps
+
+from ..models import Invoice
+
+# invoice columns InvoiceSerializer nests into order_info['invoice'], in model order
+INVOICE_ATTNAME_LIST = [
+    field.attname for field in Invoice._meta.concrete_fields if field.name != 'order_info']
+
+drf_json_encoder = JSONEncoder()
+datetime_field = DateTimeField()
+
+
+def invoice_rows(invoice_qs):
+    """
+    invoice columns as dicts with the stored order_info as its json text,
+    the order info is never loaded into python objects
+    """
+    return invoice_qs.values(
+        *INVOICE_ATTNAME_LIST, order_info_text=Cast('order_info', TextField()))
+
+
+def invoice_record(row):
+    """
+    the InvoiceSerializer representation of an invoice_rows() row,
+    order_info stays RawJSON with the invoice columns spliced in
+    """
+    invoice_text = dumps({
+        attname: row[attname] if row[attname] is None or isinstance(row[attname], (str, int, float))
+        else drf_json_encoder.default(row[attname])
+        for attname in INVOICE_ATTNAME_LIST
+    })
+    order_info_text = (row['order_info_text'] or '').rstrip()
+    if order_info_text.endswith('}') and order_info_text[:-1].rstrip() != '{':
+        order_info_text = '%s, "invoice": %s}' % (
+            order_info_text[:-1], invoice_text)
+    else:
+        order_info_text = '{"invoice": %s}' % invoice_text
+    return {
+        'order_info': RawJSON(order_info_text),
+        'id': str(row['id']),
+        'order': row['order_id'],
+        'grand_total': row['grand_total'],
+        'payable_amount': row['payable_amount'],
+        'updated_at': datetime_field.to_representation(row['updated_at']),
+        'created_at': datetime_field.to_representation(row['created_at']),
+        'payment_status': row['payment_status'],
+    }
+
+
+def invoice_records(rows):
+    return [invoice_record(row) for row in rows]
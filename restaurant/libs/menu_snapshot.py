@@ -0,0 +1,84 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from utils.fast_json import dumps
+
+from ..models import Food
+
+MENU_VERSION_CACHE_KEY = 'menu_version_{restaurant_id}'
+MENU_SNAPSHOT_CACHE_KEY = 'menu_snapshot_{restaurant_id}_{version}_{name}'
+# safety net for menu changes made with queryset updates, which send no signal
+MENU_SNAPSHOT_TIMEOUT = 60 * 15
+
+
+def get_menu_version(restaurant_id):
+    version_key = MENU_VERSION_CACHE_KEY.format(restaurant_id=restaurant_id)
+    version = cache.get(version_key)
+    if version is None:
+        # a new or evicted version starts from the clock, so etags are not reused
+        version = int(time.time() * 1000)
+        if not cache.add(version_key, version, None):
+            version = cache.get(version_key, version)
+    return version
+
+
+def next_menu_version(restaurant_id):
+    if not restaurant_id:
+        return None
+    version_key = MENU_VERSION_CACHE_KEY.format(restaurant_id=restaurant_id)
+    version = max(cache.get(version_key, 0) + 1, int(time.time() * 1000))
+    cache.set(version_key, version, None)
+    return version
+
+
+def get_menu_snapshot(restaurant_id, name, build_data):
+    """
+    {etag, data} of a menu response of the restaurant, build_data() is called
+    once per menu version, every menu change gives new snapshots and etags
+    """
+    version = get_menu_version(restaurant_id)
+    cache_key = MENU_SNAPSHOT_CACHE_KEY.format(
+        restaurant_id=restaurant_id, version=version, name=name)
+    menu_snapshot = cache.get(cache_key)
+    if menu_snapshot is None:
+        data = build_data()
+        menu_snapshot = {
+            'etag': '"%s-%s"' % (version, hashlib.md5(dumps(data).encode('utf-8')).hexdigest()),
+            'data': data,
+        }
+        cache.set(cache_key, menu_snapshot, MENU_SNAPSHOT_TIMEOUT)
+    return menu_snapshot
+
+
+def next_menu_version_on_change(sender, instance, **kwargs):
+    next_menu_version(instance.restaurant_id)
+
+
+def next_menu_version_on_food_item_change(sender, instance, **kwargs):
+    # food options and extras
+    next_menu_version(
+        Food.raw_objects.filter(pk=instance.food_id).values_list('restaurant_id', flat=True).first())
+
+
+def next_menu_version_on_category_change(sender, instance, **kwargs):
+    # categories are shared, every restaurant with a food in it changes
+    restaurant_id_list = Food.raw_objects.filter(category=instance).values_list(
+        'restaurant_id', flat=True).distinct()
+    for restaurant_id in restaurant_id_list:
+        next_menu_version(restaurant_id)
+
+
+def next_menu_version_on_option_type_change(sender, instance, **kwargs):
+    restaurant_id_list = Food.raw_objects.filter(food_options__option_type=instance).values_list(
+        'restaurant_id', flat=True).distinct()
+    for restaurant_id in restaurant_id_list:
+        next_menu_version(restaurant_id)
+
+
+def next_menu_version_on_extra_type_change(sender, instance, **kwargs):
+    restaurant_id_list = Food.raw_objects.filter(food_extras__extra_type=instance).values_list(
+        'restaurant_id', flat=True).distinct()
+    for restaurant_id in restaurant_id_list:
+        next_menu_version(restaurant_id)
@@ -0,0 +1,61 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ..models import Food, FoodOption
+
+
+def option_summary_expressions(food_ref='pk'):
+    """
+    {min_price, option_count} of a food computed by the database from its options,
+    for Food annotate() or update()
+    """
+    option_qs = FoodOption.objects.filter(food=OuterRef(food_ref))
+    return {
+        'min_price': Subquery(option_qs.order_by('price').values('price')[:1]),
+        'option_count': Coalesce(Subquery(
+            option_qs.order_by().values('food').annotate(
+                option_count=Count('pk')).values('option_count'),
+            output_field=IntegerField()
+        ), Value(0)),
+    }
+
+
+def with_option_summary(food_qs):
+    """
+    foods annotated with option_min_price and option_total read from the options,
+    for callers which can not rely on the stored min_price and option_count
+    """
+    expression_dict = option_summary_expressions()
+    return food_qs.annotate(option_min_price=expression_dict['min_price'],
+                            option_total=expression_dict['option_count'])
+
+
+def refresh_option_summary(food_id_list):
+    # a single UPDATE, it runs in the transaction of the option change
+    return Food.raw_objects.filter(pk__in=food_id_list).update(**option_summary_expressions())
+
+
+def food_min_price(food):
+    min_price = getattr(food, 'option_min_price', food.min_price)
+    if min_price is None:
+        return None
+    return round(min_price, 2)
+
+
+def refresh_option_summary_on_food_option_change(sender, instance, **kwargs):
+    food_id_list = [instance.food_id]
+    previous_food_id = getattr(instance, '_previous_food_id', None)
+    if previous_food_id and previous_food_id != instance.food_id:
+        food_id_list.append(previous_food_id)
+    refresh_option_summary(food_id_list)
+
+
+def refresh_option_summary_on_food_save(sender, instance, **kwargs):
+    # a full save writes back the summary loaded with the food, which may be older
+    refresh_option_summary([instance.pk])
+
+
+def remember_food_option_food(sender, instance, **kwargs):
+    # an option moved to another food changes the summary of both
+    instance._previous_food_id = FoodOption.raw_objects.filter(
+        pk=instance.pk).values_list('food_id', flat=True).first() if instance.pk else None
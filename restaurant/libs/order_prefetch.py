@@ -0,0 +1,31 @@
+from django.db.models import Prefetch
+
+from ..models import FoodOrderLog, OrderedItem
+
+# logs FoodOrderByTableSerializer takes the waiter from
+WAITER_LOG_STATUS_LIST = ["5_PAID", "4_CREATE_INVOICE"]
+
+
+def prefetch_order_details(food_order_qs):
+    """
+    food orders with everything FoodOrderByTableSerializer reads loaded along,
+    the query count no longer grows with the number of orders or items:
+        table, restaurant, customer and payment method joined
+        ordered_items with option, option type, food, category, discount and extras
+        waiter_logs, the invoice and payment logs latest first
+    """
+    ordered_item_qs = OrderedItem.objects.select_related(
+        'food_option__option_type',
+        'food_option__food__category',
+        'food_option__food__discount',
+        'food_option__food__restaurant',
+    ).prefetch_related('food_extra')
+    waiter_log_qs = FoodOrderLog.objects.filter(
+        order_status__in=WAITER_LOG_STATUS_LIST).select_related('staff').order_by('-created_at')
+
+    return food_order_qs.select_related(
+        'table__restaurant', 'restaurant', 'customer', 'payment_method'
+    ).prefetch_related(
+        Prefetch('ordered_items', queryset=ordered_item_qs),
+        Prefetch('food_order_logs', queryset=waiter_log_qs, to_attr='waiter_logs'),
+    )
@@ -0,0 +1,49 @@
+import time
+
+from utils.redis_client import get_redis
+
+# sorted set of the channel names of a group, scored by when they expire
+PRESENCE_CACHE_KEY = 'presence_{group_name}'
+# consumers refresh their presence every PRESENCE_REFRESH_INTERVAL seconds,
+# connections of a crashed process drop out after PRESENCE_TTL
+PRESENCE_TTL = 180
+PRESENCE_REFRESH_INTERVAL = 60
+
+
+def update_presence(group_name, channel_name, is_live=True):
+    """
+    ZADD / ZREM change one connection without reading the others, so
+    concurrent consumers of a group need no lock
+    """
+    cache_key = PRESENCE_CACHE_KEY.format(group_name=group_name)
+    now = time.time()
+    pipeline = get_redis().pipeline()
+    pipeline.zremrangebyscore(cache_key, '-inf', now)
+    if is_live:
+        pipeline.zadd(cache_key, {channel_name: now + PRESENCE_TTL})
+        pipeline.expire(cache_key, PRESENCE_TTL)
+    else:
+        pipeline.zrem(cache_key, channel_name)
+    pipeline.execute()
+
+
+def register_presence(group_name, channel_name):
+    update_presence(group_name, channel_name)
+
+
+def unregister_presence(group_name, channel_name):
+    update_presence(group_name, channel_name, is_live=False)
+
+
+def live_groups(group_name_list):
+    """
+    the groups with at least one live connection, read in one redis round trip
+    """
+    group_name_list = list(group_name_list)
+    now = time.time()
+    pipeline = get_redis().pipeline(transaction=False)
+    for group_name in group_name_list:
+        pipeline.zcount(PRESENCE_CACHE_KEY.format(group_name=group_name), '(%s' % now, '+inf')
+    return {
+        group_name for group_name, live_count in zip(group_name_list, pipeline.execute()) if live_count
+    }
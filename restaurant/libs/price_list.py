@@ -0,0 +1,101 @@
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..models import Food, FoodOption
+from .discount_index import get_discount_index
+
+PRICE_LIST_CACHE_KEY = 'price_list_{restaurant_id}'
+
+
+def build_price_list(restaurant_id):
+    from ..serializers import FoodOptionSerializer
+
+    discount_index = get_discount_index(restaurant_id)
+    price_discounts = discount_index['price_discounts']
+
+    foods = {}
+    food_discount_dict = {}
+    for food in Food.objects.filter(restaurant_id=restaurant_id).select_related('discount'):
+        food_discount_dict[food.pk] = (
+            food.discount_id, food.discount.amount if food.discount else 0.0)
+        foods[food.pk] = {'min_price': None, 'food_options': []}
+
+    options = {}
+    food_option_list_dict = {}
+    food_option_qs = FoodOption.objects.filter(
+        food_id__in=list(foods.keys())).select_related('option_type').order_by('price', 'pk')
+    for food_option in food_option_qs:
+        discount_id, discount_amount = food_discount_dict[food_option.food_id]
+        active_discount_amount = price_discounts.get(discount_id, 0.0)
+        options[food_option.pk] = {
+            'food': food_option.food_id,
+            'price': food_option.price,
+            # linked food discount, applied on ordered item prices
+            'discount': discount_amount,
+            # discount currently in its schedule window
+            'active_discount': active_discount_amount,
+            'final_price': food_option.price - (active_discount_amount/100)*food_option.price,
+        }
+        food_option_list_dict.setdefault(
+            food_option.food_id, []).append(food_option)
+
+    for food_id, food_option_list in food_option_list_dict.items():
+        foods[food_id]['min_price'] = round(food_option_list[0].price, 2)
+        foods[food_id]['food_options'] = FoodOptionSerializer(
+            food_option_list, many=True).data
+
+    price_list = {
+        'options': options,
+        'foods': foods,
+    }
+    # active discounts change at the discount index expiry
+    timeout = max(int(discount_index['expires_at'] -
+                      timezone.now().timestamp()), 1)
+    return price_list, timeout
+
+
+def get_price_list(restaurant_id):
+    """
+    effective prices of a restaurant menu:
+        options: {option_id: {food, price, discount, active_discount, final_price}}
+        foods: {food_id: {min_price, food_options (serialized, cheapest first)}}
+    cached until the active discounts change or a food/option/discount is saved
+    """
+    cache_key = PRICE_LIST_CACHE_KEY.format(restaurant_id=restaurant_id)
+    price_list = cache.get(cache_key)
+    if price_list is None:
+        price_list, timeout = build_price_list(restaurant_id)
+        cache.set(cache_key, price_list, timeout)
+    return price_list
+
+
+def get_context_price_list(context, restaurant_id):
+    """
+    get_price_list() memoized in a serializer context, the cached price list is
+    unpickled once per restaurant per response instead of once per item or food
+    """
+    price_list_dict = context.setdefault('price_lists', {})
+    if restaurant_id not in price_list_dict:
+        price_list_dict[restaurant_id] = get_price_list(restaurant_id)
+    return price_list_dict[restaurant_id]
+
+
+def invalidate_price_list(restaurant_id):
+    if restaurant_id:
+        cache.delete(PRICE_LIST_CACHE_KEY.format(restaurant_id=restaurant_id))
+
+
+def invalidate_price_list_on_food_change(sender, instance, **kwargs):
+    invalidate_price_list(instance.restaurant_id)
+
+
+def invalidate_price_list_on_food_option_change(sender, instance, **kwargs):
+    invalidate_price_list(
+        Food.raw_objects.filter(pk=instance.food_id).values_list('restaurant_id', flat=True).first())
+
+
+def invalidate_price_list_on_option_type_change(sender, instance, **kwargs):
+    restaurant_id_list = FoodOption.objects.filter(option_type=instance).values_list(
+        'food__restaurant_id', flat=True).distinct()
+    for restaurant_id in restaurant_id_list:
+        invalidate_price_list(restaurant_id)
@@ -0,0 +1,67 @@
+import time
+
+from utils.fast_json import dumps
+from utils.redis_client import get_redis
+
+STREAM_SEQ_CACHE_KEY = 'stream_seq_{group_name}'
+STREAM_BUFFER_CACHE_KEY = 'stream_buffer_{group_name}'
+# frames kept per group for reconnecting clients, older gaps get a snapshot
+REPLAY_BUFFER_SIZE = 50
+REPLAY_TTL = 60 * 30
+
+
+def get_stream_seq(group_name):
+    return int(get_redis().get(STREAM_SEQ_CACHE_KEY.format(group_name=group_name)) or 0)
+
+
+def next_stream_seq(group_name):
+    seq_key = STREAM_SEQ_CACHE_KEY.format(group_name=group_name)
+    pipeline = get_redis().pipeline()
+    # a new or expired counter starts from the clock, so numbers are not reused
+    pipeline.set(seq_key, int(time.time() * 1000), nx=True)
+    pipeline.incr(seq_key)
+    pipeline.expire(seq_key, REPLAY_TTL)
+    return pipeline.execute()[1]
+
+
+def publish_frame(group_name, frame):
+    """
+    stamp the frame with the next sequence number of the group, keep it in the
+    replay buffer and return it encoded, INCR and RPUSH keep concurrent publishers apart
+    """
+    buffer_key = STREAM_BUFFER_CACHE_KEY.format(group_name=group_name)
+    seq = next_stream_seq(group_name)
+    text = dumps(dict(frame, seq=seq))
+    pipeline = get_redis().pipeline()
+    pipeline.rpush(buffer_key, '%s:%s' % (seq, text))
+    pipeline.ltrim(buffer_key, -REPLAY_BUFFER_SIZE, -1)
+    pipeline.expire(buffer_key, REPLAY_TTL)
+    pipeline.execute()
+    return text
+
+
+def mark_stream_gap(group_name):
+    """
+    a change was not published to the group, reconnecting clients need a snapshot
+    """
+    next_stream_seq(group_name)
+
+
+def missed_frames(group_name, last_seq):
+    """
+    encoded frames published after last_seq, None when they are not all in the replay buffer
+    """
+    seq = get_stream_seq(group_name)
+    if last_seq == seq:
+        return []
+    if last_seq > seq or seq - last_seq > REPLAY_BUFFER_SIZE:
+        return None
+    frame_dict = {}
+    for entry in get_redis().lrange(STREAM_BUFFER_CACHE_KEY.format(group_name=group_name), 0, -1):
+        frame_seq, text = entry.decode('utf-8').split(':', 1)
+        if int(frame_seq) > last_seq:
+            frame_dict[int(frame_seq)] = text
+    # publishers push in the order they finish, not in sequence order
+    if sorted(frame_dict) != list(range(last_seq + 1, seq + 1)):
+        return None
+    return [frame_dict[frame_seq] for frame_seq in range(last_seq + 1, seq + 1)]
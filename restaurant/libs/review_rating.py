@@ -0,0 +1,134 @@
+from django.db.models import Case, Count, F, FloatField, Sum, When
+from django.db.models.functions import Cast
+
+from ..models import Food, FoodOrder, OrderedItem, Restaurant, Review
+from .menu_snapshot import next_menu_version
+
+
+def review_food_ids(order_id):
+    return list(OrderedItem.objects.filter(food_order_id=order_id).values_list(
+        'food_option__food_id', flat=True).distinct())
+
+
+def apply_rating(restaurant_id, food_id_list, rating, count, count_restaurant=True):
+    """
+    add (count=1) or remove (count=-1) a review rating, each aggregate changes in a
+    single UPDATE reading the row it writes, so concurrent reviews do not overwrite each other
+    """
+    if restaurant_id and count_restaurant:
+        Restaurant.raw_objects.filter(pk=restaurant_id).update(
+            rating_sum=F('rating_sum') + rating * count,
+            rating_count=F('rating_count') + count,
+        )
+    if food_id_list:
+        # the right hand side sees the values before this update
+        Food.raw_objects.filter(pk__in=food_id_list).update(
+            rating_sum=F('rating_sum') + rating * count,
+            order_counter=F('order_counter') + count,
+            rating=Case(
+                When(order_counter__gt=-count, then=Cast(
+                    F('rating_sum') + rating * count, FloatField()) / (F('order_counter') + count)),
+                default=None, output_field=FloatField()
+            ),
+        )
+        # food ratings are shown on the menu
+        next_menu_version(restaurant_id)
+
+
+def rating_summary(rating_sum, rating_count):
+    if not rating_count:
+        return {'value': None, 'total_reviewers': 0}
+    return {'value': rating_sum / rating_count, 'total_reviewers': rating_count}
+
+
+def refresh_rating_aggregates(restaurant_id_list=None):
+    """
+    recompute the restaurant and food aggregates from the stored reviews inside
+    a transaction, returns the number of (restaurants, foods) updated
+    """
+    restaurant_qs = Restaurant.raw_objects.all()
+    food_qs = Food.raw_objects.all()
+    review_qs = Review.objects.filter(order__isnull=False)
+    if restaurant_id_list is not None:
+        restaurant_qs = restaurant_qs.filter(pk__in=restaurant_id_list)
+        food_qs = food_qs.filter(restaurant_id__in=restaurant_id_list)
+        review_qs = review_qs.filter(order__restaurant_id__in=restaurant_id_list)
+
+    # locked before the reviews are read, a review saved meanwhile is added after this commits
+    restaurant_list = list(restaurant_qs.select_for_update().only('pk').order_by('pk'))
+    food_list = list(food_qs.select_for_update().only('pk').order_by('pk'))
+
+    # as RestaurantSerializer.get_review counted them, reviews of deleted orders left out
+    restaurant_rating_dict = {
+        restaurant_rating['order__restaurant_id']: restaurant_rating
+        for restaurant_rating in review_qs.filter(order__deleted_at__isnull=True).values(
+            'order__restaurant_id').annotate(rating_sum=Sum('rating'), rating_count=Count('pk')).order_by()
+    }
+    for restaurant in restaurant_list:
+        restaurant_rating = restaurant_rating_dict.get(restaurant.pk, {})
+        restaurant.rating_sum = restaurant_rating.get('rating_sum') or 0
+        restaurant.rating_count = restaurant_rating.get('rating_count') or 0
+    Restaurant.raw_objects.bulk_update(
+        restaurant_list, ['rating_sum', 'rating_count'], batch_size=500)
+
+    # a review counts once for every food of its order
+    food_rating_dict = {}
+    food_review_list = OrderedItem.objects.filter(food_order__reviews__in=review_qs).values_list(
+        'food_option__food_id', 'food_order__reviews__rating', 'food_order_id').distinct()
+    for food_id, rating, order_id in food_review_list.iterator():
+        rating_sum, rating_count = food_rating_dict.get(food_id, (0, 0))
+        food_rating_dict[food_id] = (rating_sum + rating, rating_count + 1)
+    for food in food_list:
+        food.rating_sum, food.order_counter = food_rating_dict.get(food.pk, (0, 0))
+        food.rating = food.rating_sum / food.order_counter if food.order_counter else None
+    Food.raw_objects.bulk_update(
+        food_list, ['rating_sum', 'order_counter', 'rating'], batch_size=500)
+    return len(restaurant_list), len(food_list)
+
+
+def apply_order_rating(order_id, rating, count):
+    order = FoodOrder.raw_objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    # as in refresh_rating_aggregates, reviews of deleted orders count for the foods only
+    apply_rating(order.restaurant_id, review_food_ids(order.pk), rating, count,
+                 count_restaurant=order.deleted_at is None)
+
+
+def remember_review_rating(sender, instance, **kwargs):
+    # an edited review takes its previous rating out of the aggregates
+    instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list(
+        'order_id', 'rating').first() if instance.pk else None
+
+
+def add_review_rating(sender, instance, **kwargs):
+    previous_rating = getattr(instance, '_previous_rating', None)
+    if previous_rating == (instance.order_id, instance.rating):
+        return
+    if previous_rating and previous_rating[0]:
+        apply_order_rating(previous_rating[0], previous_rating[1], -1)
+    if instance.order_id:
+        apply_order_rating(instance.order_id, instance.rating, 1)
+
+
+def remove_review_rating(sender, instance, **kwargs):
+    if instance.order_id:
+        apply_order_rating(instance.order_id, instance.rating, -1)
+
+
+def remember_deleted_order_rating(sender, instance, **kwargs):
+    """
+    the review rating of an order being soft deleted, only looked up for saves of
+    deleted orders. undeleting an order is left to backfill_rating_aggregates,
+    telling it apart from other saves would cost a query per order save
+    """
+    instance._deleted_rating = None
+    if instance.pk and instance.deleted_at is not None:
+        instance._deleted_rating = Review.objects.filter(
+            order_id=instance.pk, order__deleted_at__isnull=True).values_list('rating', flat=True).first()
+
+
+def remove_deleted_order_rating(sender, instance, **kwargs):
+    deleted_rating = getattr(instance, '_deleted_rating', None)
+    if deleted_rating is not None:
+        apply_rating(instance.restaurant_id, [], deleted_rating, -1)
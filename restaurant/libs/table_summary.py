@@ -0,0 +1,32 @@
+from django.db.models import Count, Q
+
+from utils.calculate_price import compute_prices
+
+from ..models import FoodOrder
+
+# orders which no longer keep their table occupied
+CLOSED_ORDER_STATUS_LIST = ["5_PAID", "6_CANCELLED"]
+
+
+def running_order_summaries(table_id_list):
+    """
+    ({table_id: latest running order}, {order_id: PriceBreakdown}) of the tables,
+    every order carries total_items and total_served_items counted in the same query,
+    so the query count does not grow with the number of tables
+    """
+    if not table_id_list:
+        return {}, {}
+    food_order_qs = FoodOrder.objects.filter(table_id__in=table_id_list).exclude(
+        status__in=CLOSED_ORDER_STATUS_LIST
+    ).annotate(
+        total_items=Count('ordered_items', filter=~Q(
+            ordered_items__status='4_CANCELLED')),
+        total_served_items=Count('ordered_items', filter=Q(
+            ordered_items__status='3_IN_TABLE')),
+    ).select_related('restaurant').order_by('id')
+
+    running_orders = {}
+    # ordered by id, the latest order of a table wins
+    for food_order in food_order_qs:
+        running_orders[food_order.table_id] = food_order
+    return running_orders, compute_prices(list(running_orders.values()))
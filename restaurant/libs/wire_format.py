@@ -0,0 +1,76 @@
+import zlib
+from functools import lru_cache
+
+import msgpack
+import orjson
+
+WIRE_ENCODING_LIST = ['json', 'json-deflate', 'msgpack', 'msgpack-deflate']
+DEFAULT_WIRE_ENCODING = 'json'
+
+# keys of board, waiter and order frames, sent as their index in msgpack encodings,
+# append only so clients holding an older list keep decoding
+FIELD_DICTIONARY = [
+    'type', 'seq', 'version', 'data', 'op', 'records', 'error',
+    'id', 'order_no', 'remarks', 'table', 'status', 'status_details', 'payment_method',
+    'price', 'grand_total_price', 'discount_amount', 'payable_amount', 'tax_amount',
+    'tax_percentage', 'service_charge', 'service_charge_is_percentage',
+    'service_charge_base_amount', 'total_price', 'cash_received', 'change_amount',
+    'ordered_items', 'quantity', 'food_order', 'food_name', 'food_image', 'food_option',
+    'option_type', 'name', 'food', 'food_extra', 'extra_type', 'category_name',
+    'table_name', 'table_no', 'waiter', 'staff_id', 'restaurant_info', 'phone',
+    'vat_registration_no', 'trade_licence_no', 'created_at', 'updated_at', 'customer',
+    'applied_promo_code', 'restaurant', 'is_occupied', 'order_info', 'total_items',
+    'total_served_items',
+]
+FIELD_INDEX_DICT = {field_name: index for index,
+                    field_name in enumerate(FIELD_DICTIONARY)}
+
+
+def parse_wire_encoding(value):
+    if value in WIRE_ENCODING_LIST:
+        return value
+    return DEFAULT_WIRE_ENCODING
+
+
+def compact_keys(value):
+    # msgpack only, integer keys stay apart from numeric string keys like "3" there, not in JSON
+    if isinstance(value, dict):
+        return {
+            FIELD_INDEX_DICT.get(key, key): compact_keys(item) for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [compact_keys(item) for item in value]
+    return value
+
+
+def hello_frame(encoding):
+    """
+    first frame of a compact stream, always plain JSON
+    """
+    hello = {
+        'type': 'hello',
+        'encoding': encoding,
+    }
+    if encoding.startswith('msgpack'):
+        hello['fields'] = FIELD_DICTIONARY
+    return orjson.dumps(hello).decode('utf-8')
+
+
+@lru_cache(maxsize=64)
+def encode_frame(text, encoding):
+    """
+    binary frame of an encoded JSON frame as negotiated, msgpack with dictionary keys
+    or the JSON text as it is, cached so each process converts a group frame once per
+    encoding however many sockets receive it
+
+    -deflate is zlib applied to each frame by the application, not the permessage-deflate
+    websocket extension, clients inflate the binary payload themselves
+    """
+    if encoding.startswith('msgpack'):
+        payload = msgpack.packb(compact_keys(
+            orjson.loads(text)), use_bin_type=True)
+    else:
+        payload = text.encode('utf-8')
+    if encoding.endswith('-deflate'):
+        payload = zlib.compress(payload)
+    return payload
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from restaurant.libs.review_rating import refresh_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute the restaurant and food rating aggregates from the stored reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int, action='append',
+                            help='only this restaurant and its foods, can be given more than once')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            restaurant_count, food_count = refresh_rating_aggregates(
+                options['restaurant'])
+        self.stdout.write(self.style.SUCCESS('%s restaurants and %s foods updated' % (
+            restaurant_count, food_count)))
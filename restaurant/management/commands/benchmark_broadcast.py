@@ -0,0 +1,68 @@
+import json
+import time
+
+from channels_redis.core import RedisChannelLayer
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+
+from restaurant.libs.board_state import board_snapshot, get_board_version
+from restaurant.models import Restaurant
+from utils.fast_json import dumps
+
+
+class Command(BaseCommand):
+    help = 'Compare the CPU cost of a board broadcast per recipient, encoded per socket against encoded once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int,
+                            help='board to broadcast, the restaurant with most open orders by default')
+        parser.add_argument('--recipients', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        restaurant_id = options['restaurant']
+        if not restaurant_id:
+            restaurant_id = Restaurant.objects.annotate(open_order_count=Count(
+                'food_orders', filter=~Q(food_orders__status__in=['5_PAID', '6_CANCELLED']))
+            ).order_by('-open_order_count').values_list('pk', flat=True).first()
+        if not restaurant_id:
+            raise CommandError('no restaurant to benchmark')
+
+        data = board_snapshot(restaurant_id)
+        version = get_board_version(restaurant_id)
+        # the channel layer serialization, no redis connection is made
+        layer = RedisChannelLayer()
+        recipients = options['recipients']
+        repeat = options['repeat']
+
+        def per_socket():
+            event = {'type': 'response_to_listener',
+                     'message_type': 'snapshot', 'version': version, 'data': data}
+            for recipient in range(recipients):
+                received = layer.deserialize(layer.serialize(event))
+                json.dumps({
+                    'type': received['message_type'],
+                    'version': received['version'],
+                    'data': received['data']
+                })
+
+        def encoded_once():
+            event = {'type': 'response_to_listener', 'text': dumps(
+                {'type': 'snapshot', 'version': version, 'data': data})}
+            for recipient in range(recipients):
+                layer.deserialize(layer.serialize(event))['text']
+
+        self.stdout.write('restaurant %s: %s board records, %s bytes as JSON, %s recipients' % (
+            restaurant_id, len(data), len(dumps(data).encode('utf-8')), recipients))
+        result_dict = {}
+        for name, function in [('per socket', per_socket), ('encoded once', encoded_once)]:
+            start = time.process_time()
+            for index in range(repeat):
+                function()
+            elapsed = (time.process_time() - start) / repeat
+            result_dict[name] = elapsed
+            self.stdout.write('  %-14s %8.3f ms per broadcast %8.3f ms per recipient' % (
+                name, elapsed * 1000, elapsed * 1000 / recipients))
+        if result_dict['encoded once']:
+            self.stdout.write(self.style.SUCCESS('%.1fx less CPU per broadcast' % (
+                result_dict['per socket'] / result_dict['encoded once'])))
@@ -0,0 +1,191 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from restaurant.libs.discount_index import invalidate_discount_index
+from restaurant.libs.price_list import invalidate_price_list
+from restaurant.management.pricing_reference import reference_calculate_price
+from restaurant.models import (Discount, Food, FoodCategory, FoodExtra, FoodExtraType, FoodOption,
+                               FoodOptionType, FoodOrder, OrderedItem, ParentCompanyPromotion,
+                               PromoCodePromotion, Restaurant, Table)
+from utils.calculate_price import compute_price, compute_prices
+
+ITEM_STATUS_LIST = ['0_ORDER_INITIALIZED', '1_ORDER_PLACED',
+                    '2_ORDER_CONFIRMED', '3_IN_TABLE', '4_CANCELLED']
+
+# (vat on original price, service charge on original price, service charge is percentage)
+RESTAURANT_CONFIG_LIST = [
+    (True, True, True),
+    (True, True, False),
+    (False, False, True),
+    (True, False, False),
+    (False, True, True),
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the pricing engine against the reference implementation on synthetic orders, rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=20,
+                            help='orders per restaurant configuration')
+        parser.add_argument('--min-items', type=int, default=1)
+        parser.add_argument('--max-items', type=int, default=12)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.restaurant_id_list = []
+
+        # nothing is kept, the results are checked against the reference in restaurant.tests.PricingTest
+        try:
+            with transaction.atomic():
+                food_order_id_list = self.create_synthetic_orders(options)
+                self.stdout.write('%s synthetic orders, %s to %s items each' % (
+                    len(food_order_id_list), options['min_items'], options['max_items']))
+                for include_initial_order in [False, True]:
+                    self.benchmark(food_order_id_list, include_initial_order)
+                transaction.set_rollback(True)
+        finally:
+            # synthetic ids may be reused once rolled back
+            for restaurant_id in self.restaurant_id_list:
+                invalidate_discount_index(restaurant_id)
+                invalidate_price_list(restaurant_id)
+
+    def create_synthetic_orders(self, options):
+        now = timezone.now()
+        today = timezone.datetime.now().date()
+        option_type_qs = FoodOptionType.objects.create(name='benchmark')
+        extra_type_qs = FoodExtraType.objects.create(name='benchmark')
+        category_qs = FoodCategory.objects.create(name='benchmark')
+        suffix = uuid.uuid4().hex[:8]
+
+        food_order_id_list = []
+        for vat_on_original, service_on_original, service_is_percentage in RESTAURANT_CONFIG_LIST:
+            restaurant_qs = Restaurant.objects.create(
+                name='benchmark', subscription_ends=today + timedelta(days=30),
+                service_charge_is_percentage=service_is_percentage,
+                service_charge=self.random.choice([0, 5, 7.5, 40]),
+                tax_percentage=self.random.choice([0, 5, 7.5, 15]),
+                is_vat_charge_apply_in_original_food_price=vat_on_original,
+                is_service_charge_apply_in_original_food_price=service_on_original,
+            )
+            self.restaurant_id_list.append(restaurant_qs.pk)
+
+            discount_list = [
+                None,
+                Discount.objects.create(
+                    name='date active', restaurant=restaurant_qs, amount=10, discount_schedule_type='Date_wise',
+                    start_date=now - timedelta(days=3), end_date=now + timedelta(days=3)),
+                Discount.objects.create(
+                    name='date expired', restaurant=restaurant_qs, amount=20, discount_schedule_type='Date_wise',
+                    start_date=now - timedelta(days=9), end_date=now - timedelta(days=2)),
+                Discount.objects.create(
+                    name='time active', restaurant=restaurant_qs, amount=15, discount_schedule_type='Time_wise',
+                    start_date=now, discount_slot_start_time=(now - timedelta(minutes=30)).time(),
+                    discount_slot_closing_time=(now + timedelta(minutes=30)).time()),
+                Discount.objects.create(
+                    name='time inactive', restaurant=restaurant_qs, amount=25, discount_schedule_type='Time_wise',
+                    start_date=now, discount_slot_start_time=(now + timedelta(hours=2)).time(),
+                    discount_slot_closing_time=(now + timedelta(hours=3)).time()),
+            ]
+
+            food_list = []
+            for index in range(12):
+                food_qs = Food.objects.create(
+                    name='benchmark %s' % index, restaurant=restaurant_qs, category=category_qs,
+                    discount=self.random.choice(discount_list))
+                for option_index in range(self.random.randint(1, 3)):
+                    FoodOption.objects.create(
+                        name='option %s' % option_index, food=food_qs, option_type=option_type_qs,
+                        price=round(self.random.uniform(20, 600), self.random.choice([0, 2])))
+                for extra_index in range(self.random.randint(0, 3)):
+                    FoodExtra.objects.create(
+                        name='extra %s' % extra_index, food=food_qs, extra_type=extra_type_qs,
+                        price=round(self.random.uniform(5, 80), self.random.choice([0, 2])))
+                food_list.append(food_qs)
+
+            parent_promotion_qs = ParentCompanyPromotion.objects.create(
+                code='BENCH-PARENT-%s-%s' % (restaurant_qs.pk, suffix), promo_type='PERCENTAGE',
+                start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+                max_amount=150, minimum_purchase_amount=300, amount=12)
+            parent_promotion_qs.restaurant.add(restaurant_qs)
+            promo_code_list = [
+                None,
+                parent_promotion_qs.code,
+                PromoCodePromotion.objects.create(
+                    code='BENCH-PROMO-%s-%s' % (restaurant_qs.pk, suffix), promo_type='AMOUNT',
+                    start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+                    max_amount=80, minimum_purchase_amount=0, amount=50, restaurant=restaurant_qs).code,
+                PromoCodePromotion.objects.create(
+                    code='BENCH-EXPIRED-%s-%s' % (restaurant_qs.pk, suffix), promo_type='PERCENTAGE',
+                    start_date=now - timedelta(days=9), end_date=now - timedelta(days=1),
+                    max_amount=80, minimum_purchase_amount=0, amount=50, restaurant=restaurant_qs).code,
+                'BENCH-UNKNOWN-%s' % suffix,
+            ]
+
+            for index in range(options['orders']):
+                table_qs = Table.objects.create(
+                    restaurant=restaurant_qs, table_no=index, is_occupied=True)
+                discount_given = self.random.choice(
+                    [None, None, 0, 10, 25, 100.5])
+                food_order_qs = FoodOrder.objects.create(
+                    table=table_qs, restaurant=restaurant_qs, status='3_IN_TABLE',
+                    applied_promo_code=self.random.choice(promo_code_list),
+                    discount_given=discount_given,
+                    discount_amount_is_percentage=self.random.choice([True, False]),
+                    cash_received=self.random.choice([None, 0, 100, 5000]),
+                )
+                for item_index in range(self.random.randint(options['min_items'], options['max_items'])):
+                    food_qs = self.random.choice(food_list)
+                    ordered_item_qs = OrderedItem.objects.create(
+                        quantity=self.random.randint(1, 4), food_order=food_order_qs,
+                        food_option=self.random.choice(list(food_qs.food_options.all())),
+                        status=self.random.choice(ITEM_STATUS_LIST))
+                    food_extra_list = list(food_qs.food_extras.all())
+                    if food_extra_list:
+                        ordered_item_qs.food_extra.set(self.random.sample(
+                            food_extra_list, self.random.randint(0, len(food_extra_list))))
+                food_order_id_list.append(food_order_qs.pk)
+        return food_order_id_list
+
+    def measure(self, name, function, order_count):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+        self.stdout.write('  %-16s %8.2f queries/order %8.3f ms/order' % (
+            name, len(context.captured_queries) / order_count, elapsed * 1000 / order_count))
+        return result
+
+    def benchmark(self, food_order_id_list, include_initial_order):
+        self.stdout.write('include_initial_order=%s' % include_initial_order)
+        order_count = len(food_order_id_list)
+
+        food_order_list = list(
+            FoodOrder.objects.filter(pk__in=food_order_id_list).order_by('pk'))
+        self.measure('reference', lambda: [
+            reference_calculate_price(
+                food_order, include_initial_order=include_initial_order)
+            for food_order in food_order_list
+        ], order_count)
+
+        food_order_list = list(
+            FoodOrder.objects.filter(pk__in=food_order_id_list).order_by('pk'))
+        self.measure('compute_price', lambda: [
+            compute_price(
+                food_order, include_initial_order=include_initial_order).to_dict()
+            for food_order in food_order_list
+        ], order_count)
+
+        self.measure('compute_prices', lambda: [
+            price.to_dict() for price in compute_prices(
+                FoodOrder.objects.filter(pk__in=food_order_id_list),
+                include_initial_order=include_initial_order).values()
+        ], order_count)
@@ -0,0 +1,72 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from rest_framework.renderers import JSONRenderer
+
+from restaurant.libs.board_state import board_snapshot
+from restaurant.libs.invoice_json import invoice_records, invoice_rows
+from restaurant.models import Food, FoodOrder, Invoice, Restaurant
+from restaurant.serializers import FoodsByCategorySerializer, InvoiceSerializer
+from utils.renderers import FastJSONRenderer
+from utils.response_wrapper import ResponseWrapper
+
+
+class Command(BaseCommand):
+    help = 'Compare JSONRenderer and FastJSONRenderer time and output on board, menu, invoice and report responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int,
+                            help='restaurant to render, the one with most invoices by default')
+        parser.add_argument('--invoices', type=int, default=100,
+                            help='invoices in the invoice history page')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        restaurant_id = options['restaurant']
+        if not restaurant_id:
+            restaurant_id = Restaurant.objects.annotate(
+                invoice_count=Count('invoice')).order_by('-invoice_count').values_list('pk', flat=True).first()
+        if not restaurant_id:
+            raise CommandError('no restaurant to benchmark')
+
+        invoice_qs = Invoice.objects.filter(
+            restaurant_id=restaurant_id).order_by('-updated_at')[:options['invoices']]
+        # (name, data rendered by JSONRenderer, data rendered by FastJSONRenderer)
+        payload_list = [
+            ('board snapshot', lambda: board_snapshot(restaurant_id), None),
+            ('menu by category', lambda: FoodsByCategorySerializer(
+                instance=Food.objects.filter(restaurant_id=restaurant_id).select_related('category'),
+                many=True).data, None),
+            # the serializer path the invoice lists took before, against the raw json rows
+            ('invoice history', lambda: InvoiceSerializer(instance=invoice_qs.all(), many=True).data,
+             lambda: invoice_records(invoice_rows(invoice_qs.all()))),
+            # lazy values_list results with datetimes returned as they are
+            ('order report', lambda: FoodOrder.objects.filter(restaurant_id=restaurant_id).filter(
+                ~Q(status='6_CANCELLED')).values_list('pk', 'order_no', 'payable_amount', 'created_at'), None),
+        ]
+
+        self.stdout.write('restaurant %s' % restaurant_id)
+        error_list = []
+        for name, build_data, build_fast_data in payload_list:
+            build_fast_data = build_fast_data or build_data
+            result_list = []
+            for renderer, build in [(JSONRenderer(), build_data), (FastJSONRenderer(), build_fast_data)]:
+                data = ResponseWrapper(data=build(), msg='success').data
+                start = time.process_time()
+                for index in range(options['repeat']):
+                    content = renderer.render(data)
+                elapsed = (time.process_time() - start) / options['repeat']
+                result_list.append((content, elapsed))
+
+            (content, elapsed), (fast_content, fast_elapsed) = result_list
+            if json.loads(content) != json.loads(fast_content):
+                error_list.append('%s: FastJSONRenderer output differs' % name)
+            self.stdout.write('  %-18s %9s bytes %8.3f ms, fast %9s bytes %8.3f ms %6.1fx' % (
+                name, len(content), elapsed * 1000, len(fast_content), fast_elapsed * 1000,
+                elapsed / fast_elapsed if fast_elapsed else 0))
+
+        if error_list:
+            raise CommandError('\n'.join(error_list))
+        self.stdout.write(self.style.SUCCESS('FastJSONRenderer output matches JSONRenderer'))
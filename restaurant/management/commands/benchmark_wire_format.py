@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+
+from restaurant.libs.board_state import board_delta, board_snapshot, waiter_boards
+from restaurant.libs.wire_format import WIRE_ENCODING_LIST, encode_frame
+from restaurant.models import Restaurant, Table
+from utils.fast_json import dumps
+
+
+class Command(BaseCommand):
+    help = 'Compare the websocket frame size and encoding time of a board in every wire encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int,
+                            help='board to encode, the restaurant with most open orders by default')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        restaurant_id = options['restaurant']
+        if not restaurant_id:
+            restaurant_id = Restaurant.objects.annotate(open_order_count=Count(
+                'food_orders', filter=~Q(food_orders__status__in=['5_PAID', '6_CANCELLED']))
+            ).order_by('-open_order_count').values_list('pk', flat=True).first()
+        if not restaurant_id:
+            raise CommandError('no restaurant to benchmark')
+
+        data = board_snapshot(restaurant_id)
+        frame_list = [('board snapshot', {'type': 'snapshot', 'seq': 1, 'version': 1, 'data': data})]
+        table_id = next((record['table'] for record in data if 'id' in record), None)
+        if table_id:
+            frame_list.append(('table delta', {'type': 'delta', 'seq': 2, 'version': 2,
+                                               'data': board_delta(restaurant_id, [table_id])}))
+        staff_id = Table.staff_assigned.through.objects.filter(
+            table__restaurant_id=restaurant_id).values_list('hotelstaffinformation_id', flat=True).first()
+        if staff_id:
+            frame_list.append(('waiter view', {'seq': 3, 'data': waiter_boards(
+                restaurant_id, [staff_id])[staff_id]}))
+
+        self.stdout.write('restaurant %s: %s board records' % (restaurant_id, len(data)))
+        for name, frame in frame_list:
+            text = dumps(frame)
+            json_size = len(text.encode('utf-8'))
+            self.stdout.write(name)
+            for encoding in WIRE_ENCODING_LIST:
+                if encoding == 'json':
+                    size, elapsed = json_size, 0
+                else:
+                    start = time.process_time()
+                    for index in range(options['repeat']):
+                        # the cache would answer every repeat after the first
+                        encode_frame.__wrapped__(text, encoding)
+                    elapsed = (time.process_time() - start) / options['repeat']
+                    size = len(encode_frame(text, encoding))
+                self.stdout.write('  %-16s %9s bytes %6.1f%% %8.3f ms to encode' % (
+                    encoding, size, size * 100 / json_size, elapsed * 1000))
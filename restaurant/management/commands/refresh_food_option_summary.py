@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from restaurant.libs.option_summary import refresh_option_summary, with_option_summary
+from restaurant.models import Food
+
+
+class Command(BaseCommand):
+    help = 'Recompute Food.min_price and Food.option_count where they differ from the food options'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int,
+                            help='only the foods of this restaurant')
+
+    def handle(self, *args, **options):
+        food_qs = with_option_summary(Food.raw_objects.all())
+        if options['restaurant']:
+            food_qs = food_qs.filter(restaurant_id=options['restaurant'])
+        # option changes made with queryset updates do not reach the signals
+        stale_food_id_list = list(food_qs.filter(
+            ~Q(option_total=F('option_count')) |
+            ~Q(option_min_price=F('min_price')) |
+            Q(option_min_price__isnull=True, min_price__isnull=False) |
+            Q(option_min_price__isnull=False, min_price__isnull=True)
+        ).values_list('pk', flat=True))
+        updated = refresh_option_summary(stale_food_id_list) if stale_food_id_list else 0
+        self.stdout.write(self.style.SUCCESS('%s foods updated' % updated))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.models import FoodOrder
+from utils.calculate_price import STORED_PRICE_FIELDS, compute_prices, persist_price
+
+TOLERANCE = 0.000001
+
+
+class Command(BaseCommand):
+    help = 'Compare the stored order totals with a full recompute and optionally repair them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int,
+                            help='only check orders of this restaurant')
+        parser.add_argument('--all', action='store_true',
+                            help='check paid and cancelled orders too')
+        parser.add_argument('--fix', action='store_true',
+                            help='store the recomputed totals on mismatching orders')
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        food_order_qs = FoodOrder.objects.all().order_by('pk')
+        if options['restaurant']:
+            food_order_qs = food_order_qs.filter(
+                restaurant_id=options['restaurant'])
+        if not options['all']:
+            food_order_qs = food_order_qs.exclude(
+                status__in=['5_PAID', '6_CANCELLED'])
+
+        food_order_id_list = list(food_order_qs.values_list('pk', flat=True))
+        chunk_size = options['chunk_size']
+        checked = 0
+        mismatched = 0
+        for index in range(0, len(food_order_id_list), chunk_size):
+            food_order_list = list(FoodOrder.objects.filter(
+                pk__in=food_order_id_list[index:index + chunk_size]).select_related('restaurant'))
+            price_dict = compute_prices(food_order_list)
+            for food_order in food_order_list:
+                price = price_dict.get(food_order.pk)
+                if price is None:
+                    continue
+                checked += 1
+                changed_fields = self.get_changed_fields(food_order, price)
+                if not changed_fields:
+                    continue
+                mismatched += 1
+                self.stdout.write('order %s: %s' % (
+                    food_order.pk, ', '.join(changed_fields)))
+                if options['fix']:
+                    persist_price(food_order, price)
+
+        self.stdout.write(self.style.SUCCESS(
+            '%s orders checked, %s mismatched%s' % (
+                checked, mismatched, ', repaired' if options['fix'] and mismatched else '')))
+
+    def get_changed_fields(self, food_order, price):
+        changed_fields = []
+        price_dict = price.to_dict()
+        for field_name in STORED_PRICE_FIELDS:
+            if getattr(food_order, field_name) != price_dict.get(field_name):
+                changed_fields.append(field_name)
+        for field_name in ['items_subtotal', 'items_discount']:
+            stored_value = getattr(food_order, field_name)
+            if stored_value is None or abs(stored_value - getattr(price, field_name)) > TOLERANCE:
+                changed_fields.append(field_name)
+        return changed_fields
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.4 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0083_auto_20210323_1343'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodorder',
+            name='items_discount',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foodorder',
+            name='items_subtotal',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.4 on 2026-10-18 11:07
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Q
+
+
+def fill_food_option_summary(apps, schema_editor):
+    Food = apps.get_model('restaurant', 'Food')
+    FoodOption = apps.get_model('restaurant', 'FoodOption')
+    option_summary_list = FoodOption.objects.filter(deleted_at__isnull=True).values('food_id').annotate(
+        min_price=Min('price'), option_count=Count('pk')).order_by()
+    food_list = []
+    for option_summary in option_summary_list:
+        food_list.append(Food(pk=option_summary['food_id'], min_price=option_summary['min_price'],
+                              option_count=option_summary['option_count']))
+    Food.objects.bulk_update(food_list, ['min_price', 'option_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0084_auto_20261018_1040'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='min_price',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='option_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_food_option_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.1.4 on 2026-10-18 11:09
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Restaurant = apps.get_model('restaurant', 'Restaurant')
+    Food = apps.get_model('restaurant', 'Food')
+    Review = apps.get_model('restaurant', 'Review')
+    # restaurants as RestaurantSerializer.get_review counted them, reviews of deleted orders left out
+    restaurant_rating_list = Review.objects.filter(
+        order__isnull=False, order__deleted_at__isnull=True
+    ).values('order__restaurant_id').annotate(rating_sum=Sum('rating'), rating_count=Count('pk')).order_by()
+    restaurant_list = []
+    for restaurant_rating in restaurant_rating_list:
+        if restaurant_rating['order__restaurant_id']:
+            restaurant_list.append(Restaurant(pk=restaurant_rating['order__restaurant_id'],
+                                              rating_sum=restaurant_rating['rating_sum'] or 0,
+                                              rating_count=restaurant_rating['rating_count']))
+    Restaurant.objects.bulk_update(restaurant_list, ['rating_sum', 'rating_count'], batch_size=500)
+
+    # foods keep the running average and order_counter the review view kept so far
+    food_list = []
+    for food_id, rating, order_counter in Food.objects.filter(
+            rating__isnull=False, order_counter__gt=0).values_list('pk', 'rating', 'order_counter'):
+        food_list.append(Food(pk=food_id, rating_sum=round(rating * order_counter)))
+    Food.objects.bulk_update(food_list, ['rating_sum'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0085_food_option_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
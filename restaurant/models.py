@@ -71,6 +71,9 @@ class Restaurant(SoftDeleteModel):
         to='restaurant.PaymentType', blank=True)
     is_service_charge_apply_in_original_food_price = models.BooleanField(default=False)
     is_vat_charge_apply_in_original_food_price = models.BooleanField(default=False)
+    # ratings of the reviews on the restaurant orders, kept up to date on review changes
+    rating_sum = models.IntegerField(default=0, editable=False)
+    rating_count = models.IntegerField(default=0, editable=False)
 
     def __str__(self):
         if self.name:
@@ -121,11 +124,16 @@ class Food(SoftDeleteModel):
     is_recommended = models.BooleanField(default=False)
     ingredients = models.TextField(null=True, blank=True)
     rating = models.FloatField(null=True, blank=True)
+    # rating is rating_sum / order_counter, the reviews of the orders with this food
+    rating_sum = models.IntegerField(default=0, editable=False)
     order_counter = models.IntegerField(default=0)
     is_available = models.BooleanField(default=True)
     is_vat_applicable = models.BooleanField(default=True)
     discount = models.ForeignKey(
         to="restaurant.Discount", null=True, blank=True, on_delete=models.SET_NULL, related_name='foods')
+    # cheapest option price and number of options, kept up to date on food option changes
+    min_price = models.FloatField(null=True, blank=True, editable=False)
+    option_count = models.IntegerField(default=0, editable=False)
 
     # def __str__(self):
     #     return self.name
@@ -218,6 +226,9 @@ class FoodOrder(SoftDeleteModel):
     tax_percentage = models.FloatField(null=True, blank=True, default=0)
     service_charge = models.FloatField(null=True, blank=True, default=0)
     payable_amount = models.FloatField(null=True, blank=True, default=0)
+    # running sums of the counted ordered items, updated per changed line
+    items_subtotal = models.FloatField(null=True, blank=True)
+    items_discount = models.FloatField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
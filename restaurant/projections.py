@@ -0,0 +1,103 @@
+from rest_framework import serializers
+
+from account_management.models import HotelStaffInformation
+from utils.projection import Field, Many, Projection, file_url
+
+from .models import Food, FoodCategory, Table
+
+# values() based read paths with the same output as the serializers they are named after
+
+datetime_field = serializers.DateTimeField()
+time_field = serializers.TimeField()
+
+free_table_projection = Projection({
+    'id': 'id',
+    'table_no': 'table_no',
+})
+
+# StaffInfoGetSerializer
+staff_info_field_dict = {
+    'id': 'id',
+    'first_name': 'user__first_name',
+    'name': 'name',
+    'user': {
+        'phone': 'user__phone',
+        'first_name': 'user__first_name',
+        'id': 'user__id',
+    },
+    'image': Field('image', file_url(HotelStaffInformation, 'image')),
+    'is_manager': 'is_manager',
+    'is_owner': 'is_owner',
+    'is_waiter': 'is_waiter',
+    'shift_start': Field('shift_start', time_field.to_representation),
+    'shift_end': Field('shift_end', time_field.to_representation),
+    'nid': 'nid',
+    'restaurant': 'restaurant',
+    'phone': 'user__phone',
+    'tables': Many(Table, 'pk', 'staff_assigned'),
+    'table_no': Many(Table, 'table_no', 'staff_assigned'),
+    'email': 'email',
+}
+
+# TableSerializer
+table_projection = Projection({
+    'id': 'id',
+    'staff_assigned': Many(HotelStaffInformation, staff_info_field_dict, 'tables'),
+    'table_no': 'table_no',
+    'name': 'name',
+    'is_occupied': 'is_occupied',
+    'restaurant': 'restaurant',
+})
+
+customer_order_details_projection = Projection({
+    'order_id': 'id',
+    'restaurant_name': 'restaurant__name',
+    'payable_amount': 'payable_amount',
+    'created_at': Field('created_at', datetime_field.to_representation),
+    'order_no': 'order_no',
+})
+
+# FoodWithPriceSerializer, price is food_min_price() of the stored min_price
+food_with_price_projection = Projection({
+    'name': 'name',
+    'image': Field('image', file_url(Food, 'image')),
+    'description': 'description',
+    'restaurant': 'restaurant',
+    'is_top': 'is_top',
+    'is_recommended': 'is_recommended',
+    'price': Field('min_price', lambda min_price: round(min_price, 2)),
+    'ingredients': 'ingredients',
+    'category': 'category',
+    'id': 'id',
+    'discount': 'discount',
+    'rating': 'rating',
+    'order_counter': 'order_counter',
+})
+
+category_image_url = file_url(FoodCategory, 'image')
+
+
+def foods_by_category(food_qs):
+    """
+    FoodsByCategorySerializer output of the foods: categories and foods ordered by pk,
+    foods without a category or with a soft deleted one left out
+    """
+    food_dict = {food['id']: food for food in food_with_price_projection.rows(food_qs)}
+    category_id_list = set(food['category'] for food in food_dict.values())
+    category_qs = FoodCategory.objects.filter(
+        pk__in=[category_id for category_id in category_id_list if category_id is not None]
+    ).order_by('pk').values('pk', 'name', 'image')
+
+    category_food_dict = {}
+    for food_id in sorted(food_dict.keys()):
+        category_food_dict.setdefault(
+            food_dict[food_id]['category'], []).append(food_dict[food_id])
+    return [
+        {
+            'foods': category_food_dict[category['pk']],
+            'name': category['name'],
+            'id': category['pk'],
+            'image': category_image_url(category['image']),
+        }
+        for category in category_qs
+    ]
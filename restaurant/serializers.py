@@ -6,8 +6,15 @@ from account_management.models import FcmNotificationStaff, HotelStaffInformatio
 from account_management.serializers import StaffInfoGetSerializer
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
-from utils.calculate_price import calculate_item_price_with_discount, calculate_price
-
+from utils.calculate_price import calculate_item_price_with_discount, compute_price, compute_prices
+
+from .libs.action_objects import resolve_action_objects
+from .libs.menu_snapshot import next_menu_version
+from .libs.option_summary import food_min_price
+from .libs.order_prefetch import WAITER_LOG_STATUS_LIST
+from .libs.price_list import get_context_price_list, invalidate_price_list
+from .libs.review_rating import rating_summary
+from .libs.table_summary import running_order_summaries
 from .models import *
 from actstream.models import Action
 
@@ -35,20 +42,37 @@ class FoodExtraSerializer(serializers.ModelSerializer):
         exclude = ['deleted_at']
 
 
+def group_by_related(iterable, field_name):
+    """
+    [(related object, [objects])] ordered by pk, grouped in memory from one result set,
+    soft deleted related objects are left out as FoodCategory.objects / FoodExtraType.objects would
+    """
+    if isinstance(iterable, models.QuerySet) and iterable._result_cache is None:
+        iterable = iterable.select_related(field_name)
+    group_dict = {}
+    for obj in {obj.pk: obj for obj in iterable}.values():
+        related_obj = getattr(obj, field_name)
+        if related_obj is None or related_obj.deleted_at:
+            continue
+        group_dict.setdefault(related_obj.pk, (related_obj, []))[1].append(obj)
+    return [
+        (related_obj, sorted(obj_list, key=lambda obj: obj.pk))
+        for related_obj, obj_list in sorted(group_dict.values(), key=lambda group: group[0].pk)
+    ]
+
+
 class FoodExtraGroupByListSerializer(serializers.ListSerializer):
 
     def to_representation(self, data):
         iterable = data.all() if isinstance(data, models.Manager) else data
         return [
             {'extras': super(FoodExtraGroupByListSerializer, self).to_representation(
-                FoodExtra.objects.filter(extra_type=extra_type, pk__in=list(
-                    data.values_list('id', flat=True)
-                ))
+                extra_list
             ),
                 'type_name': extra_type.name,
                 'type_id': extra_type.pk
             }
-            for extra_type in FoodExtraType.objects.filter(pk__in=list(data.values_list('extra_type_id', flat=True)))
+            for extra_type, extra_list in group_by_related(iterable, 'extra_type')
         ]
 
     # def to_representation(self, data):
@@ -162,14 +186,8 @@ class RestaurantSerializer(serializers.ModelSerializer):
         exclude = ['deleted_at']
 
     def get_review(self, obj):
-        review_qs = None
-        if obj.food_orders:
-
-            reviews_list = list(
-                filter(None, obj.food_orders.values_list('reviews__rating', flat=True)))
-            if reviews_list:
-                return {'value': sum(reviews_list) / reviews_list.__len__(), 'total_reviewers': reviews_list.__len__()}
-        return {'value': None, 'total_reviewers': 0}
+        # aggregates maintained by restaurant.libs.review_rating
+        return rating_summary(obj.rating_sum, obj.rating_count)
 
 
 class TableSerializer(serializers.ModelSerializer):
@@ -254,7 +272,9 @@ class OrderedItemGetDetailsSerializer(serializers.ModelSerializer):
         ordering = ['id']
 
     def get_price(self, obj):
-        return calculate_item_price_with_discount(ordered_item_qs=obj)
+        price_list = get_context_price_list(
+            self.context, obj.food_option.food.restaurant_id)
+        return calculate_item_price_with_discount(ordered_item_qs=obj, price_list=price_list)
 
     def get_category_name(self, obj):
         try:
@@ -348,6 +368,17 @@ class FreeTableSerializer(serializers.ModelSerializer):
         fields = ['id', 'table_no']
 
 
+class FoodOrderListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        food_order_list = list(iterable)
+        # price every order in one go instead of once per order
+        self.order_prices = compute_prices(
+            food_order_list, include_initial_order=self.context.get('calculate_price_with_initial_item', False))
+        return super(FoodOrderListSerializer, self).to_representation(food_order_list)
+
+
 class FoodOrderByTableSerializer(serializers.ModelSerializer):
     status_details = serializers.CharField(source='get_status_display')
     # payment_method = serializers.CharField(source='payment_method.name')
@@ -390,41 +421,47 @@ class FoodOrderByTableSerializer(serializers.ModelSerializer):
                   #   "payable_amount",
                   ]
         read_only_fields = ('applied_promo_code',)
+        list_serializer_class = FoodOrderListSerializer
         # ordering = ['table']
 
     def get_ordered_items(self, obj):
         is_apps = self.context.get('is_apps', False)
         request = self.context.get('request')
+        excluded_status_list = []
         if is_apps:
             if request:
                 is_waiter_app = request.path.__contains__('/apps/waiter/')
                 is_customer_app = request.path.__contains__('/apps/customer/')
                 if is_customer_app:
-                    qs = obj.ordered_items.exclude(
-                        status__in=['4_CANCELLED'])
+                    excluded_status_list = ['4_CANCELLED']
                 elif is_waiter_app:
-                    qs = obj.ordered_items.exclude(
-                        status__in=['4_CANCELLED', '0_ORDER_INITIALIZED'])
+                    excluded_status_list = [
+                        '4_CANCELLED', '0_ORDER_INITIALIZED']
                 else:
-                    qs = obj.ordered_items.exclude(
-                        status__in=['4_CANCELLED'])
+                    excluded_status_list = ['4_CANCELLED']
             else:
-                qs = obj.ordered_items.exclude(
-                    status__in=['4_CANCELLED'])
-        else:
-            qs = obj.ordered_items
+                excluded_status_list = ['4_CANCELLED']
 
+        # filtered in memory so the items prefetched by prefetch_order_details are used
+        qs = [
+            ordered_item for ordered_item in obj.ordered_items.all()
+            if ordered_item.status not in excluded_status_list
+        ]
+        # only the price lists are shared, the request would turn food_image into an absolute url
         serializer = OrderedItemGetDetailsSerializer(
-            instance=qs, many=True)
+            instance=qs, many=True, context={'price_lists': self.context.setdefault('price_lists', {})})
 
         return serializer.data
 
         # OrderedItemGetDetailsSerializer(many=True, read_only=True)
 
     def get_price(self, obj):
+        order_prices = getattr(self.parent, 'order_prices', {})
+        if obj.pk in order_prices:
+            return order_prices[obj.pk].to_dict()
         calculate_price_with_initial_item = self.context.get(
             'calculate_price_with_initial_item', False)
-        return calculate_price(food_order_obj=obj, include_initial_order=calculate_price_with_initial_item)
+        return compute_price(food_order_obj=obj, include_initial_order=calculate_price_with_initial_item).to_dict()
 
     def get_customer(self, obj):
         if obj.customer:
@@ -433,8 +470,12 @@ class FoodOrderByTableSerializer(serializers.ModelSerializer):
             return None
 
     def get_waiter(self, obj):
-        food_order_log_qs = obj.food_order_logs.filter(
-            order_status__in=["5_PAID", "4_CREATE_INVOICE"]).order_by('-created_at').first()
+        waiter_log_list = getattr(obj, 'waiter_logs', None)
+        if waiter_log_list is not None:
+            food_order_log_qs = waiter_log_list[0] if waiter_log_list else None
+        else:
+            food_order_log_qs = obj.food_order_logs.filter(
+                order_status__in=WAITER_LOG_STATUS_LIST).order_by('-created_at').first()
         # if obj.table:
         #     qs = obj.table.staff_assigned.filter(is_waiter=True).first()
         #     if qs:
@@ -450,7 +491,8 @@ class FoodOrderByTableSerializer(serializers.ModelSerializer):
             restaurant_qs = obj.table.restaurant
 
         else:
-            ordered_items_qs = obj.ordered_items.first()
+            ordered_items_qs = min(
+                obj.ordered_items.all(), key=lambda ordered_item: ordered_item.pk, default=None)
             if ordered_items_qs:
                 restaurant_qs = ordered_items_qs.food_option.food.restaurant
 
@@ -524,7 +566,10 @@ class FoodOrderForStaffSerializer(serializers.ModelSerializer):
     # def get_status(self, obj):
     #     return obj.get_status_display()
     def get_price(self, obj):
-        return calculate_price(food_order_obj=obj)
+        order_prices = self.context.get('order_prices', {})
+        if obj.pk in order_prices:
+            return order_prices[obj.pk].to_dict()
+        return compute_price(food_order_obj=obj).to_dict()
 
 
 class FoodOrderUserPostSerializer(serializers.ModelSerializer):
@@ -621,11 +666,7 @@ class FoodWithPriceSerializer(serializers.ModelSerializer):
 
     # }
     def get_price(self, obj):
-        option_qs = obj.food_options.order_by('price').first()
-        if option_qs:
-            return round(option_qs.price, 2)
-        else:
-            return None
+        return food_min_price(obj)
 
     def create(self, validated_data):
         image = validated_data.pop('image', None)
@@ -641,11 +682,7 @@ class FoodGroupByCategoryListSerializer(serializers.ListSerializer):
         return [
             {
                 'foods': super(FoodGroupByCategoryListSerializer, self).to_representation(
-                    Food.objects.filter(
-                        category=obj, pk__in=list(
-                            data.values_list('id', flat=True)
-                        )
-                    )
+                    food_list
                 ),
                 'name': obj.name,
                 'id': obj.pk,
@@ -655,7 +692,7 @@ class FoodGroupByCategoryListSerializer(serializers.ListSerializer):
                 # 'image': obj.image   .update(dict(FoodCategorySerializer(obj).data))
 
             }
-            for obj in FoodCategory.objects.filter(pk__in=list(data.values_list('category_id', flat=True)))
+            for obj, food_list in group_by_related(iterable, 'category')
         ]
 
 
@@ -699,13 +736,13 @@ class FoodDetailSerializer(serializers.ModelSerializer):
         ]
 
     def get_price(self, obj):
-        option_qs = obj.food_options.order_by('price').first()
-        if option_qs:
-            return round(option_qs.price, 2)
-        else:
-            return None
+        return food_min_price(obj)
 
     def get_food_options(self, obj):
+        food_price_dict = get_context_price_list(
+            self.context, obj.restaurant_id)['foods'].get(obj.pk)
+        if food_price_dict:
+            return food_price_dict['food_options']
         serializer = FoodOptionSerializer(
             obj.food_options.order_by('price'), many=True)
         return serializer.data
@@ -767,6 +804,19 @@ class HotelStaffInformationSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class TableStaffListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        table_list = list(iterable)
+        occupied_table_id_list = [
+            table.pk for table in table_list if table.is_occupied]
+        # latest running order of every occupied table with its item counts and price
+        self.running_orders, self.order_prices = running_order_summaries(
+            occupied_table_id_list)
+        return super(TableStaffListSerializer, self).to_representation(table_list)
+
+
 class TableStaffSerializer(serializers.ModelSerializer):
     # staff_assigned = StaffInfoGetSerializer(read_only=True, many=True)
     # order_item = OrderedItemSerializer(read_only=True, many=True)
@@ -778,31 +828,34 @@ class TableStaffSerializer(serializers.ModelSerializer):
         model = Table
         fields = ['table_no', 'restaurant',
                   'is_occupied', 'name', 'order_info', 'id']
+        list_serializer_class = TableStaffListSerializer
 
     def get_order_info(self, obj):
-        total_items = 0
-        total_served_items = 0
-
         if obj.is_occupied:
-            order_qs = obj.food_orders.exclude(
-                status__in=["5_PAID", "6_CANCELLED"]).order_by('-id').first()
+            running_orders = getattr(self.parent, 'running_orders', None)
+            order_prices = getattr(self.parent, 'order_prices', None)
+            if running_orders is None:
+                running_orders, order_prices = running_order_summaries(
+                    [obj.pk])
+            order_qs = running_orders.get(obj.pk)
+            # order_qs = obj.food_orders.exclude(
+            #     status__in=["5_PAID", "6_CANCELLED"]).order_by('-id').first()
             # item_qs = OrderedItem.objects.filter(food_order=order_qs)
 
             if not order_qs:
                 return {}
 
-            total_items += order_qs.ordered_items.exclude(
-                status='4_CANCELLED').count()
-
-            if order_qs:
-                total_served_items += order_qs.ordered_items.filter(
-                    status='3_IN_TABLE').count()
-            serializer = FoodOrderForStaffSerializer(order_qs)
+            # total_items += order_qs.ordered_items.exclude(
+            #     status='4_CANCELLED').count()
+            # total_served_items += order_qs.ordered_items.filter(
+            #     status='3_IN_TABLE').count()
+            serializer = FoodOrderForStaffSerializer(order_qs, context={
+                'order_prices': order_prices})
             temp_data_dict = serializer.data
             price = temp_data_dict.pop('price', {})
             temp_data_dict.update(price)
-            temp_data_dict['total_items'] = total_items
-            temp_data_dict['total_served_items'] = total_served_items
+            temp_data_dict['total_items'] = order_qs.total_items
+            temp_data_dict['total_served_items'] = order_qs.total_served_items
             return temp_data_dict
         else:
             return {}
@@ -889,6 +942,8 @@ class DiscountPostSerializer(serializers.ModelSerializer):
         else:
             discount_qs = Discount.objects.create(**validated_data)
         Food.objects.filter(pk__in=food_id_list).update(discount=discount_qs)
+        invalidate_price_list(discount_qs.restaurant_id)
+        next_menu_version(discount_qs.restaurant_id)
         return discount_qs
 
     def update(self, instance, validated_data):
@@ -1170,6 +1225,16 @@ class OrderedItemTemplateSerializer(serializers.ModelSerializer):
 #                     'order_amaount': order_amaount
 #                     }
 
+class ServedOrderListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        # staff and orders with their tables, one query per content type
+        action_list = resolve_action_objects(
+            list(iterable), select_related_dict={FoodOrder: ['table']})
+        return super(ServedOrderListSerializer, self).to_representation(action_list)
+
+
 class ServedOrderSerializer(serializers.ModelSerializer):
     staff = serializers.SerializerMethodField(read_only=True)
     order = serializers.SerializerMethodField(read_only=True)
@@ -1178,6 +1243,7 @@ class ServedOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Action
         fields = ['staff', 'order', 'created_at']
+        list_serializer_class = ServedOrderListSerializer
 
     def get_staff(self, obj):
         if obj:
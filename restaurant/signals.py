@@ -15,11 +15,11 @@ from django.utils import timezone
 from utils.print_node import print_node
 from weasyprint import CSS, HTML
 
-from restaurant.models import Table
-from restaurant.serializers import (FoodOrderByTableSerializer,
-                                    OrderedItemTemplateSerializer, TableStaffSerializer)
+from restaurant.serializers import OrderedItemTemplateSerializer
+from restaurant.tasks import socket_fire_task_on_order_crud
 
-from .models import FoodOrder
+from .libs.board_events import queue_board_event
+from .libs.board_state import board_snapshot
 
 order_done_signal = Signal(
     providing_args=["qs", "data", "state"])
@@ -29,29 +29,11 @@ kitchen_items_print_signal = Signal(
 
 
 def order_item_list(restaurant_id=1):
-    qs = FoodOrder.objects.filter(table__restaurant=restaurant_id).exclude(
-        status__in=['5_PAID', '6_CANCELLED']).order_by('table_id')
-    ordered_table_set = set(qs.values_list('table_id', flat=True))
-    table_qs = Table.objects.filter(
-        restaurant=restaurant_id).exclude(pk__in=ordered_table_set).order_by('id')
-    empty_table_data = []
-    for empty_table in table_qs:
-        empty_table_data.append(
-            {
-                'table': empty_table.pk,
-                'table_no': empty_table.table_no,
-                'table_name': empty_table.name,
-                'status': '',
-                'price': {},
-                'ordered_items': []
-            }
-        )
-    serializer = FoodOrderByTableSerializer(instance=qs, many=True)
-    return serializer.data+empty_table_data
+    return board_snapshot(restaurant_id)
 
 
 @receiver(order_done_signal)
-def socket_fire_on_order_change_signals(sender,   restaurant_id, order_id=None, qs=None, data=None, state='data_only', **kwargs):
+def socket_fire_on_order_change_signals(sender,   restaurant_id, order_id=None, qs=None, data=None, state='data_only', table_id_list=None, **kwargs):
     """
     signal reciever for dashboard update and call websocket connections
 
@@ -65,50 +47,26 @@ def socket_fire_on_order_change_signals(sender,   restaurant_id, order_id=None,
         Table
     state : str
         [data_only]
+    table_id_list : list
+        tables changed besides the table of the order, e.g. the table an order moved from
     """
     if settings.TURN_OFF_SIGNAL:
         return
     # print('---------------------------------------------------------------------------------------------------------------')
     # print("FIRING Signals")
     # print('---------------------------------------------------------------------------------------------------------------')
+    if settings.BOARD_EVENT_WINDOW and state in ['data_only'] and not data:
+        schedule_flush = queue_board_event(
+            restaurant_id, order_id, table_id_list)
+        if schedule_flush:
+            async_task('restaurant.tasks.flush_board_events', restaurant_id)
+        if schedule_flush is not None:
+            return
     async_task('restaurant.tasks.socket_fire_task_on_order_crud',
-               restaurant_id, order_id, state, data)
+               restaurant_id, order_id, state, data, table_id_list)
     # socket_fire_task_on_order_crud(restaurant_id, order_id, state, data)
 
 
-def socket_fire_task_on_order_crud(restaurant_id, order_id, state, data):
-    response_data = {}
-    # staff_list = HotelStaffInformation.objects.filter(
-    #     restaurant_id=restaurant_id,).values_list('pk', flat=True)
-    table_qs = Table.objects.filter(restaurant_id=restaurant_id,
-                                    food_orders__id=order_id).prefetch_related('food_orders').order_by('table_no').distinct()
-    staff_list = list(table_qs.values_list('staff_assigned__pk', flat=True))
-
-    if state in ['data_only']:
-        if not data:
-            data = order_item_list(restaurant_id)
-        response_data = data
-
-    layer = channels.layers.get_channel_layer()
-    try:
-        group_name = 'restaurant_%s' % int(restaurant_id)
-
-        async_to_sync(layer.group_send)(
-            group_name, {'type': 'response_to_listener', 'data': response_data})
-        for staff_id in staff_list:
-            waiter_group_name = 'waiter_%s' % staff_id
-            qs = table_qs.filter(
-                staff_assigned=staff_id).order_by('table_no')
-            serializer = TableStaffSerializer(instance=qs, many=True)
-            async_to_sync(layer.group_send)(
-                waiter_group_name, {'type': 'response_to_listener', 'data': serializer.data})
-
-        # print('done')
-    except:
-        pass
-    # print('signal got a call', order_qs, table_qs, state)
-
-
 @receiver(kitchen_items_print_signal)
 def kitchen_items_print(sender, qs=None, *args, **kwargs):
     # items_qs = OrderedItem.objects.all().exclude(food_extra=None)
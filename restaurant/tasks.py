@@ -1,63 +1,127 @@
+import asyncio
+import logging
 
+import aioredis
 import channels.layers
 from asgiref.sync import async_to_sync
-from restaurant.serializers import FoodOrderByTableSerializer, TableStaffSerializer
-from restaurant.models import FoodOrder, Table
+from channels.exceptions import ChannelFull
+from django_q.tasks import async_task
+from redis import RedisError
+from restaurant.models import Table
+from restaurant.libs.board_events import take_board_events
+from restaurant.libs.board_state import (affected_table_ids, board_snapshot, customer_order_records,
+                                         get_board_version, invalidate_board_state, next_board_version,
+                                         update_board_state, waiter_boards)
+from restaurant.libs.presence import live_groups
+from restaurant.libs.replay import mark_stream_gap, publish_frame
+
+logger = logging.getLogger(__name__)
 
 
 def order_item_list(restaurant_id=1):
-    qs = FoodOrder.objects.filter(table__restaurant=restaurant_id).exclude(
-        status__in=['5_PAID', '6_CANCELLED']).order_by('table_id')
-    ordered_table_set = set(qs.values_list('table_id', flat=True))
-    table_qs = Table.objects.filter(
-        restaurant=restaurant_id).exclude(pk__in=ordered_table_set).order_by('id')
-    empty_table_data = []
-    for empty_table in table_qs:
-        empty_table_data.append(
-            {
-                'table': empty_table.pk,
-                'table_no': empty_table.table_no,
-                'table_name': empty_table.name,
-                'status': '',
-                'price': {},
-                'ordered_items': []
-            }
-        )
-    serializer = FoodOrderByTableSerializer(instance=qs, many=True)
-    return serializer.data+empty_table_data
-
-
-def socket_fire_task_on_order_crud(restaurant_id, order_id, state, data):
+    return board_snapshot(restaurant_id)
+
+
+def socket_fire_task_on_order_crud(restaurant_id, order_id, state, data, table_id_list=None):
     # print("runnign task from task.py")
+    table_id_list = affected_table_ids(restaurant_id, [order_id], table_id_list)
+    broadcast_board_change(restaurant_id, table_id_list,
+                           state, data, order_id_list=[order_id])
+
+
+def flush_board_events(restaurant_id):
+    """
+    one board broadcast for every order_done_signal collected within settings.BOARD_EVENT_WINDOW,
+    returns the number of merged events
+    """
+    board_events = take_board_events(restaurant_id)
+    if board_events is False:
+        # queued again behind the other tasks instead of holding the worker
+        # until the window ends, django_q schedules only run about twice a minute
+        async_task('restaurant.tasks.flush_board_events', restaurant_id)
+        return 0
+    if not board_events:
+        return 0
+    # waiters of the merged orders are updated even when the dashboards need a snapshot
+    table_id_list = affected_table_ids(
+        restaurant_id, board_events['order_ids'], board_events['table_ids'])
+    broadcast_board_change(restaurant_id, table_id_list,
+                           order_id_list=board_events['order_ids'], snapshot=board_events['snapshot'])
+    return board_events['event_count']
+
+
+def broadcast_board_change(restaurant_id, table_id_list, state='data_only', data=None, order_id_list=None,
+                           snapshot=False):
     response_data = {}
+    message_type = 'snapshot'
+    group_name = 'restaurant_%s' % int(restaurant_id)
+
+    # dashboards get only the changed tables, a snapshot when those are unknown
+    staff_list = list(Table.staff_assigned.through.objects.filter(
+        table__restaurant_id=restaurant_id, table_id__in=table_id_list
+    ).values_list('hotelstaffinformation_id', flat=True).distinct())
 
-    # staff_list = HotelStaffInformation.objects.filter(
-    #     restaurant_id=restaurant_id,).values_list('pk', flat=True)
-    staff_list = Table.objects.filter(restaurant_id=restaurant_id,
-                                    food_orders__id=order_id).order_by('table_no').distinct().values_list('staff_assigned__pk', flat=True)
-    # staff_list = list(table_qs.values_list('staff_assigned__pk', flat=True))
+    order_id_list = [order_id for order_id in order_id_list or [] if order_id]
 
-    if state in ['data_only']:
-        if not data:
-            data = order_item_list(restaurant_id)
-        response_data = data
+    # nothing is built for groups without a live connection
+    group_name_list = [group_name] + ['waiter_%s' % staff_id for staff_id in staff_list] + \
+        ['order_%s' % order_id for order_id in order_id_list]
+    live_group_set = live_groups(group_name_list)
+    for skipped_group_name in set(group_name_list) - live_group_set:
+        mark_stream_gap(skipped_group_name)
+    staff_list = [staff_id for staff_id in staff_list
+                  if 'waiter_%s' % staff_id in live_group_set]
+    order_id_list = [order_id for order_id in order_id_list
+                     if 'order_%s' % order_id in live_group_set]
+    is_dashboard_live = group_name in live_group_set
+    if not is_dashboard_live:
+        # the next board read loads it from the database
+        invalidate_board_state(restaurant_id)
+        next_board_version(restaurant_id)
+    elif state in ['data_only']:
+        version = get_board_version(restaurant_id)
+        if data:
+            response_data = data
+        elif table_id_list and not snapshot:
+            message_type = 'delta'
+            version, response_data = update_board_state(
+                restaurant_id, table_id_list)
+        else:
+            version, _ = update_board_state(restaurant_id)
+            response_data = order_item_list(restaurant_id)
+    else:
+        version = get_board_version(restaurant_id)
 
     layer = channels.layers.get_channel_layer()
     try:
-        group_name = 'restaurant_%s' % int(restaurant_id)
-
-        async_to_sync(layer.group_send)(
-            group_name, {'type': 'response_to_listener', 'data': response_data})
-        for staff_id in staff_list:
-            waiter_group_name = 'waiter_%s' % staff_id
-            qs = Table.objects.filter(
-                restaurant_id=restaurant_id,
-                staff_assigned=staff_id).order_by('table_no')
-            serializer = TableStaffSerializer(instance=qs, many=True)
-            async_to_sync(layer.group_send)(
-                waiter_group_name, {'type': 'response_to_listener', 'data': serializer.data})
-
+        # encoded once here and stamped for replay, consumers forward the text as it is
+        frame_list = []
+        if is_dashboard_live:
+            frame_list.append(
+                (group_name, {'type': message_type, 'version': version, 'data': response_data}))
+        if staff_list:
+            for staff_id, waiter_board in waiter_boards(restaurant_id, staff_list).items():
+                frame_list.append(('waiter_%s' % staff_id, {'data': waiter_board}))
+        if order_id_list:
+            for order_id, order_record in customer_order_records(order_id_list).items():
+                frame_list.append(
+                    ('order_%s' % order_id, {'type': 'order', 'data': order_record}))
+        message_list = [
+            (frame_group_name, {'type': 'response_to_listener',
+                                'text': publish_frame(frame_group_name, frame)})
+            for frame_group_name, frame in frame_list
+        ]
+        async_to_sync(group_send_all)(layer, message_list)
         # print('done')
-    except:
-        pass
+    except (ChannelFull, RedisError, aioredis.RedisError, OSError):
+        # the order change itself is saved, clients catch up from the replay buffer or a snapshot
+        logger.exception(
+            'board broadcast of restaurant %s failed', restaurant_id)
     # print('signal got a call', order_qs, table_qs, state)
+
+
+async def group_send_all(layer, message_list):
+    # sent concurrently over the channel layer connection pool instead of one round trip each
+    await asyncio.gather(*[
+        layer.group_send(group_name, message) for group_name, message in message_list
+    ])
@@ -0,0 +1,650 @@
+import importlib
+import json
+import random
+from datetime import time, timedelta
+from unittest import mock
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from account_management.models import CustomerInfo, HotelStaffInformation, UserAccount
+from restaurant.libs.discount_index import DISCOUNT_INDEX_CACHE_KEY
+from restaurant.libs.invoice_json import invoice_records, invoice_rows
+from restaurant.libs.order_prefetch import prefetch_order_details
+from restaurant.libs.review_rating import refresh_rating_aggregates
+from restaurant.management.pricing_reference import reference_calculate_price
+from restaurant.models import (Discount, Food, FoodCategory, FoodExtra, FoodExtraType, FoodOption,
+                               FoodOptionType, FoodOrder, FoodOrderLog, Invoice, OrderedItem,
+                               ParentCompanyPromotion, PaymentType, PromoCodePromotion, Restaurant, Review,
+                               Table)
+from restaurant.projections import (customer_order_details_projection, food_with_price_projection,
+                                    foods_by_category, free_table_projection, table_projection)
+from restaurant.serializers import (CustomerOrderDetailsSerializer, FoodOrderByTableSerializer,
+                                    FoodsByCategorySerializer, FoodWithPriceSerializer, FreeTableSerializer,
+                                    InvoiceSerializer, TableSerializer, TableStaffSerializer)
+from restaurant.views import FoodByRestaurantViewSet, OrderedItemViewSet
+from utils.calculate_price import STORED_PRICE_FIELDS, calculate_price, compute_price, compute_prices
+from utils.renderers import FastJSONRenderer
+
+ITEM_STATUS_LIST = ['0_ORDER_INITIALIZED', '1_ORDER_PLACED',
+                    '2_ORDER_CONFIRMED', '3_IN_TABLE', '4_CANCELLED']
+
+# (vat on original price, service charge on original price, service charge is percentage)
+RESTAURANT_CONFIG_LIST = [
+    (True, True, True),
+    (True, True, False),
+    (False, False, True),
+    (True, False, False),
+    (False, True, True),
+]
+
+# price lists and discount indexes cached by an earlier run would outlive its rolled back ids
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+def dump(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def create_menu(name='test'):
+    """
+    a restaurant with a date wise discount, four foods with an option and an
+    extra each, a waiter and a customer
+    """
+    now = timezone.now()
+    restaurant_qs = Restaurant.objects.create(
+        name=name, subscription_ends=now.date() + timedelta(days=30),
+        service_charge=5, tax_percentage=7.5)
+    discount_qs = Discount.objects.create(
+        name='date active', restaurant=restaurant_qs, amount=10, discount_schedule_type='Date_wise',
+        start_date=now - timedelta(days=3), end_date=now + timedelta(days=3))
+    option_type_qs = FoodOptionType.objects.create(name=name)
+    extra_type_qs = FoodExtraType.objects.create(name=name)
+    category_qs = FoodCategory.objects.create(name=name)
+    user_qs = UserAccount.objects.create(phone='%s-%s' % (name, restaurant_qs.pk))
+    menu = {
+        'restaurant': restaurant_qs,
+        'payment_method': PaymentType.objects.create(name=name),
+        'staff': HotelStaffInformation.objects.create(
+            user=user_qs, restaurant=restaurant_qs, name=name, is_waiter=True),
+        'customer': CustomerInfo.objects.create(user=user_qs, name=name),
+        'food_options': [],
+    }
+    for index in range(4):
+        food_qs = Food.objects.create(
+            name='%s %s' % (name, index), restaurant=restaurant_qs, category=category_qs,
+            discount=discount_qs if index % 2 else None)
+        FoodExtra.objects.create(
+            name='extra', price=10, food=food_qs, extra_type=extra_type_qs)
+        menu['food_options'].append(FoodOption.objects.create(
+            name='option', price=100 + index, food=food_qs, option_type=option_type_qs))
+    return menu
+
+
+def create_orders(menu, order_count, item_count=6):
+    """
+    orders in every item status, every other one a take away order without a table
+    """
+    food_option_list = menu['food_options']
+    food_order_id_list = []
+    for index in range(order_count):
+        table_qs = None
+        if index % 2 == 0:
+            table_qs = Table.objects.create(
+                restaurant=menu['restaurant'], table_no=index, is_occupied=True)
+        food_order_qs = FoodOrder.objects.create(
+            table=table_qs, restaurant=menu['restaurant'], status='3_IN_TABLE',
+            customer=menu['customer'] if index % 3 == 0 else None,
+            payment_method=menu['payment_method'] if index % 3 == 1 else None)
+        for item_index in range(item_count):
+            food_option_qs = food_option_list[(index + item_index) % len(food_option_list)]
+            ordered_item_qs = OrderedItem.objects.create(
+                quantity=1 + item_index % 3, food_order=food_order_qs, food_option=food_option_qs,
+                status=ITEM_STATUS_LIST[item_index % len(ITEM_STATUS_LIST)])
+            ordered_item_qs.food_extra.set(food_option_qs.food.food_extras.all())
+        FoodOrderLog.objects.create(
+            order=food_order_qs, staff=menu['staff'], order_status='4_CREATE_INVOICE')
+        food_order_id_list.append(food_order_qs.pk)
+    return food_order_id_list
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OrderQueryCountTest(TestCase):
+    """
+    serializing prefetched orders and waiter tables takes as many queries for 1 order as for 50
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.single_order_id_list = create_orders(create_menu('single'), 1)
+        cls.order_id_list = create_orders(create_menu('many'), 50)
+
+    def setUp(self):
+        cache.clear()
+        request_factory = RequestFactory()
+        self.context_dict = {
+            'dashboard': {},
+            'apps': {'is_apps': True},
+            'waiter app': {'is_apps': True, 'request': request_factory.get('/api/v1/apps/waiter/order/')},
+            'customer app': {'is_apps': True, 'request': request_factory.get('/api/v1/apps/customer/order/')},
+        }
+
+    def count_queries(self, function):
+        with CaptureQueriesContext(connection) as query_context:
+            function()
+        return len(query_context.captured_queries)
+
+    def serialize_orders(self, food_order_id_list, context, prefetch=True):
+        qs = FoodOrder.objects.filter(pk__in=food_order_id_list).order_by('pk')
+        if prefetch:
+            qs = prefetch_order_details(qs)
+        return FoodOrderByTableSerializer(instance=qs, many=True, context=context).data
+
+    def serialize_tables(self, food_order_id_list):
+        table_qs = Table.objects.filter(
+            food_orders__in=food_order_id_list).distinct().order_by('table_no')
+        return TableStaffSerializer(instance=table_qs, many=True).data
+
+    def test_order_query_count(self):
+        for name, context in self.context_dict.items():
+            with self.subTest(name):
+                # price list and discount index are cached per restaurant, loaded before counting
+                self.serialize_orders(self.single_order_id_list, context)
+                self.serialize_orders(self.order_id_list, context)
+                query_count = self.count_queries(
+                    lambda: self.serialize_orders(self.single_order_id_list, context))
+                with self.assertNumQueries(query_count):
+                    data = self.serialize_orders(self.order_id_list, context)
+                self.assertEqual(render(data), render(self.serialize_orders(
+                    self.order_id_list, context, prefetch=False)))
+
+    def test_waiter_board_query_count(self):
+        self.serialize_tables(self.single_order_id_list)
+        self.serialize_tables(self.order_id_list)
+        query_count = self.count_queries(
+            lambda: self.serialize_tables(self.single_order_id_list))
+        with self.assertNumQueries(query_count):
+            table_data_list = self.serialize_tables(self.order_id_list)
+
+        self.assertEqual(len(table_data_list), 25)
+        for table_data in table_data_list:
+            order_info = table_data['order_info']
+            ordered_item_qs = OrderedItem.objects.filter(food_order_id=order_info['id'])
+            self.assertEqual(
+                (order_info['total_items'], order_info['total_served_items']),
+                (ordered_item_qs.exclude(status='4_CANCELLED').count(),
+                 ordered_item_qs.filter(status='3_IN_TABLE').count()))
+
+
+def create_priced_orders(random_qs, order_count, min_items=1, max_items=12):
+    """
+    orders of every restaurant configuration with active, expired and out of slot
+    discounts, parent company, restaurant, expired and unknown promo codes
+    """
+    now = timezone.now()
+    today = timezone.datetime.now().date()
+    option_type_qs = FoodOptionType.objects.create(name='pricing')
+    extra_type_qs = FoodExtraType.objects.create(name='pricing')
+    category_qs = FoodCategory.objects.create(name='pricing')
+
+    food_order_id_list = []
+    for vat_on_original, service_on_original, service_is_percentage in RESTAURANT_CONFIG_LIST:
+        restaurant_qs = Restaurant.objects.create(
+            name='pricing', subscription_ends=today + timedelta(days=30),
+            service_charge_is_percentage=service_is_percentage,
+            service_charge=random_qs.choice([0, 5, 7.5, 40]),
+            tax_percentage=random_qs.choice([0, 5, 7.5, 15]),
+            is_vat_charge_apply_in_original_food_price=vat_on_original,
+            is_service_charge_apply_in_original_food_price=service_on_original,
+        )
+        discount_list = [
+            None,
+            Discount.objects.create(
+                name='date active', restaurant=restaurant_qs, amount=10, discount_schedule_type='Date_wise',
+                start_date=now - timedelta(days=3), end_date=now + timedelta(days=3)),
+            Discount.objects.create(
+                name='date expired', restaurant=restaurant_qs, amount=20, discount_schedule_type='Date_wise',
+                start_date=now - timedelta(days=9), end_date=now - timedelta(days=2)),
+            Discount.objects.create(
+                name='time active', restaurant=restaurant_qs, amount=15, discount_schedule_type='Time_wise',
+                start_date=now, discount_slot_start_time=(now - timedelta(minutes=30)).time(),
+                discount_slot_closing_time=(now + timedelta(minutes=30)).time()),
+            Discount.objects.create(
+                name='time inactive', restaurant=restaurant_qs, amount=25, discount_schedule_type='Time_wise',
+                start_date=now, discount_slot_start_time=(now + timedelta(hours=2)).time(),
+                discount_slot_closing_time=(now + timedelta(hours=3)).time()),
+        ]
+
+        food_list = []
+        for index in range(12):
+            food_qs = Food.objects.create(
+                name='pricing %s' % index, restaurant=restaurant_qs, category=category_qs,
+                discount=random_qs.choice(discount_list))
+            for option_index in range(random_qs.randint(1, 3)):
+                FoodOption.objects.create(
+                    name='option %s' % option_index, food=food_qs, option_type=option_type_qs,
+                    price=round(random_qs.uniform(20, 600), random_qs.choice([0, 2])))
+            for extra_index in range(random_qs.randint(0, 3)):
+                FoodExtra.objects.create(
+                    name='extra %s' % extra_index, food=food_qs, extra_type=extra_type_qs,
+                    price=round(random_qs.uniform(5, 80), random_qs.choice([0, 2])))
+            food_list.append(food_qs)
+
+        parent_promotion_qs = ParentCompanyPromotion.objects.create(
+            code='PARENT-%s' % restaurant_qs.pk, promo_type='PERCENTAGE',
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+            max_amount=150, minimum_purchase_amount=300, amount=12)
+        parent_promotion_qs.restaurant.add(restaurant_qs)
+        promo_code_list = [
+            None,
+            parent_promotion_qs.code,
+            PromoCodePromotion.objects.create(
+                code='PROMO-%s' % restaurant_qs.pk, promo_type='AMOUNT',
+                start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+                max_amount=80, minimum_purchase_amount=0, amount=50, restaurant=restaurant_qs).code,
+            PromoCodePromotion.objects.create(
+                code='EXPIRED-%s' % restaurant_qs.pk, promo_type='PERCENTAGE',
+                start_date=now - timedelta(days=9), end_date=now - timedelta(days=1),
+                max_amount=80, minimum_purchase_amount=0, amount=50, restaurant=restaurant_qs).code,
+            'UNKNOWN-%s' % restaurant_qs.pk,
+        ]
+
+        for index in range(order_count):
+            table_qs = Table.objects.create(
+                restaurant=restaurant_qs, table_no=index, is_occupied=True)
+            food_order_qs = FoodOrder.objects.create(
+                table=table_qs, restaurant=restaurant_qs, status='3_IN_TABLE',
+                applied_promo_code=random_qs.choice(promo_code_list),
+                discount_given=random_qs.choice([None, None, 0, 10, 25, 100.5]),
+                discount_amount_is_percentage=random_qs.choice([True, False]),
+                cash_received=random_qs.choice([None, 0, 100, 5000]),
+            )
+            for item_index in range(random_qs.randint(min_items, max_items)):
+                food_qs = random_qs.choice(food_list)
+                ordered_item_qs = OrderedItem.objects.create(
+                    quantity=random_qs.randint(1, 4), food_order=food_order_qs,
+                    food_option=random_qs.choice(list(food_qs.food_options.all())),
+                    status=random_qs.choice(ITEM_STATUS_LIST))
+                food_extra_list = list(food_qs.food_extras.all())
+                if food_extra_list:
+                    ordered_item_qs.food_extra.set(random_qs.sample(
+                        food_extra_list, random_qs.randint(0, len(food_extra_list))))
+            food_order_id_list.append(food_order_qs.pk)
+    return food_order_id_list
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PricingTest(TestCase):
+    """
+    compute_price, compute_prices and calculate_price against the frozen reference implementation
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.food_order_id_list = create_priced_orders(random.Random(1), 20)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_prices_match_reference(self):
+        for include_initial_order in [False, True]:
+            reference_dict = {
+                food_order.pk: reference_calculate_price(
+                    food_order, include_initial_order=include_initial_order)
+                for food_order in FoodOrder.objects.filter(pk__in=self.food_order_id_list)
+            }
+            batch_dict = compute_prices(
+                FoodOrder.objects.filter(pk__in=self.food_order_id_list),
+                include_initial_order=include_initial_order)
+            for food_order in FoodOrder.objects.filter(pk__in=self.food_order_id_list):
+                with self.subTest(order=food_order.pk, include_initial_order=include_initial_order):
+                    expected = dump(reference_dict[food_order.pk])
+                    self.assertEqual(dump(compute_price(
+                        food_order, include_initial_order=include_initial_order).to_dict()), expected)
+                    self.assertEqual(dump(batch_dict[food_order.pk].to_dict()), expected)
+
+    def test_stored_totals_match_reference(self):
+        stored_field_list = STORED_PRICE_FIELDS + ['change_amount']
+        for food_order_id in self.food_order_id_list:
+            reference_calculate_price(FoodOrder.objects.get(pk=food_order_id))
+            expected = FoodOrder.objects.filter(
+                pk=food_order_id).values(*stored_field_list).first()
+
+            FoodOrder.objects.filter(pk=food_order_id).update(
+                **{field_name: None for field_name in stored_field_list})
+            calculate_price(FoodOrder.objects.get(pk=food_order_id))
+            result = FoodOrder.objects.filter(
+                pk=food_order_id).values(*stored_field_list).first()
+
+            if expected.get('change_amount') is None or result.get('change_amount') is None:
+                # change amount is only stored once cash has been received
+                expected.pop('change_amount')
+                result.pop('change_amount')
+            with self.subTest(order=food_order_id):
+                self.assertEqual(dump(result), dump(expected))
+
+
+@override_settings(CACHES=TEST_CACHES, TURN_OFF_SIGNAL=True)
+@mock.patch('restaurant.views.send_fcm_push_notification_appointment')
+class IncrementalPricingTest(TestCase):
+    """
+    the stored totals kept up to date by the item views equal a full recompute
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu = create_menu('incremental')
+        HotelStaffInformation.objects.filter(pk=cls.menu['staff'].pk).update(is_manager=True)
+        cls.food_order_id = create_orders(cls.menu, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+        calculate_price(FoodOrder.objects.get(pk=self.food_order_id))
+        self.request_factory = APIRequestFactory()
+
+    def call_view(self, action_dict, method, path, data=None, **kwargs):
+        request = getattr(self.request_factory, method)(path, data, format='json')
+        force_authenticate(request, user=self.menu['staff'].user)
+        response = OrderedItemViewSet.as_view(action_dict)(request, **kwargs)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def assertStoredTotals(self):
+        stored_field_list = STORED_PRICE_FIELDS + ['change_amount']
+        result = FoodOrder.objects.filter(
+            pk=self.food_order_id).values(*stored_field_list).first()
+        reference_calculate_price(FoodOrder.objects.get(pk=self.food_order_id))
+        expected = FoodOrder.objects.filter(
+            pk=self.food_order_id).values(*stored_field_list).first()
+        self.assertEqual(dump(result), dump(expected))
+
+    def create_items(self):
+        self.call_view({'post': 'create'}, 'post', '/api/v1/apps/waiter_order/cart/items/', [
+            {'food_order': self.food_order_id, 'food_option': food_option_qs.pk, 'quantity': 2,
+             'food_extra': list(food_option_qs.food.food_extras.values_list('pk', flat=True))}
+            for food_option_qs in self.menu['food_options'][:2]
+        ])
+
+    def test_item_views(self, send_fcm_push_notification_appointment):
+        self.create_items()
+        self.assertStoredTotals()
+
+        self.call_view({'post': 'cart_create_from_dashboard'}, 'post', '/api/v1/dashboard/order/cart/items/', [
+            {'food_order': self.food_order_id, 'food_option': self.menu['food_options'][3].pk,
+             'quantity': 3, 'status': '3_IN_TABLE'}
+        ])
+        self.assertStoredTotals()
+
+        ordered_item_qs = OrderedItem.objects.filter(
+            food_order_id=self.food_order_id, status='1_ORDER_PLACED').first()
+        self.call_view({'patch': 'update'}, 'patch', '/api/v1/apps/order/cart/items/%s/' % ordered_item_qs.pk,
+                       {'quantity': 5}, pk=ordered_item_qs.pk)
+        self.assertStoredTotals()
+
+        for status in ['1_ORDER_PLACED', '3_IN_TABLE']:
+            ordered_item_qs = OrderedItem.objects.filter(
+                food_order_id=self.food_order_id, status=status).first()
+            self.call_view({'post': 're_order_items'}, 'post', '/api/v1/apps/re_order_items',
+                           {'order_item_id': ordered_item_qs.pk, 'quantity': 2})
+            self.assertStoredTotals()
+
+        ordered_item_qs = OrderedItem.objects.filter(
+            food_order_id=self.food_order_id, status='2_ORDER_CONFIRMED').first()
+        self.call_view({'delete': 'destroy'}, 'delete', '/api/v1/apps/order/cart/items/%s/' % ordered_item_qs.pk,
+                       pk=ordered_item_qs.pk)
+        self.assertStoredTotals()
+
+    def test_discount_window_closes(self, send_fcm_push_notification_appointment):
+        # lines added while the discount runs, then the window closes at midnight
+        self.create_items()
+        Discount.objects.filter(restaurant=self.menu['restaurant']).update(
+            end_date=timezone.now() - timedelta(days=1))
+        cache.delete(DISCOUNT_INDEX_CACHE_KEY.format(restaurant_id=self.menu['restaurant'].pk))
+
+        ordered_item_qs = OrderedItem.objects.filter(
+            food_order_id=self.food_order_id, status='1_ORDER_PLACED').first()
+        self.call_view({'post': 're_order_items'}, 'post', '/api/v1/apps/re_order_items',
+                       {'order_item_id': ordered_item_qs.pk, 'quantity': 1})
+        self.assertStoredTotals()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProjectionTest(TestCase):
+    """
+    the values() projections render the same JSON as the serializers they replace
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        menu = create_menu('projection')
+        restaurant_qs = menu['restaurant']
+        cls.restaurant_id = restaurant_qs.pk
+
+        staff_qs = menu['staff']
+        staff_qs.image = 'staff/waiter.png'
+        staff_qs.shift_start = time(9, 30)
+        staff_qs.shift_end = time(18)
+        staff_qs.save()
+        deleted_staff_qs = HotelStaffInformation.objects.create(
+            user=UserAccount.objects.create(phone='projection-deleted', first_name='gone'),
+            restaurant=restaurant_qs, name='deleted', is_manager=True)
+        table_list = [
+            Table.objects.create(restaurant=restaurant_qs, table_no=10 + index, name='table %s' % index,
+                                 is_occupied=index == 1)
+            for index in range(4)
+        ]
+        for table_qs in table_list[:3]:
+            table_qs.staff_assigned.add(staff_qs, deleted_staff_qs)
+        deleted_staff_qs.delete()
+        table_list[2].delete()
+
+        category_qs = FoodCategory.objects.create(name='second', image='categories/second.png')
+        deleted_category_qs = FoodCategory.objects.create(name='deleted')
+        Food.objects.create(name='no option', restaurant=restaurant_qs, category=category_qs,
+                            image='foods/plain.png', description='plain', is_top=True)
+        Food.objects.create(name='no category', restaurant=restaurant_qs)
+        Food.objects.create(name='deleted category', restaurant=restaurant_qs, category=deleted_category_qs)
+        deleted_category_qs.delete()
+        Food.objects.create(name='deleted', restaurant=restaurant_qs, category=category_qs).delete()
+        food_qs = Food.objects.create(name='two options', restaurant=restaurant_qs, category=category_qs,
+                                      is_recommended=True, ingredients='salt')
+        for price in [120.456, 99.999]:
+            FoodOption.objects.create(name='option', price=price, food=food_qs,
+                                      option_type=menu['food_options'][0].option_type)
+
+        for index, food_order_id in enumerate(create_orders(menu, 3)):
+            FoodOrder.objects.filter(pk=food_order_id).update(
+                status='5_PAID', order_no='P-%s' % index, payable_amount=100.5 * index)
+
+    def setUp(self):
+        cache.clear()
+        self.table_qs = Table.objects.filter(restaurant_id=self.restaurant_id).order_by('pk')
+        self.food_qs = Food.objects.filter(restaurant_id=self.restaurant_id)
+
+    def assertSameJSON(self, serializer_data, projection_data):
+        self.assertEqual(render(projection_data), render(serializer_data))
+
+    def test_free_table(self):
+        table_qs = self.table_qs.filter(is_occupied=False)
+        self.assertSameJSON(FreeTableSerializer(table_qs, many=True).data,
+                            free_table_projection.rows(table_qs))
+
+    def test_table(self):
+        self.assertSameJSON(TableSerializer(self.table_qs, many=True).data,
+                            table_projection.rows(self.table_qs))
+
+    def test_customer_order_details(self):
+        order_qs = FoodOrder.objects.filter(
+            restaurant_id=self.restaurant_id, status='5_PAID').order_by('-created_at')
+        self.assertEqual(order_qs.count(), 3)
+        self.assertSameJSON(CustomerOrderDetailsSerializer(order_qs, many=True).data,
+                            customer_order_details_projection.rows(order_qs))
+
+    def test_food_with_price(self):
+        food_qs = self.food_qs.order_by('pk')
+        self.assertSameJSON(FoodWithPriceSerializer(food_qs, many=True).data,
+                            food_with_price_projection.rows(food_qs))
+
+    def test_foods_by_category(self):
+        self.assertSameJSON(FoodsByCategorySerializer(self.food_qs.select_related('category'), many=True).data,
+                            foods_by_category(self.food_qs))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MenuSnapshotTest(TestCase):
+    """
+    menu responses are served from the menu snapshot with an etag, 304 until the menu changes
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu = create_menu('menu')
+
+    def setUp(self):
+        cache.clear()
+        self.request_factory = APIRequestFactory()
+
+    def get_menu(self, etag=None):
+        header_dict = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        request = self.request_factory.get('/api/v1/apps/food_by_restaurant/', **header_dict)
+        force_authenticate(request, user=self.menu['staff'].user)
+        response = FoodByRestaurantViewSet.as_view({'get': 'list'})(
+            request, restaurant=str(self.menu['restaurant'].pk))
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_etag(self):
+        response = self.get_menu()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.get_menu(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        food_option_qs = self.menu['food_options'][0]
+        food_option_qs.price += 5
+        food_option_qs.save()
+
+        response = self.get_menu(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(str(food_option_qs.price), response.content.decode('utf-8'))
+        self.assertEqual(self.get_menu(response['ETag']).status_code, 304)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReviewRatingTest(TestCase):
+    """
+    the rating aggregates kept up to date on review changes equal a recompute from the reviews
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu = create_menu('review')
+        cls.food_order_id_list = create_orders(cls.menu, 4)
+
+    def setUp(self):
+        cache.clear()
+
+    def rating_aggregates(self):
+        restaurant_id = self.menu['restaurant'].pk
+        return (
+            list(Restaurant.raw_objects.filter(pk=restaurant_id).values_list('rating_sum', 'rating_count')),
+            list(Food.raw_objects.filter(restaurant_id=restaurant_id).order_by('pk').values_list(
+                'pk', 'rating_sum', 'order_counter', 'rating')),
+        )
+
+    def assertRefreshed(self):
+        rating_aggregates = self.rating_aggregates()
+        refresh_rating_aggregates([self.menu['restaurant'].pk])
+        self.assertEqual(rating_aggregates, self.rating_aggregates())
+
+    def test_review_changes(self):
+        review_list = [
+            Review.objects.create(order_id=food_order_id, rating=rating)
+            for food_order_id, rating in zip(self.food_order_id_list, [5, 2, 4])
+        ]
+        self.assertRefreshed()
+
+        review_list[0].rating = 1
+        review_list[0].save()
+        self.assertRefreshed()
+
+        review_list[1].review_text = 'same rating'
+        review_list[1].save()
+        self.assertRefreshed()
+
+        review_list[2].order_id = self.food_order_id_list[3]
+        review_list[2].save()
+        self.assertRefreshed()
+
+        review_list[1].delete()
+        self.assertRefreshed()
+
+        # soft deleted orders keep their review for the foods only
+        FoodOrder.objects.get(pk=self.food_order_id_list[0]).delete()
+        self.assertRefreshed()
+        FoodOrder.raw_objects.get(pk=self.food_order_id_list[0]).save()
+        self.assertRefreshed()
+
+    def test_backfill(self):
+        for food_order_id, rating in zip(self.food_order_id_list, [5, 2, 4, 3]):
+            Review.objects.create(order_id=food_order_id, rating=rating)
+        refresh_rating_aggregates([self.menu['restaurant'].pk])
+        rating_aggregates = self.rating_aggregates()
+
+        # before 0086 foods only had the running average and order_counter
+        Restaurant.raw_objects.filter(pk=self.menu['restaurant'].pk).update(rating_sum=0, rating_count=0)
+        Food.raw_objects.filter(restaurant=self.menu['restaurant']).update(rating_sum=0)
+        migration = importlib.import_module('restaurant.migrations.0086_rating_aggregates')
+        migration.fill_rating_aggregates(apps, None)
+        self.assertEqual(self.rating_aggregates(), rating_aggregates)
+
+
+class InvoiceJSONTest(TestCase):
+    """
+    invoice_records splice the invoice columns into the stored order info text
+    the way InvoiceSerializer nests them into the loaded order info
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        menu = create_menu('invoice')
+        food_order_id = create_orders(menu, 1)[0]
+        order_info_list = [
+            {'price': {'grand_total_price': 120.5, 'payable_amount': 99.99},
+             'ordered_items': [{'food_name': 'caf\u00e9 \u2028', 'quantity': 2}], 'table_no': None},
+            {},
+            None,
+        ]
+        cls.invoice_id_list = [
+            Invoice.objects.create(
+                restaurant=menu['restaurant'], order_id=food_order_id, order_info=order_info,
+                grand_total=120.5, payable_amount=99.99, payment_status='1_PAID').pk
+            for order_info in order_info_list
+        ]
+
+    def test_invoice_records(self):
+        for invoice_id in self.invoice_id_list:
+            invoice_qs = Invoice.objects.get(pk=invoice_id)
+            if invoice_qs.order_info is None:
+                # the serializer fails on a NULL order info, the records treat it as empty
+                invoice_qs.order_info = {}
+            expected = JSONRenderer().render(InvoiceSerializer(invoice_qs).data)
+            result = FastJSONRenderer().render(
+                invoice_records(invoice_rows(Invoice.objects.filter(pk=invoice_id)))[0])
+            with self.subTest(invoice=invoice_id):
+                self.assertEqual(json.loads(result), json.loads(expected))
@@ -1,4 +1,12 @@
+from restaurant.libs.board_state import board_snapshot
+from restaurant.libs.discount_index import get_discount_index
 from restaurant.libs.generate_order_no import generate_order_no
+from restaurant.libs.invoice_json import invoice_records, invoice_rows
+from restaurant.libs.menu_snapshot import get_menu_snapshot, next_menu_version
+from restaurant.libs.order_prefetch import prefetch_order_details
+from restaurant.libs.price_list import invalidate_price_list
+from restaurant.projections import (customer_order_details_projection, foods_by_category,
+                                    free_table_projection, table_projection)
 from asgiref.sync import async_to_sync, sync_to_async
 import copy
 import decimal
@@ -14,11 +22,13 @@ from account_management.serializers import (ListOfIdSerializer,
                                             StaffInfoSerializer, CustomerNotificationSerializer)
 from dateutil.relativedelta import relativedelta
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
 from django.db.models import Count, Min, Q, query_utils
 from django.db.models.aggregates import Sum
-from django.http import request
+from django.http import HttpResponseNotModified, request
 from django.utils import timezone
 from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
 from django.views.decorators.cache import cache_page
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg2 import openapi
@@ -27,10 +37,12 @@ from rest_framework import filters, permissions, status, viewsets
 from rest_framework.permissions import IsAdminUser
 from rest_framework.serializers import Serializer
 from rest_framework_tracking.mixins import LoggingMixin
+from utils.calculate_price import apply_ordered_items_change, calculate_price, snapshot_ordered_items
 from utils.custom_viewset import CustomViewSet
 from utils.fcm import send_fcm_push_notification_appointment
 from utils.pagination import CustomLimitPagination
 from utils.print_node import print_node
+from utils.renderers import FastRendererMixin
 from utils.response_wrapper import ResponseWrapper
 from actstream import action
 from actstream.models import Action
@@ -98,10 +110,26 @@ from .serializers import (CollectPaymentSerializer, DiscountByFoodSerializer,
 from .signals import order_done_signal, kitchen_items_print_signal
 
 
+def menu_response(request, restaurant_id, name, build_data):
+    """
+    menu data from the restaurant menu snapshot with its etag,
+    304 Not Modified when the client already has it
+    """
+    menu_snapshot = get_menu_snapshot(restaurant_id, name, build_data)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if if_none_match.strip() == '*' or menu_snapshot['etag'] in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        response = ResponseWrapper(data=menu_snapshot['data'], msg='success')
+    response['ETag'] = menu_snapshot['etag']
+    return response
+
+
 class FoodOrderCore:
     def invoice_generator(self, order_qs, payment_status, *args, **kwargs):
         # adjust cart for unique items
         self.adjust_cart_for_unique_items(order_qs)
+        calculate_price(food_order_obj=order_qs)
 
         #is_apps = request.path.__contains__('/apps/')
         serializer = FoodOrderByTableSerializer(instance=order_qs)
@@ -161,10 +189,11 @@ class FoodOrderCore:
                         temp_order_list.append(order_items_qs)
 
 
-class RestaurantViewSet(LoggingMixin, CustomViewSet):
+class RestaurantViewSet(FastRendererMixin, LoggingMixin, CustomViewSet):
     queryset = Restaurant.objects.all()
     lookup_field = 'pk'
     logging_methods = ['GET', 'POST', 'PATCH', 'DELETE']
+    fast_renderer_actions = ['order_item_list']
     # serializer_class = RestaurantContactPerson
 
     def get_serializer_class(self):
@@ -241,40 +270,30 @@ class RestaurantViewSet(LoggingMixin, CustomViewSet):
         owner_qs = UserAccount.objects.filter(pk=request.user.pk).first()
         restaurant_list = owner_qs.hotel_staff.values_list(
             'restaurant', flat=True)
-        qs = Restaurant.objects.filter(pk__in=restaurant_list)
+        qs = Restaurant.objects.filter(pk__in=restaurant_list).select_related(
+            'subscription').prefetch_related('payment_type')
         serializer = RestaurantSerializer(instance=qs, many=True)
         return ResponseWrapper(data=serializer.data)
 
     def list(self, request, *args, **kwargs):
-        qs = Restaurant.objects.all()
+        qs = Restaurant.objects.all().select_related(
+            'subscription').prefetch_related('payment_type')
         serializer = RestaurantSerializer(instance=qs, many=True)
         return ResponseWrapper(data=serializer.data)
 
     def order_item_list(self, request, restaurant_id, *args, **kwargs):
-        qs = FoodOrder.objects.filter(table__restaurant=restaurant_id).exclude(
-            status__in=['5_PAID', '6_CANCELLED']).order_by('table_id')
-        ordered_table_set = set(qs.values_list('table_id', flat=True))
-        table_qs = Table.objects.filter(
-            restaurant=restaurant_id).exclude(pk__in=ordered_table_set).order_by('id')
-        # all_table_set = set(table_qs.values_list('pk',flat=True))
-        # empty_table_set = all_table_set - orderd_table_set
-        empty_table_data = []
-        for empty_table in table_qs:
-            empty_table_data.append(
-                {
-                    'table': empty_table.pk,
-                    'table_no': empty_table.table_no,
-                    'table_name': empty_table.name,
-                    'status': '',
-                    'price': {},
-                    'ordered_items': []
-                }
-            )
+        excluded_item_status_list = None
         is_apps = request.path.__contains__('/apps/')
-        serializer = FoodOrderByTableSerializer(instance=qs, many=True, context={
-                                                'is_apps': is_apps, 'request': request})
+        if is_apps:
+            if request.path.__contains__('/apps/waiter/'):
+                excluded_item_status_list = [
+                    '4_CANCELLED', '0_ORDER_INITIALIZED']
+            else:
+                excluded_item_status_list = ['4_CANCELLED']
+        data = board_snapshot(
+            restaurant_id, excluded_item_status_list=excluded_item_status_list)
 
-        return ResponseWrapper(data=serializer.data+empty_table_data, msg="success")
+        return ResponseWrapper(data=data, msg="success")
 
     def delete_restaurant(self, request, pk, *args, **kwargs):
         self.check_object_permissions(request, obj=pk)
@@ -605,13 +624,15 @@ class FoodOptionViewSet(LoggingMixin, CustomViewSet):
         return ResponseWrapper(data=serializer.data, msg='success')
 
 
-class TableViewSet(LoggingMixin, CustomViewSet):
+class TableViewSet(FastRendererMixin, LoggingMixin, CustomViewSet):
     serializer_class = TableSerializer
 
     # permission_classes = [permissions.IsAuthenticated]
     queryset = Table.objects.all()
     lookup_field = 'pk'
     logging_methods = ['GET', 'POST', 'PATCH', 'DELETE']
+    fast_renderer_actions = ['list', 'table_list',
+                             'staff_table_list', 'free_table_list']
     # http_method_names = ['get', 'post', 'patch']
 
     def get_permissions(self):
@@ -653,6 +674,10 @@ class TableViewSet(LoggingMixin, CustomViewSet):
             self.serializer_class = TableSerializer
         return self.serializer_class
 
+    def list(self, request):
+        # TableSerializer, staff and their tables loaded with one query each
+        return ResponseWrapper(data=table_projection.rows(self.get_queryset()), msg='success')
+
     # def get_pagination_class(self):
     #     if self.action in ['table_list']:
     #         # url = self.request.path
@@ -773,7 +798,7 @@ class TableViewSet(LoggingMixin, CustomViewSet):
         # qs =self.queryset.filter(pk=ordered_id).prefetch_realted('ordered_items')
         is_apps = request.path.__contains__('/apps/')
 
-        serializer = FoodOrderByTableSerializer(instance=qs, many=True, context={
+        serializer = FoodOrderByTableSerializer(instance=prefetch_order_details(qs), many=True, context={
                                                 'is_apps': is_apps, 'request': request})
         # serializer = self.get_serializer(instance=qs, many=True)
         return ResponseWrapper(data=serializer.data, msg="success")
@@ -806,10 +831,10 @@ class TableViewSet(LoggingMixin, CustomViewSet):
 
         qs = Table.objects.filter(restaurant_id=restaurant, is_occupied=False)
 
-        serializer = FreeTableSerializer(
-            instance=qs, many=True)
+        # serializer = FreeTableSerializer(
+        #     instance=qs, many=True)
 
-        return ResponseWrapper(data=serializer.data, msg='success')
+        return ResponseWrapper(data=free_table_projection.rows(qs), msg='success')
 
     def order_id_by_table(self, request, table_id, *args, **kwargs):
         table_qs = FoodOrder.objects.filter(table_id=table_id).last()
@@ -933,6 +958,12 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
                                                                     )
                 food_order_qs.applied_promo_code = request.data.get('applied_promo_code')
                 food_order_qs.save()
+        calculate_price(food_order_obj=food_order_qs)
+        order_done_signal.send(
+            sender=self.__class__.promo_code,
+            restaurant_id=restaurant_id,
+            order_id=food_order_qs.pk,
+        )
 
         return ResponseWrapper(msg='Promo Code Applied', status=200)
 
@@ -957,6 +988,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
             order_done_signal.send(
                 sender=self.__class__.create,
                 restaurant_id=table_qs.restaurant_id,
+                order_id=serializer.instance.pk,
             )
             return ResponseWrapper(data=serializer.data, msg='created')
         else:
@@ -981,6 +1013,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
             if (not is_customer) and table_qs.is_occupied:
                 return ResponseWrapper(error_msg=['table already occupied'], error_code=400)
 
+            changed_table_id_list = []
             if is_customer:
                 food_order_qs = FoodOrder.objects.filter(customer__user=request.user.pk,
                                                          restaurant_id=table_qs.restaurant_id).exclude(
@@ -993,6 +1026,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
                     running_order_table_qs = food_order_qs.table
                     running_order_table_qs.is_occupied = False
                     running_order_table_qs.save()
+                    changed_table_id_list.append(running_order_table_qs.pk)
                     food_order_qs.table_id = table_qs.id
                     table_qs.is_occupied = True
                     table_qs.save()
@@ -1012,7 +1046,8 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
             order_done_signal.send(
                 sender=self.__class__.create,
                 restaurant_id=table_qs.restaurant_id,
-
+                order_id=serializer.instance.pk,
+                table_id_list=changed_table_id_list,
             )
 
             return ResponseWrapper(data=serializer.data, msg='created')
@@ -1113,6 +1148,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         order_qs.status = '6_CANCELLED'
         order_qs.save()
         order_qs.ordered_items.update(status="4_CANCELLED")
+        calculate_price(food_order_obj=order_qs)
         table_qs = order_qs.table
 
         customer_fcm_device_qs = CustomerFcmDevice.objects.filter(
@@ -1175,6 +1211,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         order_qs.status = '6_CANCELLED'
         order_qs.save()
         order_qs.ordered_items.update(status="4_CANCELLED")
+        calculate_price(food_order_obj=order_qs)
         table_qs = order_qs.table
         if table_qs:
             if table_qs.is_occupied:
@@ -1237,6 +1274,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
                     pk__in=request.data.get('food_items'), status__in=['4_CANCELLED'])
                 cancelled_items_names = cancel_items.values_list(
                     'food_option__food__name', flat=True)
+                calculate_price(food_order_obj=order_qs)
 
             # order_qs.status = '3_IN_TABLE'
             # order_qs.save()
@@ -1317,6 +1355,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
                 # if order_qs.status in ['0_ORDER_INITIALIZED']:
                 order_qs.status = '1_ORDER_PLACED'
                 order_qs.save()
+                calculate_price(food_order_obj=order_qs)
 
                 order_done_signal.send(
                     sender=self.__class__.create,
@@ -1382,6 +1421,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         # if order_qs.status in ["0_ORDER_INITIALIZED", "1_ORDER_PLACED"]:
         order_qs.status = '2_ORDER_CONFIRMED'
         order_qs.save()
+        calculate_price(food_order_obj=order_qs)
 
         order_done_signal.send(
             sender=self.__class__.create,
@@ -1742,8 +1782,8 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
 
         order_done_signal.send(
             sender=self.__class__.create,
-            restaurant_id=reorder_qs.restaurant_id,
-            order_id=order_qs.pk,
+            restaurant_id=table_qs.restaurant_id,
+            order_id=reorder_qs.pk,
         )
         is_apps = request.path.__contains__('/apps/')
 
@@ -1759,6 +1799,7 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         table_qs = Table.objects.filter(id=request.data.get('table_id')).last()
         if table_qs.is_occupied:
             return ResponseWrapper(msg='Table is already occupied')
+        previous_table_id = food_order_qs.table_id
         food_order_qs.table.is_occupied = False
         food_order_qs.table.save()
 
@@ -1766,6 +1807,12 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         table_qs.is_occupied = True
         table_qs.save()
         food_order_qs.save()
+        order_done_signal.send(
+            sender=self.__class__.table_transfer,
+            restaurant_id=food_order_qs.restaurant_id,
+            order_id=food_order_qs.pk,
+            table_id_list=[previous_table_id],
+        )
 
         is_apps = request.path.__contains__('/apps/')
         serializer = FoodOrderByTableSerializer(instance=food_order_qs, context={
@@ -1776,11 +1823,11 @@ class FoodOrderViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         order_qs = FoodOrder.objects.filter(
             customer__user=request.user.pk, status='5_PAID').order_by('-created_at')
        # page_qs = self.paginate_queryset(order_qs)
-        serializer = CustomerOrderDetailsSerializer(
-            instance=order_qs, many=True)
+        # serializer = CustomerOrderDetailsSerializer(
+        #     instance=order_qs, many=True)
         # paginated_data = self.get_paginated_response(serializer.data)
 
-        return ResponseWrapper(data=serializer.data, msg='success')
+        return ResponseWrapper(data=customer_order_details_projection.rows(order_qs), msg='success')
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -1830,6 +1877,7 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         if not order_qs:
             return ResponseWrapper(error_msg=['Order is invalid'], error_code=400)
 
+        before_snapshot = snapshot_ordered_items(order_qs, [item_qs.pk])
         item_qs.status = '4_CANCELLED'
         item_qs.save()
         order_id = item_qs.food_order
@@ -1837,6 +1885,9 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         if invoice_qs:
             invoice_qs = self.invoice_generator(
                 order_qs, payment_status=invoice_qs.payment_status)
+        else:
+            # cancelled item is no longer counted in the order totals
+            apply_ordered_items_change(order_qs, before_snapshot, {})
 
         restaurant_id = order_qs.restaurant_id
         order_done_signal.send(
@@ -1872,14 +1923,21 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         serializer_class = self.get_serializer_class()
         serializer = serializer_class(data=request.data, partial=True)
         if serializer.is_valid():
-            qs = serializer.update(instance=self.get_object(
-            ), validated_data=serializer.validated_data)
+            instance = self.get_object()
+            before_snapshot = {}
+            if instance.food_order:
+                before_snapshot = snapshot_ordered_items(
+                    instance.food_order, [instance.pk])
+            qs = serializer.update(instance=instance, validated_data=serializer.validated_data)
             order_qs = qs.food_order
 
             invoice_qs = order_qs.invoices.last()
             if invoice_qs:
                 invoice_qs = self.invoice_generator(
                     order_qs, payment_status=invoice_qs.payment_status)
+            else:
+                apply_ordered_items_change(
+                    order_qs, before_snapshot, snapshot_ordered_items(order_qs, [qs.pk]))
 
             restaurant_id = order_qs.restaurant_id
             order_done_signal.send(
@@ -1932,6 +1990,7 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
                 return ResponseWrapper(error_code=400, error_msg=['order is invalid'])
 
             qs = serializer.save()
+            ordered_item_id_list = [item.pk for item in qs]
 
             restaurant_id = food_order_qs.restaurant_id
             is_take_away_order= request.path.__contains__('take_away_order/cart/items/')
@@ -1959,7 +2018,8 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
             # order_order_qs= FoodOrder.objects.filter(status = '0_ORDER_INITIALIZED',pk=request.data.get('id'))
             # if order_order_qs:
             #     order_order_qs.update(status='0_ORDER_INITIALIZED')
-
+            apply_ordered_items_change(
+                food_order_qs, {}, snapshot_ordered_items(food_order_qs, ordered_item_id_list))
 
 
             order_done_signal.send(
@@ -1998,6 +2058,9 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         if invoice_qs:
             invoice_qs = self.invoice_generator(
                 food_order_qs, payment_status=invoice_qs.payment_status)
+        else:
+            apply_ordered_items_change(food_order_qs, {}, snapshot_ordered_items(
+                food_order_qs, [item.pk for item in list_of_qs]))
 
         serializer = OrderedItemGetDetailsSerializer(
             instance=list_of_qs, many=True)
@@ -2016,12 +2079,15 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         if re_order_item_qs.food_order.status == '5_PAID':
             return ResponseWrapper(error_msg=['Order is already paid'], error_code=406)
 
+        before_snapshot = {}
         if re_order_item_qs.status in ['2_ORDER_CONFIRMED', '3_IN_TABLE']:
             # for item in re_order_item_qs:
             re_order_item_qs = OrderedItem.objects.create(quantity=new_quantity, food_option=re_order_item_qs.food_option,
                                                           food_order=re_order_item_qs.food_order, status='1_ORDER_PLACED')
 
         elif re_order_item_qs.status in ['0_ORDER_INITIALIZED', '1_ORDER_PLACED']:
+            before_snapshot = snapshot_ordered_items(
+                re_order_item_qs.food_order, [re_order_item_qs.pk])
             update_quantity = re_order_item_qs.quantity + new_quantity
             re_order_item_qs.quantity = update_quantity
             re_order_item_qs.save()
@@ -2029,6 +2095,8 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
             return ResponseWrapper(error_msg=['Order Item is already Cancelled'], error_code=406)
 
         # food_order_qs = OrderedItem.objects.filter(food_order_id = re_order_item_qs.food_order_id)
+        apply_ordered_items_change(re_order_item_qs.food_order, before_snapshot, snapshot_ordered_items(
+            re_order_item_qs.food_order, [re_order_item_qs.pk]))
 
         order_done_signal.send(
             sender=self.__class__.re_order_items,
@@ -2041,7 +2109,7 @@ class OrderedItemViewSet(LoggingMixin, CustomViewSet, FoodOrderCore):
         return ResponseWrapper(data=serializer.data, msg='Success')
 
 
-class FoodViewSet(LoggingMixin, CustomViewSet):
+class FoodViewSet(FastRendererMixin, LoggingMixin, CustomViewSet):
     serializer_class = FoodWithPriceSerializer
 
     def get_serializer_class(self):
@@ -2068,6 +2136,7 @@ class FoodViewSet(LoggingMixin, CustomViewSet):
     queryset = Food.objects.all()
     lookup_field = 'pk'
     logging_methods = ['GET', 'POST', 'PATCH', 'DELETE']
+    fast_renderer_actions = ['food_details', 'category_list']
     # http_method_names = ['post', 'patch', 'get', 'delete']
 
     def create(self, request):
@@ -2101,16 +2170,26 @@ class FoodViewSet(LoggingMixin, CustomViewSet):
 
     # @method_decorator(cache_page(60*15))
     def food_details(self, request, pk, *args,  **kwargs):
-        qs = Food.objects.filter(pk=pk).select_related(
-            'category').prefetch_related("food_extras").last()
-        serializer = FoodDetailSerializer(instance=qs)
-        return ResponseWrapper(data=serializer.data, msg='success')
+        def food_details_data():
+            qs = Food.objects.filter(pk=pk).select_related(
+                'category').prefetch_related("food_extras__extra_type").last()
+            serializer = FoodDetailSerializer(instance=qs)
+            return serializer.data
+
+        restaurant_id = Food.objects.filter(
+            pk=pk).values_list('restaurant_id', flat=True).last()
+        if not restaurant_id:
+            return ResponseWrapper(data=food_details_data(), msg='success')
+        return menu_response(request, restaurant_id, 'food_details_%s' % int(pk), food_details_data)
 
     def category_list(self, request, *args, restaurant, **kwargs):
-        qs = FoodCategory.objects.filter(
-            foods__restaurant_id=restaurant).distinct()
-        serializer = FoodCategorySerializer(instance=qs, many=True)
-        return ResponseWrapper(data=serializer.data, msg='success')
+        def category_list_data():
+            qs = FoodCategory.objects.filter(
+                foods__restaurant_id=restaurant).distinct()
+            serializer = FoodCategorySerializer(instance=qs, many=True)
+            return serializer.data
+
+        return menu_response(request, int(restaurant), 'category_list', category_list_data)
 
     @swagger_auto_schema(manual_parameters=[
         openapi.Parameter("restaurant", openapi.IN_QUERY,
@@ -2130,7 +2209,7 @@ class FoodViewSet(LoggingMixin, CustomViewSet):
             """
 
         category_qs = Food.objects.filter(
-            category=category_id, restaurant_id=restaurant_id)
+            category=category_id, restaurant_id=restaurant_id).select_related('category').prefetch_related('food_extras__extra_type')
 
         serializer = FoodDetailSerializer(instance=category_qs, many=True)
         return ResponseWrapper(data=serializer.data, msg='success')
@@ -2155,14 +2234,17 @@ class FoodViewSet(LoggingMixin, CustomViewSet):
         if food_name == ' ':
             return ResponseWrapper(error_msg=['Food Name is not given'], status=400)
         food_name_qs = Food.objects.filter(
-            Q(name__icontains=food_name) | Q(category__name__icontains=food_name), restaurant_id=restaurant_id)
+            Q(name__icontains=food_name) | Q(category__name__icontains=food_name), restaurant_id=restaurant_id).select_related('category')
         if is_dashboard:
-            serializer = FoodDetailSerializer(instance=food_name_qs, many=True)
+            serializer = FoodDetailSerializer(
+                instance=food_name_qs.prefetch_related('food_extras__extra_type'), many=True)
+            data = serializer.data
         else:
-            serializer = FoodsByCategorySerializer(
-                instance=food_name_qs, many=True)
+            # serializer = FoodsByCategorySerializer(
+            #     instance=food_name_qs, many=True)
+            data = foods_by_category(food_name_qs)
 
-        return ResponseWrapper(data=serializer.data, msg='success')
+        return ResponseWrapper(data=data, msg='success')
 
     def food_extra_by_food(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -2190,7 +2272,7 @@ class FoodViewSet(LoggingMixin, CustomViewSet):
             return ResponseWrapper(error_msg=serializer.errors, error_code=400)
 
 
-class FoodByRestaurantViewSet(LoggingMixin, CustomViewSet):
+class FoodByRestaurantViewSet(FastRendererMixin, LoggingMixin, CustomViewSet):
     serializer_class = FoodsByCategorySerializer
 
     # queryset = Food.objects.all()
@@ -2201,58 +2283,79 @@ class FoodByRestaurantViewSet(LoggingMixin, CustomViewSet):
     lookup_field = 'restaurant'
     logging_methods = ['GET', 'POST', 'PATCH', 'DELETE']
     http_method_names = ['get']
+    fast_renderer_actions = ['__all__']
 
     def top_foods(self, request, restaurant, *args, **kwargs):
-        qs = self.queryset.filter(restaurant=restaurant, is_top=True)
-        # qs = qs.filter(is_top = True)
-        serializer = FoodDetailSerializer(instance=qs, many=True)
-        return ResponseWrapper(data=serializer.data, msg='success')
+        def top_foods_data():
+            qs = self.queryset.filter(restaurant=restaurant, is_top=True).select_related(
+                'category').prefetch_related('food_extras__extra_type')
+            # qs = qs.filter(is_top = True)
+            serializer = FoodDetailSerializer(instance=qs, many=True)
+            return serializer.data
+
+        return menu_response(request, int(restaurant), 'top_foods', top_foods_data)
 
     def recommended_foods(self, request, restaurant, *args, **kwargs):
-        qs = self.queryset.filter(restaurant=restaurant, is_recommended=True)
-        # qs = qs.filter(is_top = True)
-        serializer = FoodDetailSerializer(instance=qs, many=True)
-        return ResponseWrapper(data=serializer.data, msg='success')
+        def recommended_foods_data():
+            qs = self.queryset.filter(restaurant=restaurant, is_recommended=True).select_related(
+                'category').prefetch_related('food_extras__extra_type')
+            # qs = qs.filter(is_top = True)
+            serializer = FoodDetailSerializer(instance=qs, many=True)
+            return serializer.data
+
+        return menu_response(request, int(restaurant), 'recommended_foods', recommended_foods_data)
 
     def list(self, request, restaurant, *args, **kwargs):
-        qs = self.queryset.filter(
-            restaurant=restaurant).prefetch_related('food_options', 'food_extras').distinct()
-        # qs = qs.filter(is_top = True)
-        serializer = FoodDetailSerializer(instance=qs, many=True)
-        return ResponseWrapper(data=serializer.data, msg='success')
+        def food_list_data():
+            qs = self.queryset.filter(
+                restaurant=restaurant).select_related('category').prefetch_related('food_options', 'food_extras__extra_type').distinct()
+            # qs = qs.filter(is_top = True)
+            serializer = FoodDetailSerializer(instance=qs, many=True)
+            return serializer.data
+
+        return menu_response(request, int(restaurant), 'list', food_list_data)
 
     def top_foods_by_category(self, request, restaurant, *args, **kwargs):
         # qs = FoodCategory.objects.filter(
         #     foods__restaurant_id=restaurant,
         #     foods__is_top=True
         # ).prefetch_related('foods').distinct()
-        qs = Food.objects.filter(
-            restaurant_id=restaurant, is_top=True).select_related('category')
-        # qs = qs.filter(is_top = True)
-        serializer = FoodsByCategorySerializer(instance=qs, many=True)
-        return ResponseWrapper(data=serializer.data, msg='success')
+        def top_foods_by_category_data():
+            qs = Food.objects.filter(
+                restaurant_id=restaurant, is_top=True)
+            # qs = qs.filter(is_top = True)
+            # serializer = FoodsByCategorySerializer(instance=qs, many=True)
+            return foods_by_category(qs)
+
+        return menu_response(request, int(restaurant), 'top_foods_by_category', top_foods_by_category_data)
 
     def recommended_foods_by_category(self, request, restaurant, *args, **kwargs):
         # qs = FoodCategory.objects.filter(
         #     foods__restaurant_id=restaurant,
         #     foods__is_recommended=True
         # ).prefetch_related('foods').distinct()
-        qs = Food.objects.filter(
-            restaurant_id=restaurant, is_recommended=True).select_related('category')
-        # qs = qs.filter(is_top = True)
-        serializer = FoodsByCategorySerializer(instance=qs, many=True)
-        return ResponseWrapper(data=serializer.data, msg='success')
+        def recommended_foods_by_category_data():
+            qs = Food.objects.filter(
+                restaurant_id=restaurant, is_recommended=True)
+            # qs = qs.filter(is_top = True)
+            # serializer = FoodsByCategorySerializer(instance=qs, many=True)
+            return foods_by_category(qs)
+
+        return menu_response(request, int(restaurant), 'recommended_foods_by_category',
+                             recommended_foods_by_category_data)
 
     # @method_decorator(cache_page(60*15))
     def list_by_category(self, request, restaurant, *args, **kwargs):
         # qs = FoodCategory.objects.filter(
         #     foods__restaurant_id=restaurant,
         # ).prefetch_related('foods', 'foods__food_options').distinct()
-        qs = Food.objects.filter(
-            restaurant_id=restaurant).select_related('category')
+        def list_by_category_data():
+            qs = Food.objects.filter(restaurant_id=restaurant)
 
-        serializer = FoodsByCategorySerializer(instance=qs, many=True)
-        return ResponseWrapper(data=serializer.data, msg='success')
+            # serializer = FoodsByCategorySerializer(instance=qs, many=True)
+            return foods_by_category(qs)
+
+        return menu_response(request, int(restaurant), 'list_by_category', list_by_category_data)
 
     # @swagger_auto_schema(request_body=TopRecommendedFoodListSerializer)
     def mark_as_top_or_recommended(self, request, *args, **kwargs):
@@ -2263,7 +2366,10 @@ class FoodByRestaurantViewSet(LoggingMixin, CustomViewSet):
         else:
             temp_dict = request.data.pop('food_id')
             qs = Food.objects.filter(pk__in=request.data.get('food_id'))
+            restaurant_id_list = set(qs.values_list('restaurant_id', flat=True))
             qs.update(**temp_dict)
+            for restaurant_id in restaurant_id_list:
+                next_menu_version(restaurant_id)
             return ResponseWrapper(msg='updated', status=200)
 
 
@@ -2772,7 +2878,7 @@ class ReportingViewset(LoggingMixin, viewsets.ViewSet):
                                      }, msg="success")
 
 
-class InvoiceViewSet(LoggingMixin, CustomViewSet):
+class InvoiceViewSet(FastRendererMixin, LoggingMixin, CustomViewSet):
     serializer_class = InvoiceSerializer
     # pagination_class = CustomLimitPagination
 
@@ -2793,6 +2899,9 @@ class InvoiceViewSet(LoggingMixin, CustomViewSet):
     lookup_field = 'pk'
     logging_methods = ['GET', 'POST', 'PATCH', 'DELETE']
     pagination_class = property(get_pagination_class)
+    # invoice lists embed the stored order info json text, see restaurant.libs.invoice_json
+    fast_renderer_actions = ['invoice_history',
+                             'paid_cancel_invoice_history', 'invoice', 'invoice_all_report']
 
     # @swagger_auto_schema(
     #     request_body=ReportByDateRangeSerializer
@@ -2896,11 +3005,11 @@ class InvoiceViewSet(LoggingMixin, CustomViewSet):
 
         total_amaount = sum(total_payable_amount)
 
-        page_qs = self.paginate_queryset(food_items_date_range_qs)
+        page_qs = self.paginate_queryset(invoice_rows(food_items_date_range_qs))
 
-        serializer = InvoiceSerializer(instance=page_qs, many=True)
-        paginated_data = self.get_paginated_response(serializer.data)
-        order_details = dict(self.get_paginated_response(serializer.data).data)
+        # serializer = InvoiceSerializer(instance=page_qs, many=True)
+        order_details = dict(self.get_paginated_response(
+            invoice_records(page_qs)).data)
 
         order_details['total_amaount'] = round(total_amaount, 2)
         order_details['total_order'] = total_order
@@ -3028,19 +3137,19 @@ class InvoiceViewSet(LoggingMixin, CustomViewSet):
     def invoice_history(self, request, restaurant, *args, **kwargs):
         invoice_qs = Invoice.objects.filter(
             restaurant_id=restaurant).order_by('-updated_at')
-        page_qs = self.paginate_queryset(invoice_qs)
+        page_qs = self.paginate_queryset(invoice_rows(invoice_qs))
 
-        serializer = InvoiceSerializer(instance=page_qs, many=True)
-        paginated_data = self.get_paginated_response(serializer.data)
+        # serializer = InvoiceSerializer(instance=page_qs, many=True)
+        paginated_data = self.get_paginated_response(invoice_records(page_qs))
 
         return ResponseWrapper(paginated_data.data)
 
     def paid_cancel_invoice_history(self, request, restaurant, *args, **kwargs):
         invoice_qs = Invoice.objects.filter(restaurant_id=restaurant, order__status__in=[
             '5_PAID', '6_CANCELLED']).order_by('-updated_at')
-        page_qs = self.paginate_queryset(invoice_qs)
-        serializer = InvoiceSerializer(instance=page_qs, many=True)
-        paginated_data = self.get_paginated_response(serializer.data)
+        page_qs = self.paginate_queryset(invoice_rows(invoice_qs))
+        # serializer = InvoiceSerializer(instance=page_qs, many=True)
+        paginated_data = self.get_paginated_response(invoice_records(page_qs))
 
         return ResponseWrapper(paginated_data.data)
 
@@ -3052,10 +3161,10 @@ class InvoiceViewSet(LoggingMixin, CustomViewSet):
     def invoice(self, request, invoice_id, *args, **kwargs):
         invoice_qs = Invoice.objects.filter(
             pk__icontains=invoice_id).order_by('-updated_at')
-        page_qs = self.paginate_queryset(invoice_qs)
+        page_qs = self.paginate_queryset(invoice_rows(invoice_qs))
 
-        serializer = InvoiceSerializer(instance=page_qs, many=True)
-        paginated_data = self.get_paginated_response(serializer.data)
+        # serializer = InvoiceSerializer(instance=page_qs, many=True)
+        paginated_data = self.get_paginated_response(invoice_records(page_qs))
 
         return ResponseWrapper(paginated_data.data)
 
@@ -3108,10 +3217,9 @@ class DiscountViewSet(LoggingMixin, CustomViewSet):
         return ResponseWrapper(paginated_data.data)
 
     def pop_up_list_by_restaurant(self, request, restaurant_id, *args, **kwargs):
-        today = timezone.datetime.now().date()
-        start_date = today - timedelta(days=1)
-        discount_qs = Discount.objects.filter(restaurant_id=restaurant_id, is_popup=True,
-                                              start_date__lte=today, end_date__gte=today).exclude(food=None, image=None)
+        discount_index = get_discount_index(restaurant_id)
+        discount_qs = Discount.objects.filter(
+            pk__in=discount_index['popup_discounts'])
         serializer = DiscountPopUpSerializer(instance=discount_qs, many=True)
         return ResponseWrapper(data=serializer.data, msg='success')
 
@@ -3158,6 +3266,8 @@ class DiscountViewSet(LoggingMixin, CustomViewSet):
         if food:
             food_qs = Food.objects.filter(pk=food)
             food_qs.update(discount=qs.id)
+            invalidate_price_list(qs.restaurant_id)
+            next_menu_version(qs.restaurant_id)
 
         serializer = self.get_serializer(instance=qs)
         return ResponseWrapper(data=serializer.data, msg='created')
@@ -3175,7 +3285,11 @@ class DiscountViewSet(LoggingMixin, CustomViewSet):
         if not discount_qs:
             return ResponseWrapper(error_msg=['Discount is invalid'], error_code=400)
 
+        restaurant_id_list = set(food_qs.values_list('restaurant_id', flat=True))
         updated = food_qs.update(discount_id=discount_qs)
+        for restaurant_id in restaurant_id_list:
+            invalidate_price_list(restaurant_id)
+            next_menu_version(restaurant_id)
         if not updated:
             return ResponseWrapper(error_msg=['Food Discount is not update'], error_code=400)
 
@@ -3240,7 +3354,13 @@ class DiscountViewSet(LoggingMixin, CustomViewSet):
         discount_amount_is_percentage = request.data.get('discount_amount_is_percentage')
         qs.discount_given = discount_given
         qs.discount_amount_is_percentage = discount_amount_is_percentage
-        qs.save
+        qs.save()
+        calculate_price(food_order_obj=qs)
+        order_done_signal.send(
+            sender=self.__class__.force_discount,
+            restaurant_id=qs.restaurant_id,
+            order_id=qs.pk,
+        )
         serializer = FoodOrderByTableSerializer(instance=qs)
         return ResponseWrapper(data=serializer.data, msg='success')
 
@@ -3365,11 +3485,9 @@ class SliderViewset(LoggingMixin, CustomViewSet):
         return [permission() for permission in permission_classes]
 
     def slider_list_by_restaurant(self, request, restaurant_id, *args, **kwargs):
-        today = timezone.datetime.now().date()
-        start_date = today - timedelta(days=1)
-        # end_date = today + timedelta(days=1)
-        slider_qs = Discount.objects.filter(restaurant=restaurant_id, is_slider=True,
-                                            start_date__lte=start_date, end_date__gte=today).exclude(food=None, image=None)
+        discount_index = get_discount_index(restaurant_id)
+        slider_qs = Discount.objects.filter(
+            pk__in=discount_index['slider_discounts'])
         serializer = DiscountSliderSerializer(instance=slider_qs, many=True)
         return ResponseWrapper(data=serializer.data)
 
@@ -3426,21 +3544,20 @@ class ReviewViewset(LoggingMixin, CustomViewSet):
         serializer_class = self.get_serializer_class()
         serializer = serializer_class(data=request.data)
         if serializer.is_valid():
-            qs = serializer.save()
-            food_list_qs = Food.objects.filter(
-                food_options__ordered_items__food_order_id=qs.order.pk)
-            for index, food_qs in enumerate(food_list_qs):
-                food_rating = food_qs.rating
-                if food_rating == None:
-                    food_rating = 0
-                new_rating = ((food_rating * food_qs.order_counter) +
-                              qs.rating)/(1+food_qs.order_counter)
-                # food_qs.rating = new_rating
-                # food_qs.save()
-                food_list_qs[index].rating = new_rating
-                food_list_qs[index].order_counter = (1+food_qs.order_counter)
-
-            Food.objects.bulk_update(food_list_qs, ['rating', 'order_counter'])
+            # restaurant and food ratings are added by restaurant.libs.review_rating on save
+            with transaction.atomic():
+                qs = serializer.save()
+            # food_list_qs = Food.objects.filter(
+            #     food_options__ordered_items__food_order_id=qs.order.pk)
+            # for index, food_qs in enumerate(food_list_qs):
+            #     food_rating = food_qs.rating
+            #     if food_rating == None:
+            #         food_rating = 0
+            #     new_rating = ((food_rating * food_qs.order_counter) +
+            #                   qs.rating)/(1+food_qs.order_counter)
+            #     food_list_qs[index].rating = new_rating
+            #     food_list_qs[index].order_counter = (1+food_qs.order_counter)
+            # Food.objects.bulk_update(food_list_qs, ['rating', 'order_counter'])
             serializer = self.serializer_class(instance=qs)
             return ResponseWrapper(data=serializer.data, msg='created')
         else:
@@ -3652,8 +3769,8 @@ class TakeAwayOrderViewSet(LoggingMixin, CustomViewSet):
         qs = TakeAwayOrder.objects.filter(restaurant_id=restaurant_id).first()
         if not qs:
             return ResponseWrapper(msg='No Take Away Order is Available')
-        serializer = FoodOrderByTableSerializer(instance=qs.running_order.exclude(
-            status__in=['5_PAID', '6_CANCELLED']), many=True)
+        serializer = FoodOrderByTableSerializer(instance=prefetch_order_details(qs.running_order.exclude(
+            status__in=['5_PAID', '6_CANCELLED'])), many=True)
         return ResponseWrapper(data=serializer.data, msg='success')
 
 
@@ -1,76 +1,228 @@
 import decimal
 from restaurant.models import *
 import restaurant
+from django.core.cache import cache
+from django.db.models import F
 from django.utils import timezone
+from restaurant.libs.discount_index import get_discount_index
+from restaurant.libs.menu_snapshot import get_menu_version
+from restaurant.libs.price_list import get_price_list
 from datetime import date, datetime, timedelta
 
 
-def calculate_price(food_order_obj, include_initial_order=False, **kwargs):
-    if include_initial_order:
-        ordered_items_qs = food_order_obj.ordered_items.exclude(
-            status__in=["4_CANCELLED"])
-    else:
-        ordered_items_qs = food_order_obj.ordered_items.exclude(
-            status__in=["4_CANCELLED", "0_ORDER_INITIALIZED"])
+# FoodOrder columns which mirror the computed price, used for dirty checking
+STORED_PRICE_FIELDS = [
+    'grand_total_price', 'total_price', 'discount_amount', 'tax_amount',
+    'tax_percentage', 'service_charge', 'payable_amount',
+]
+# discount window and menu version the stored line sums of an order were priced with
+PRICE_BASIS_CACHE_KEY = 'price_basis_{food_order_id}'
+PRICE_BASIS_TIMEOUT = 60 * 60 * 24
+
+
+class PriceBreakdown:
+    """
+    Result of pricing a food order. Holds the raw (unrounded) amounts,
+    `to_dict()` returns the rounded dict served by the api.
+    """
+
+    def __init__(self, grand_total_price=0.0, discount_amount=0.0, payable_amount=0.0,
+                 tax_amount=0.0, tax_percentage=0.0, service_charge=0.0,
+                 service_charge_is_percentage=False, service_charge_base_amount=0.0,
+                 total_price=0.0, cash_received=0, change_amount=0,
+                 items_subtotal=None, items_discount=None):
+        self.grand_total_price = grand_total_price
+        self.discount_amount = discount_amount
+        self.payable_amount = payable_amount
+        self.tax_amount = tax_amount
+        self.tax_percentage = tax_percentage
+        self.service_charge = service_charge
+        self.service_charge_is_percentage = service_charge_is_percentage
+        self.service_charge_base_amount = service_charge_base_amount
+        self.total_price = total_price
+        self.cash_received = cash_received
+        self.change_amount = change_amount
+        # line sums the totals are derived from, None when not comparable
+        # with the stored ones (priced with initial items)
+        self.items_subtotal = items_subtotal
+        self.items_discount = items_discount
+
+    def to_dict(self):
+        return {
+            "grand_total_price": round(self.grand_total_price, 2),
+            'discount_amount': round(self.discount_amount, 2),
+            'payable_amount': round(self.payable_amount, 2),
+            "tax_amount": round(self.tax_amount, 2),
+            'tax_percentage': round(self.tax_percentage, 2),
+            "service_charge": round(self.service_charge, 2),
+            "service_charge_is_percentage": self.service_charge_is_percentage,
+            "service_charge_base_amount": self.service_charge_base_amount,
+            'total_price': round(self.total_price, 2),
+            'cash_received': self.cash_received,
+            'change_amount': round(self.change_amount, 2),
+        }
+
+
+def _load_promotions(promo_code_restaurant_list):
+    """
+    returns {(promo_code, restaurant_id): promotion} for running promotions,
+    parent company promotions take priority over restaurant promo codes
+    """
+    promotion_dict = {}
+    if not promo_code_restaurant_list:
+        return promotion_dict
+
+    code_list = set(code for code, restaurant_id in promo_code_restaurant_list)
+    restaurant_id_list = set(
+        restaurant_id for code, restaurant_id in promo_code_restaurant_list)
+    now = timezone.now()
+
+    promo_code_promotion_qs = PromoCodePromotion.objects.filter(
+        code__in=code_list, restaurant_id__in=restaurant_id_list,
+        start_date__lte=now, end_date__gte=now).order_by('pk')
+    for promotion in promo_code_promotion_qs:
+        promotion_dict.setdefault(
+            (promotion.code, promotion.restaurant_id), promotion)
+
+    parent_promotion_restaurant_qs = ParentCompanyPromotion.restaurant.through.objects.filter(
+        parentcompanypromotion__code__in=code_list, restaurant_id__in=restaurant_id_list,
+        parentcompanypromotion__start_date__lte=now, parentcompanypromotion__end_date__gte=now
+    ).select_related('parentcompanypromotion').order_by('parentcompanypromotion_id')
+    for parent_promotion_restaurant in parent_promotion_restaurant_qs:
+        promotion = parent_promotion_restaurant.parentcompanypromotion
+        promotion_dict[(promotion.code, parent_promotion_restaurant.restaurant_id)] = promotion
+
+    return promotion_dict
+
+
+def compute_prices(food_orders, include_initial_order=False):
+    """
+    Price many food orders at once without writing to the database.
+    Items, options, foods, extras and promotions are loaded in a fixed number
+    of queries regardless of the number of orders, active discounts come from
+    the cached per restaurant discount index.
+    Returns {food_order_id: PriceBreakdown}.
+    """
+    if isinstance(food_orders, models.Manager):
+        food_orders = food_orders.all()
+    if isinstance(food_orders, models.QuerySet):
+        food_orders = food_orders.select_related('restaurant')
+    food_order_list = [
+        food_order for food_order in food_orders if food_order.pk]
+    if not food_order_list:
+        return {}
+
+    # restaurants which are not loaded with the orders yet
+    restaurant_field = FoodOrder._meta.get_field('restaurant')
+    missing_restaurant_id_list = set(
+        food_order.restaurant_id for food_order in food_order_list
+        if food_order.restaurant_id and not restaurant_field.is_cached(food_order))
+    if missing_restaurant_id_list:
+        restaurant_dict = Restaurant.objects.in_bulk(missing_restaurant_id_list)
+        for food_order in food_order_list:
+            if food_order.restaurant_id in restaurant_dict:
+                food_order.restaurant = restaurant_dict[food_order.restaurant_id]
+
+    excluded_status_list = ["4_CANCELLED"]
+    if not include_initial_order:
+        excluded_status_list.append("0_ORDER_INITIALIZED")
+    ordered_items_qs = OrderedItem.objects.filter(
+        food_order_id__in=[food_order.pk for food_order in food_order_list]
+    ).exclude(status__in=excluded_status_list).select_related(
+        'food_option__food__restaurant').prefetch_related('food_extra').order_by('pk')
+
+    ordered_items_dict = {}
+    discount_id_list = set()
+    for ordered_item in ordered_items_qs:
+        ordered_items_dict.setdefault(
+            ordered_item.food_order_id, []).append(ordered_item)
+        if ordered_item.food_option.food.discount_id:
+            discount_id_list.add(ordered_item.food_option.food.discount_id)
+
+    price_discounts_dict = {}
+    if discount_id_list:
+        for restaurant_id in set(food_order.restaurant_id for food_order in food_order_list):
+            if restaurant_id:
+                price_discounts_dict[restaurant_id] = get_discount_index(restaurant_id)[
+                    'price_discounts']
+
+    promotion_dict = _load_promotions(set(
+        (food_order.applied_promo_code, food_order.restaurant_id)
+        for food_order in food_order_list if food_order.applied_promo_code
+    ))
+
+    price_dict = {}
+    for food_order in food_order_list:
+        parent_promo_qs = None
+        if food_order.applied_promo_code:
+            parent_promo_qs = promotion_dict.get(
+                (food_order.applied_promo_code, food_order.restaurant_id))
+
+        restaurant_qs = food_order.restaurant
+        price_discounts = price_discounts_dict.get(food_order.restaurant_id, {})
+        items_subtotal = 0.0
+        items_discount = 0.0
+        for ordered_item in ordered_items_dict.get(food_order.pk, []):
+            if not restaurant_qs:
+                restaurant_qs = ordered_item.food_option.food.restaurant
+            line_price, line_discount = _ordered_item_totals(
+                ordered_item, price_discounts)
+            items_subtotal += line_price
+            items_discount += line_discount
+
+        price = _price_food_order(
+            food_order, restaurant_qs, items_subtotal, items_discount, parent_promo_qs)
+        if include_initial_order:
+            price.items_subtotal = None
+            price.items_discount = None
+        price_dict[food_order.pk] = price
+    return price_dict
+
+
+def compute_price(food_order_obj, include_initial_order=False, **kwargs):
+    """
+    Price a food order without writing anything to the database.
+    Use `persist_price()` (or `calculate_price()`) to store the result.
+    """
+    return compute_prices(
+        [food_order_obj], include_initial_order=include_initial_order)[food_order_obj.pk]
+
+
+def _ordered_item_totals(ordered_item, price_discounts):
+    """
+    (price with extras, food discount) of a single ordered item,
+    `price_discounts` is the {discount_id: amount} of the order's restaurant
+    """
+    item_price = ordered_item.quantity*ordered_item.food_option.price
+    extra_price = ordered_item.quantity * sum(
+        food_extra.price for food_extra in ordered_item.food_extra.all()
+    )
 
-    restaurant_qs = food_order_obj.restaurant
-    promo_code = food_order_obj.applied_promo_code  # kwargs.get('promo_code')
-    cash_received = food_order_obj.cash_received
-    discount_given= food_order_obj.discount_given
-    if promo_code:
-        parent_promo_code_promotion_qs = ParentCompanyPromotion.objects.filter(
-            code=promo_code,  restaurant=restaurant_qs, start_date__lte=timezone.now(), end_date__gte=timezone.now()).first()
-        if parent_promo_code_promotion_qs:
-            parent_promo_qs = parent_promo_code_promotion_qs
-        else:
-            promo_code_promotion_qs = PromoCodePromotion.objects.filter(
-                code=promo_code, restaurant=restaurant_qs, start_date__lte=timezone.now(),
-                end_date__gte=timezone.now()).first()
-            parent_promo_qs = promo_code_promotion_qs
+    discount_amount = 0.0
+    discount_id = ordered_item.food_option.food.discount_id
+    if discount_id:
+        discount_percentage = price_discounts.get(discount_id)
+        if discount_percentage is not None:
+            discount_amount = (discount_percentage/100)*item_price
 
+    return item_price+extra_price, discount_amount
 
-    else:
-        parent_promo_qs = None
-    # if food_order_obj.table:
-    #     restaurant_qs = food_order_obj.table.restaurant
 
-    total_price = 0.0
+def _price_food_order(food_order_obj, restaurant_qs, items_subtotal, items_discount, parent_promo_qs):
+    cash_received = food_order_obj.cash_received
+    discount_given= food_order_obj.discount_given
+
+    total_price = items_subtotal
     tax_amount = 0.0
     grand_total_price = 0.0
     service_charge = 0.0
     hundred = 100.0
-    discount_amount = 0.0
-
-    for ordered_item in ordered_items_qs:
-
-        if not restaurant_qs:
-            restaurant_qs = ordered_item.food_option.food.restaurant
-        item_price = ordered_item.quantity*ordered_item.food_option.price
-        extra_price = ordered_item.quantity * sum(
-            list(
-                ordered_item.food_extra.values_list('price', flat=True)
-            )
-        )
-
-        today = timezone.datetime.now().date()
-        start_date = today + timedelta(days=1)
+    discount_amount = items_discount
 
-        current_time = timezone.now()
-
-        discount_id = ordered_item.food_option.food.discount
-        if discount_id:
-            date_wise_discount_qs = Discount.objects.filter(pk = discount_id.id, restaurant=food_order_obj.restaurant_id,
-                                                  start_date__lte=start_date,end_date__gte=today,discount_schedule_type='Date_wise').exclude(food=None, image=None)
-            time_wise_discount_qs = Discount.objects.filter(pk = discount_id.id, restaurant_id = food_order_obj.restaurant_id,discount_slot_closing_time__gte = current_time,
-                                                            discount_slot_start_time__lte =current_time, discount_schedule_type='Time_wise').exclude(food=None, image=None)
-            if date_wise_discount_qs or time_wise_discount_qs:
-                discount_amount += (ordered_item.food_option.food.discount.amount/100)*item_price
-
-        total_price += item_price+extra_price
     grand_total_price += total_price
 
-    if food_order_obj.restaurant.is_vat_charge_apply_in_original_food_price \
-            and food_order_obj.restaurant.is_service_charge_apply_in_original_food_price:
+    if restaurant_qs.is_vat_charge_apply_in_original_food_price \
+            and restaurant_qs.is_service_charge_apply_in_original_food_price:
 
         if restaurant_qs.service_charge_is_percentage:
             service_charge = (restaurant_qs.service_charge*total_price / hundred)
@@ -159,50 +311,152 @@ def calculate_price(food_order_obj, include_initial_order=False, **kwargs):
         change_amount = 0.0
         if cash_received>payable_amount:
             change_amount = cash_received - payable_amount
-        food_order_obj.change_amount = change_amount
-        food_order_obj.save()
-
-
-
-    response_dict = {
-        "grand_total_price": round(grand_total_price, 2),
-        'discount_amount': round(discount_amount, 2),
-        'payable_amount': round(payable_amount, 2),
-        "tax_amount": round(tax_amount, 2),
-        'tax_percentage': round(restaurant_qs.tax_percentage, 2),
-        "service_charge": round(service_charge, 2),
-        "service_charge_is_percentage": restaurant_qs.service_charge_is_percentage,
-        "service_charge_base_amount": restaurant_qs.service_charge,
-        'total_price': round(total_price, 2),
-        'cash_received':cash_received,
-        'change_amount':round(change_amount,2),
-    }
-    food_order_obj.grand_total_price = response_dict.get('grand_total_price')
-    food_order_obj.total_price = response_dict.get('total_price')
-    food_order_obj.discount_amount = response_dict.get('discount_amount')
-    food_order_obj.tax_amount = response_dict.get('tax_amount')
-    food_order_obj.tax_percentage = response_dict.get('tax_percentage')
-    food_order_obj.service_charge = response_dict.get('service_charge')
-    food_order_obj.payable_amount = response_dict.get('payable_amount')
-    food_order_obj.save()
 
-    return response_dict
+    return PriceBreakdown(
+        grand_total_price=grand_total_price,
+        discount_amount=discount_amount,
+        payable_amount=payable_amount,
+        tax_amount=tax_amount,
+        tax_percentage=restaurant_qs.tax_percentage,
+        service_charge=service_charge,
+        service_charge_is_percentage=restaurant_qs.service_charge_is_percentage,
+        service_charge_base_amount=restaurant_qs.service_charge,
+        total_price=total_price,
+        cash_received=cash_received,
+        change_amount=change_amount,
+        items_subtotal=items_subtotal,
+        items_discount=items_discount,
+    )
+
+
+def persist_price(food_order_obj, price):
+    """
+    Store a `PriceBreakdown` on the food order. Only the changed columns are
+    written and nothing is written when the stored totals are already up to date.
+    Returns True when the order was saved.
+    """
+    price_dict = price.to_dict()
+    update_fields = []
+    for field_name in STORED_PRICE_FIELDS:
+        if getattr(food_order_obj, field_name) != price_dict.get(field_name):
+            setattr(food_order_obj, field_name, price_dict.get(field_name))
+            update_fields.append(field_name)
+
+    for field_name in ['items_subtotal', 'items_discount']:
+        value = getattr(price, field_name)
+        if value is not None and getattr(food_order_obj, field_name) != value:
+            setattr(food_order_obj, field_name, value)
+            update_fields.append(field_name)
+
+    # change amount is only tracked once cash has been received
+    if price.cash_received > 0 and food_order_obj.change_amount != price.change_amount:
+        food_order_obj.change_amount = price.change_amount
+        update_fields.append('change_amount')
+
+    if not update_fields:
+        return False
+    food_order_obj.save(update_fields=update_fields + ['updated_at'])
+    return True
+
 
+def get_price_basis(restaurant_id):
+    return (get_discount_index(restaurant_id)['expires_at'], get_menu_version(restaurant_id))
 
-def calculate_item_price_with_discount(ordered_item_qs):
+
+def calculate_price(food_order_obj, include_initial_order=False, **kwargs):
+    price_basis = None
+    if food_order_obj.restaurant_id:
+        price_basis = get_price_basis(food_order_obj.restaurant_id)
+    price = compute_price(
+        food_order_obj, include_initial_order=include_initial_order, **kwargs)
+    persist_price(food_order_obj, price)
+    if price_basis and price.items_subtotal is not None:
+        cache.set(PRICE_BASIS_CACHE_KEY.format(food_order_id=food_order_obj.pk),
+                  price_basis, PRICE_BASIS_TIMEOUT)
+    return price.to_dict()
+
+
+def calculate_item_price_with_discount(ordered_item_qs, price_list=None):
     total_price = 0.0
     discount_amount = 0.0
-    item_price = ordered_item_qs.quantity*ordered_item_qs.food_option.price
-    if ordered_item_qs.food_option.food.discount:
-        discount_amount = (
-            ordered_item_qs.food_option.food.discount.amount/100)*item_price
+    food_option_qs = ordered_item_qs.food_option
+    if price_list is None:
+        price_list = get_price_list(food_option_qs.food.restaurant_id)
+    option_price_dict = price_list['options'].get(food_option_qs.pk)
+    if option_price_dict:
+        item_price = ordered_item_qs.quantity*option_price_dict['price']
+        discount_amount = (option_price_dict['discount']/100)*item_price
+    else:
+        item_price = ordered_item_qs.quantity*food_option_qs.price
+        if food_option_qs.food.discount:
+            discount_amount = (
+                food_option_qs.food.discount.amount/100)*item_price
     total_price += item_price
     total_price = total_price-discount_amount
     extra_price = ordered_item_qs.quantity*sum(
-        list(
-            ordered_item_qs.food_extra.values_list('price', flat=True)
-        )
+        food_extra.price for food_extra in ordered_item_qs.food_extra.all()
     )
     total_price += extra_price
 
     return round(total_price, 2)
+
+
+def snapshot_ordered_items(food_order_obj, ordered_item_id_list):
+    """
+    {ordered_item_id: (price with extras, food discount)} of the given items
+    which count in the stored order totals (not cancelled nor initialized)
+    """
+    price_discounts = {}
+    if food_order_obj.restaurant_id:
+        price_discounts = get_discount_index(
+            food_order_obj.restaurant_id)['price_discounts']
+    ordered_items_qs = OrderedItem.objects.filter(
+        pk__in=ordered_item_id_list, food_order=food_order_obj
+    ).exclude(status__in=["4_CANCELLED", "0_ORDER_INITIALIZED"]).select_related(
+        'food_option__food').prefetch_related('food_extra')
+    return {
+        ordered_item.pk: _ordered_item_totals(ordered_item, price_discounts)
+        for ordered_item in ordered_items_qs
+    }
+
+
+def apply_ordered_items_change(food_order_obj, before_snapshot, after_snapshot):
+    """
+    Update the stored totals of an order by the difference between snapshots
+    (see `snapshot_ordered_items()`) of the changed lines taken before and
+    after the change, without going through the rest of the order.
+    Orders whose line sums were never stored, or were stored before the
+    discount window or the menu changed, get a full recompute.
+    """
+    if food_order_obj.items_subtotal is None or food_order_obj.items_discount is None \
+            or not food_order_obj.restaurant_id:
+        return calculate_price(food_order_obj)
+    # the snapshots price every line with the current discounts and menu,
+    # the other lines of the order keep the ones of the last full recompute
+    price_basis = cache.get(PRICE_BASIS_CACHE_KEY.format(food_order_id=food_order_obj.pk))
+    if price_basis != get_price_basis(food_order_obj.restaurant_id):
+        return calculate_price(food_order_obj)
+
+    subtotal_delta = sum(line[0] for line in after_snapshot.values()) - \
+        sum(line[0] for line in before_snapshot.values())
+    discount_delta = sum(line[1] for line in after_snapshot.values()) - \
+        sum(line[1] for line in before_snapshot.values())
+    if subtotal_delta or discount_delta:
+        FoodOrder.objects.filter(pk=food_order_obj.pk).update(
+            items_subtotal=F('items_subtotal') + subtotal_delta,
+            items_discount=F('items_discount') + discount_delta,
+        )
+        food_order_obj.refresh_from_db(
+            fields=['items_subtotal', 'items_discount'])
+
+    parent_promo_qs = None
+    if food_order_obj.applied_promo_code:
+        parent_promo_qs = _load_promotions(
+            {(food_order_obj.applied_promo_code, food_order_obj.restaurant_id)}
+        ).get((food_order_obj.applied_promo_code, food_order_obj.restaurant_id))
+
+    price = _price_food_order(
+        food_order_obj, food_order_obj.restaurant, food_order_obj.items_subtotal,
+        food_order_obj.items_discount, parent_promo_qs)
+    persist_price(food_order_obj, price)
+    return price.to_dict()
@@ -0,0 +1,44 @@
+import re
+import uuid
+
+import orjson
+from django.core.serializers.json import DjangoJSONEncoder
+
+django_json_encoder = DjangoJSONEncoder()
+
+# stands in for RawJSON values while encoding, the nonce keeps it apart from real strings
+RAW_JSON_MARKER = '\x00raw-json-%s:' % uuid.uuid4().hex
+RAW_JSON_MARKER_RE = re.compile(
+    r'"%s(\d+)"' % re.escape(orjson.dumps(RAW_JSON_MARKER).decode('utf-8')[1:-1]))
+
+
+class RawJSON:
+    """
+    already encoded JSON text, dumps() writes it into the output as it is,
+    e.g. a json column read as text without building python objects first
+    """
+    __slots__ = ['text']
+
+    def __init__(self, text):
+        self.text = text
+
+
+def dumps(data, encoder=django_json_encoder, option=None):
+    """
+    compact JSON text of serializer output, encoded with orjson,
+    decimals, lazy strings and the like fall back to encoder.default,
+    DjangoJSONEncoder unless given
+    """
+    raw_text_list = []
+
+    def default(value):
+        if isinstance(value, RawJSON):
+            raw_text_list.append(value.text)
+            return '%s%s' % (RAW_JSON_MARKER, len(raw_text_list) - 1)
+        return encoder.default(value)
+
+    text = orjson.dumps(data, default=default, option=option).decode('utf-8')
+    if raw_text_list:
+        text = RAW_JSON_MARKER_RE.sub(
+            lambda match: raw_text_list[int(match.group(1))], text)
+    return text
@@ -0,0 +1,141 @@
+from django.db.models import F
+
+# values() alias of the parent pk on the rows Many loads
+PARENT_ALIAS = 'projection_parent'
+
+
+class Field:
+    """
+    one column of the row, path as in values(), e.g. 'restaurant__name',
+    to_representation is applied to values other than None like serializer fields are
+    """
+
+    def __init__(self, path, to_representation=None):
+        self.path = path
+        self.to_representation = to_representation
+
+    def column_list(self):
+        return [self.path]
+
+    def value(self, row, related_dict):
+        value = row[self.path]
+        if value is None or self.to_representation is None:
+            return value
+        return self.to_representation(value)
+
+
+class Nested:
+    """
+    a to-one relation as a dict built from the same row, None when the column
+    at null_path is null the way a nested serializer gives None for a missing relation
+    """
+
+    def __init__(self, field_dict, null_path=None):
+        self.field_dict = {key: as_field(field)
+                           for key, field in field_dict.items()}
+        self.null_path = null_path
+
+    def column_list(self):
+        column_list = [self.null_path] if self.null_path else []
+        for field in self.field_dict.values():
+            column_list.extend(field.column_list())
+        return column_list
+
+    def value(self, row, related_dict):
+        if self.null_path and row[self.null_path] is None:
+            return None
+        return {key: field.value(row, related_dict) for key, field in self.field_dict.items()}
+
+
+class Many:
+    """
+    a to-many relation of the top level rows as a list, loaded for all rows with one
+    more query on the default manager of model, soft deleted rows are left out as
+    related managers do. field is a path for a flat list or a Projection field dict,
+    parent_path leads from model back to the rows, e.g. 'tables' for Table.staff_assigned
+    """
+
+    def __init__(self, model, field, parent_path, order_by=None):
+        self.model = model
+        self.field = field
+        self.parent_path = parent_path
+        self.order_by = order_by or model._meta.ordering or ['pk']
+        self.projection = None if isinstance(
+            field, str) else Projection(field)
+
+    def column_list(self):
+        return []
+
+    def load(self, pk_list):
+        related_dict = {}
+        if not pk_list:
+            return related_dict
+        qs = self.model._default_manager.filter(
+            **{'%s__in' % self.parent_path: pk_list}).order_by(*self.order_by)
+        if self.projection is None:
+            for parent_pk, value in qs.values_list(self.parent_path, self.field):
+                related_dict.setdefault(parent_pk, []).append(value)
+            return related_dict
+        for row, data in self.projection.load(qs, **{PARENT_ALIAS: F(self.parent_path)}):
+            related_dict.setdefault(row[PARENT_ALIAS], []).append(data)
+        return related_dict
+
+    def value(self, row, related_dict):
+        return related_dict[self].get(row['pk'], [])
+
+
+def as_field(field):
+    if isinstance(field, str):
+        return Field(field)
+    if isinstance(field, dict):
+        return Nested(field)
+    return field
+
+
+class Projection:
+    """
+    output shape declared as {key: field}, field being a values() path, Field, Nested
+    or Many, compiled into one values() query plus one per Many and a row to dict function,
+    no model instances or serializer fields are built per row
+
+        Projection({'order_id': 'id', 'restaurant_name': 'restaurant__name'}).rows(qs)
+    """
+
+    def __init__(self, field_dict):
+        self.field_dict = {key: as_field(field)
+                           for key, field in field_dict.items()}
+        column_list = ['pk']
+        for field in self.field_dict.values():
+            column_list.extend(field.column_list())
+        # each column selected once, in declaration order
+        self.column_list = list(dict.fromkeys(column_list))
+        self.many_list = [field for field in self.field_dict.values()
+                          if isinstance(field, Many)]
+
+    def load(self, qs, **expressions):
+        """
+        [(row, data)] of the queryset, the row keeps the selected columns and expressions
+        """
+        row_list = list(qs.values(*self.column_list, **expressions))
+        pk_list = [row['pk'] for row in row_list]
+        related_dict = {many: many.load(pk_list) for many in self.many_list}
+        return [
+            (row, {key: field.value(row, related_dict)
+                   for key, field in self.field_dict.items()})
+            for row in row_list
+        ]
+
+    def rows(self, qs):
+        return [data for row, data in self.load(qs)]
+
+
+def file_url(model, field_name):
+    """
+    to_representation of a file column, the storage url the way serializer
+    FileField / ImageField give it without a request in the context
+    """
+    storage = model._meta.get_field(field_name).storage
+
+    def to_representation(name):
+        return storage.url(name) if name else None
+    return to_representation
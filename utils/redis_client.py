@@ -0,0 +1,14 @@
+import redis
+from django.conf import settings
+
+_redis_client = None
+
+
+def get_redis():
+    """
+    client of settings.STATE_REDIS, one connection pool per process
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis(**settings.STATE_REDIS)
+    return _redis_client
@@ -0,0 +1,65 @@
+import json
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from utils.fast_json import RawJSON, dumps
+
+
+class RawJSONEncoder(JSONEncoder):
+    """
+    DRF JSONEncoder which also takes RawJSON, decoded first
+    """
+
+    def default(self, obj):
+        if isinstance(obj, RawJSON):
+            return json.loads(obj.text)
+        return super(RawJSONEncoder, self).default(obj)
+
+
+drf_json_encoder = RawJSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson through utils.fast_json.dumps, same output:
+    datetimes, dates and uuids are written by orjson the way the DRF encoder writes them,
+    decimals, lazy strings, querysets like values_list results and other iterables
+    go through the DRF encoder, RawJSON values are written into the output as they are.
+    indented output (browsable API, ?indent=) and data orjson can not encode,
+    e.g. integers past 64 bit, are left to JSONRenderer
+    """
+    encoder_class = RawJSONEncoder
+    # Z for UTC like the DRF encoder, dict keys other than strings like json.dumps
+    orjson_option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.ensure_ascii or not self.compact or self.get_indent(
+                accepted_media_type, renderer_context) is not None:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        try:
+            text = dumps(data, encoder=drf_json_encoder,
+                         option=self.orjson_option)
+        except orjson.JSONEncodeError:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        # same strict javascript subset as JSONRenderer
+        text = text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return text.encode()
+
+
+class FastRendererMixin:
+    """
+    renders the actions in fast_renderer_actions with FastJSONRenderer,
+    ['__all__'] for every action of the view
+    """
+    fast_renderer_actions = []
+
+    def get_renderers(self):
+        if '__all__' in self.fast_renderer_actions or getattr(self, 'action', None) in self.fast_renderer_actions:
+            return [FastJSONRenderer()]
+        return super(FastRendererMixin, self).get_renderers()